@@ -0,0 +1,158 @@
+"""
+Unified activity timeline: a user's orders (placed and received), service
+bookings (made and received), food orders and wallet transactions as one
+newest-first feed.
+
+Each source is a cursor sorted by (created_at, id) descending over the
+(<user field>, created_at, id) index, so no source is ever sorted in memory.
+The sources are k-way merged with a heap. Each one is read in small batches and
+refilled only when its head is taken, so a page costs about one short batch
+per source rather than a full history read of each.
+
+Pages are cursor-paginated. The cursor is the (created_at, kind, id) of the last
+item returned, which is the merge order, so a page resumes exactly where the
+previous one stopped even when items share a timestamp.
+"""
+import asyncio
+import base64
+import heapq
+import json
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Tuple
+
+from archive import archive_name
+
+# kind -> (collection, field holding the user's id)
+ACTIVITY_SOURCES = {
+    'order_placed': ('orders', 'buyer_id'),
+    'order_received': ('orders', 'seller_id'),
+    'booking_made': ('service_bookings', 'client_id'),
+    'booking_received': ('service_bookings', 'provider_id'),
+    'food_order': ('food_orders', 'customer_id'),
+    'transaction': ('transactions', 'user_id'),
+}
+MIN_BATCH = 4
+
+Position = Tuple[datetime, str, str]
+
+
+def encode_cursor(position: Position) -> str:
+    created_at, kind, item_id = position
+    raw = json.dumps([created_at.isoformat(), kind, item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Position:
+    """Raises ValueError for anything encode_cursor didn't produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, kind, item_id = json.loads(raw)
+        position = (datetime.fromisoformat(created_at), str(kind), str(item_id))
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if position[1] not in ACTIVITY_SOURCES:
+        raise ValueError('Invalid cursor')
+    return position
+
+
+class _Newest:
+    """Heap entry that orders newest-first on (created_at, kind, id)."""
+
+    __slots__ = ('position', 'doc', 'stream')
+
+    def __init__(self, doc: Dict, stream: '_SourceStream'):
+        self.position = stream.position(doc)
+        self.doc = doc
+        self.stream = stream
+
+    def __lt__(self, other: '_Newest') -> bool:
+        return self.position > other.position
+
+
+class _SourceStream:
+    """One sorted source, read lazily in batches."""
+
+    def __init__(self, collection, kind: str, query: Dict, batch: int, after: Optional[Position]):
+        self.kind = kind
+        self.batch = batch
+        self.after = after
+        # Items at the cursor's timestamp are only skipped for the cursor's own kind;
+        # the kind/id tie-break is finished in skip()
+        if after is not None:
+            created_at, after_kind = after[0], after[1]
+            query = {**query, 'created_at': {'$lte' if kind <= after_kind else '$lt': created_at}}
+        self._cursor = collection.find(query, {'_id': 0}).sort(
+            [('created_at', -1), ('id', -1)]
+        ).batch_size(batch)
+        self._buffer = deque()
+        self._exhausted = False
+
+    def skip(self, doc: Dict) -> bool:
+        return self.after is not None and self.position(doc) >= self.after
+
+    def position(self, doc: Dict) -> Position:
+        return doc['created_at'], self.kind, doc.get('id', '')
+
+    async def next(self) -> Optional[Dict]:
+        while True:
+            if not self._buffer:
+                if self._exhausted:
+                    return None
+                docs = await self._cursor.to_list(length=self.batch)
+                if len(docs) < self.batch:
+                    self._exhausted = True
+                self._buffer.extend(docs)
+                if not docs:
+                    return None
+            doc = self._buffer.popleft()
+            if not self.skip(doc):
+                return doc
+
+    async def close(self):
+        await self._cursor.close()
+
+
+async def activity_page(db, user_id: str, limit: int, cursor: Optional[str] = None,
+                        kinds: Optional[Sequence[str]] = None, include_archive: bool = False) -> Dict:
+    """One newest-first page of the user's activity, with the cursor for the next page."""
+    after = decode_cursor(cursor) if cursor else None
+    kinds = list(kinds or ACTIVITY_SOURCES)
+    unknown = [kind for kind in kinds if kind not in ACTIVITY_SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown activity type: {', '.join(unknown)}")
+
+    sources = []
+    for kind in kinds:
+        collection_name, field = ACTIVITY_SOURCES[kind]
+        sources.append((db[collection_name], kind, field))
+        if include_archive:
+            sources.append((db[archive_name(collection_name)], kind, field))
+    # Spread the page over the sources; a source that runs hot just refills
+    batch = min(limit + 1, max(MIN_BATCH, -(-limit // len(sources)) + 1))
+    streams = [_SourceStream(collection, kind, {field: user_id}, batch, after)
+               for collection, kind, field in sources]
+
+    try:
+        heads = await asyncio.gather(*(stream.next() for stream in streams))
+        heap = [_Newest(doc, stream) for stream, doc in zip(streams, heads) if doc is not None]
+        heapq.heapify(heap)
+
+        items = []
+        while heap and len(items) < limit:
+            entry = heap[0]
+            items.append({'kind': entry.stream.kind, 'id': entry.position[2],
+                          'created_at': entry.position[0], 'item': entry.doc})
+            doc = await entry.stream.next()
+            if doc is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, _Newest(doc, entry.stream))
+    finally:
+        await asyncio.gather(*(stream.close() for stream in streams))
+
+    next_cursor = None
+    if heap and items:
+        last = items[-1]
+        next_cursor = encode_cursor((last['created_at'], last['kind'], last['id']))
+    return {'items': items, 'next_cursor': next_cursor}
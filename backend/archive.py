@@ -0,0 +1,174 @@
+"""
+Hot/cold tiering: moves settled orders, bookings and old transactions out of
+the hot collections in batches, and reads history back across both tiers.
+
+Two sinks are supported:
+- "collection" (default): documents move to "<collection>_archive" with the same
+  shape, so history endpoints can fall through to them.
+- "segments": documents are written to gzip-compressed NDJSON segment files under
+  ARCHIVE_SEGMENT_DIR. These are cold storage only; history reads stop at the
+  hot tier.
+
+Each batch is copied before it is deleted and the copy is idempotent (upsert by
+_id / segment named after its first document), so a crash at any point is safe to resume.
+A checkpoint per collection records how far the current pass got.
+"""
+import asyncio
+import gzip
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bson import json_util
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_SINK = 'collection'
+SEGMENT_SINK = 'segments'
+
+# Which documents are settled and safe to move, per hot collection
+ARCHIVE_POLICIES = {
+    'orders': {'status': {'$in': ['delivered', 'cancelled']}},
+    'food_orders': {'status': {'$in': ['delivered', 'cancelled']}},
+    'service_bookings': {'status': {'$in': ['completed', 'cancelled']}},
+    'transactions': {'status': {'$in': ['completed', 'failed', 'cancelled']}},
+}
+
+
+def archive_name(collection_name: str) -> str:
+    return f"{collection_name}_archive"
+
+
+class ArchiveSettings:
+    def __init__(self):
+        self.enabled = os.environ.get('ARCHIVE_ENABLED', 'false').lower() == 'true'
+        self.sink = os.environ.get('ARCHIVE_SINK', COLLECTION_SINK)
+        self.min_age_days = int(os.environ.get('ARCHIVE_MIN_AGE_DAYS', '90'))
+        self.batch_size = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+        self.interval_seconds = int(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600'))
+        self.segment_dir = Path(os.environ.get('ARCHIVE_SEGMENT_DIR', 'archive'))
+
+
+class SegmentWriter:
+    """Writes one gzip NDJSON file per batch; the tmp-then-rename makes each segment all-or-nothing."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def write(self, collection_name: str, docs: List[Dict]) -> Path:
+        first = docs[0]
+        directory = self.root / collection_name / first['created_at'].strftime('%Y-%m')
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{first['created_at'].strftime('%Y%m%dT%H%M%S')}-{first['_id']}.ndjson.gz"
+        tmp_path = path.with_suffix('.tmp')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for doc in docs:
+                f.write(json_util.dumps(doc))
+                f.write('\n')
+        os.replace(tmp_path, path)
+        return path
+
+
+class Archiver:
+    """Background task moving settled documents older than `min_age_days` to the cold tier."""
+
+    def __init__(self, db, settings: Optional[ArchiveSettings] = None,
+                 policies: Optional[Dict[str, Dict]] = None):
+        self.db = db
+        self.settings = settings or ArchiveSettings()
+        self.policies = policies or ARCHIVE_POLICIES
+        self.checkpoints = db.archive_checkpoints
+        self.segments = SegmentWriter(self.settings.segment_dir)
+        self.moved: Dict[str, int] = {name: 0 for name in self.policies}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.warning(f"Archive pass failed, will retry next interval: {e}")
+            await asyncio.sleep(self.settings.interval_seconds)
+
+    async def run_once(self):
+        cutoff = datetime.utcnow() - timedelta(days=self.settings.min_age_days)
+        for collection_name in self.policies:
+            while await self.archive_batch(collection_name, cutoff):
+                # Yield between batches so archiving never monopolizes the loop
+                await asyncio.sleep(0)
+
+    async def archive_batch(self, collection_name: str, cutoff: datetime) -> bool:
+        """Move one batch. Returns False once the pass over this collection is complete."""
+        checkpoint = await self.checkpoints.find_one({'_id': collection_name}) or {}
+        query = {**self.policies[collection_name], 'created_at': {'$lt': cutoff}}
+        if checkpoint.get('created_at'):
+            # Resume after the last (created_at, _id) this pass handled
+            query['$or'] = [
+                {'created_at': {'$gt': checkpoint['created_at']}},
+                {'created_at': checkpoint['created_at'], '_id': {'$gt': checkpoint['last_id']}},
+            ]
+        docs = await self.db[collection_name].find(query).sort(
+            [('created_at', 1), ('_id', 1)]
+        ).limit(self.settings.batch_size).to_list(self.settings.batch_size)
+
+        if not docs:
+            # Pass complete; the next pass starts from the oldest document again
+            await self.checkpoints.delete_one({'_id': collection_name})
+            return False
+
+        if self.settings.sink == SEGMENT_SINK:
+            await asyncio.to_thread(self.segments.write, collection_name, docs)
+        else:
+            await self.db[archive_name(collection_name)].bulk_write(
+                [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in docs], ordered=False
+            )
+        await self.db[collection_name].delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+        last = docs[-1]
+        await self.checkpoints.update_one(
+            {'_id': collection_name},
+            {'$set': {'created_at': last['created_at'], 'last_id': last['_id'], 'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
+        self.moved[collection_name] += len(docs)
+        logger.info(f"Archived {len(docs)} {collection_name} documents")
+        return True
+
+
+async def find_history(db, collection_name: str, query: Dict, skip: int, limit: int,
+                       include_archive: bool, projection: Optional[Dict] = None) -> List[Dict]:
+    """
+    Newest-first history page over the hot collection, falling through to the
+    archive only when the page runs past the end of the hot tier.
+    """
+    projection = projection or {'_id': 0}
+    docs = await db[collection_name].find(query, projection).sort('created_at', -1).skip(skip).limit(limit).to_list(limit)
+    if len(docs) == limit or not include_archive:
+        return docs
+
+    # The page reached the end of the hot tier: work out where the archive picks up
+    hot_total = skip + len(docs) if docs else await db[collection_name].count_documents(query)
+    archive_skip = max(0, skip - hot_total)
+    remaining = limit - len(docs)
+    docs += await db[archive_name(collection_name)].find(query, projection).sort(
+        'created_at', -1
+    ).skip(archive_skip).limit(remaining).to_list(remaining)
+    return docs
@@ -0,0 +1,157 @@
+"""
+Provider calendars: availability rules, structured booking slots, conflict-free
+reservations and free-slot computation for service bookings.
+
+Times are wall-clock datetimes in the platform's local timezone, matching the
+scheduled_date/scheduled_time strings clients already send. Aware datetimes
+are converted to that timezone with to_local() before they are stored.
+"""
+import re
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+# Reservations are claimed in grains of this many minutes; a unique index on
+# (provider_id, grain_start) makes two overlapping claims impossible.
+SLOT_GRANULARITY_MINUTES = 15
+DEFAULT_DURATION_MINUTES = 60
+MAX_AVAILABILITY_RANGE_DAYS = 31
+
+# Booking states that hold a provider's time
+ACTIVE_BOOKING_STATUSES = ['pending', 'confirmed', 'in_progress']
+
+_TIME_PATTERN = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?\s*$', re.IGNORECASE)
+_DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(h|hr|hrs|hour|hours|m|min|mins|minute|minutes)\b', re.IGNORECASE)
+
+
+def parse_time_of_day(value: str) -> Optional[time]:
+    """Parse "14:30", "2:30 PM" or "2pm". Returns None if unparseable."""
+    match = _TIME_PATTERN.match(value or '')
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower().startswith('p') else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+def to_local(value: datetime, timezone: tzinfo) -> datetime:
+    """Naive wall-clock time in `timezone`; naive values are taken to be local already."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone).replace(tzinfo=None)
+
+
+def local_now(timezone: tzinfo) -> datetime:
+    return datetime.now(timezone).replace(tzinfo=None)
+
+
+def parse_duration_minutes(value: Optional[str]) -> Optional[int]:
+    """Parse free-text durations like "2 hours", "90 mins" or "1h 30m"."""
+    if not value:
+        return None
+    total = 0.0
+    for amount, unit in _DURATION_PATTERN.findall(value):
+        total += float(amount) * (60 if unit.lower().startswith('h') else 1)
+    return int(total) or None
+
+
+def slot_grains(start_at: datetime, end_at: datetime) -> List[datetime]:
+    """Grain starts covering [start_at, end_at), aligned so overlapping intervals share grains."""
+    grains = []
+    current = start_at.replace(
+        minute=start_at.minute - start_at.minute % SLOT_GRANULARITY_MINUTES, second=0, microsecond=0
+    )
+    while current < end_at:
+        grains.append(current)
+        current += timedelta(minutes=SLOT_GRANULARITY_MINUTES)
+    return grains
+
+
+def within_rules(rules: List[Dict], start_at: datetime, end_at: datetime) -> bool:
+    """True if the slot fits inside one rule window on its weekday (or there are no rules)."""
+    if not rules:
+        return True
+    for rule in rules:
+        if rule['weekday'] != start_at.weekday():
+            continue
+        window_start = datetime.combine(start_at.date(), parse_time_of_day(rule['start_time']))
+        window_end = datetime.combine(start_at.date(), parse_time_of_day(rule['end_time']))
+        if window_start <= start_at and end_at <= window_end:
+            return True
+    return False
+
+
+def free_slots(rules: List[Dict], busy: Iterable[Tuple[datetime, datetime]], from_date: date,
+               to_date: date, duration_minutes: int, not_before: Optional[datetime] = None) -> List[Dict]:
+    """
+    Walk each day's rule windows in steps of `duration_minutes` and keep the
+    candidates that don't overlap a busy interval. `busy` must be sorted by
+    start; a single pointer sweeps it, so the cost is linear in slots + bookings.
+    """
+    busy = list(busy)
+    step = timedelta(minutes=duration_minutes)
+    slots = []
+    pointer = 0
+    last_candidate = None
+    day = from_date
+    while day <= to_date:
+        windows = sorted(
+            (parse_time_of_day(rule['start_time']), parse_time_of_day(rule['end_time']))
+            for rule in rules if rule['weekday'] == day.weekday()
+        )
+        for window_start, window_end in windows:
+            candidate = datetime.combine(day, window_start)
+            limit = datetime.combine(day, window_end)
+            if last_candidate is not None and candidate < last_candidate:
+                pointer = 0  # overlapping rule windows: the sweep can't assume monotonic candidates
+            while candidate + step <= limit:
+                candidate_end = candidate + step
+                # Skip bookings that end before this candidate starts
+                while pointer < len(busy) and busy[pointer][1] <= candidate:
+                    pointer += 1
+                overlaps = False
+                index = pointer
+                while index < len(busy) and busy[index][0] < candidate_end:
+                    if busy[index][1] > candidate:
+                        overlaps = True
+                        break
+                    index += 1
+                if not overlaps and (not_before is None or candidate >= not_before):
+                    slots.append({'start_at': candidate, 'end_at': candidate_end})
+                last_candidate = candidate
+                candidate = candidate_end
+        day += timedelta(days=1)
+    return slots
+
+
+class SlotReservations:
+    """Atomically claims a provider's time grains for a booking, or fails if any is taken."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def reserve(self, provider_id: str, booking_id: str, start_at: datetime, end_at: datetime,
+                      session=None) -> bool:
+        claims = [
+            {'provider_id': provider_id, 'grain_start': grain, 'booking_id': booking_id}
+            for grain in slot_grains(start_at, end_at)
+        ]
+        try:
+            await self.collection.insert_many(claims, ordered=True, session=session)
+            return True
+        except BulkWriteError:
+            # Another booking holds part of this interval; undo our partial claim
+            await self.release(booking_id, session=session)
+            return False
+
+    async def release(self, booking_id: str, session=None):
+        await self.collection.delete_many({'booking_id': booking_id}, session=session)
+
+    async def release_many(self, booking_ids: List[str], session=None):
+        await self.collection.delete_many({'booking_id': {'$in': booking_ids}}, session=session)
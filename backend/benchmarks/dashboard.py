@@ -0,0 +1,69 @@
+"""
+Compares the home and wallet screens' old multi-call flows against the
+aggregated /api/dashboard and /api/wallet/overview endpoints.
+
+For each flow it reports HTTP requests, response bytes, wall time and MongoDB
+round trips (the delta of serverStatus opcounters, so run it against an
+otherwise idle local mongod).
+
+Usage (from backend/, with the API running and MONGO_URL set):
+    python benchmarks/dashboard.py --email you@example.com --password secret
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+from pymongo import MongoClient
+
+FLOWS = {
+    'home (before)': ['/products?limit=1', '/orders', '/services?limit=1'],
+    'home (after)': ['/dashboard'],
+    'wallet (before)': ['/wallet/balance', '/wallet/discount-info', '/wallet/transactions'],
+    'wallet (after)': ['/wallet/overview'],
+}
+
+
+def mongo_ops(mongo: MongoClient) -> int:
+    counters = mongo.admin.command('serverStatus')['opcounters']
+    return sum(counters[op] for op in ('query', 'getmore', 'command', 'insert', 'update', 'delete'))
+
+
+async def run_flow(http: httpx.AsyncClient, paths):
+    responses = await asyncio.gather(*(http.get(path) for path in paths))
+    for response in responses:
+        response.raise_for_status()
+    return sum(len(response.content) for response in responses)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:8001/api')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    mongo = MongoClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as http:
+        login = await http.post('/auth/login', json={'email': args.email, 'password': args.password})
+        login.raise_for_status()
+        http.headers['Authorization'] = f"Bearer {login.json()['access_token']}"
+
+        print(f"{'flow':<18}{'requests':>10}{'bytes':>10}{'db ops':>10}{'ms':>10}")
+        for name, paths in FLOWS.items():
+            await run_flow(http, paths)  # warm caches and connections
+            # The serverStatus call itself counts as one command per sample
+            ops_before = mongo_ops(mongo)
+            started = time.perf_counter()
+            for _ in range(args.runs):
+                size = await run_flow(http, paths)
+            elapsed_ms = (time.perf_counter() - started) * 1000 / args.runs
+            ops = (mongo_ops(mongo) - ops_before - 1) / args.runs
+            print(f"{name:<18}{len(paths):>10}{size:>10}{ops:>10.1f}{elapsed_ms:>10.1f}")
+    mongo.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+"""
+Fault-injection harness for request deadlines and the database circuit breaker.
+
+Runs a TCP proxy in front of a local mongod that injects latency, dropped
+connections or a full outage in timed phases, while driving load at the API and
+reporting status codes and latency percentiles per phase. With deadlines and
+the breaker working, degraded phases should show fast 503/504s bounded by the
+route deadline rather than latencies growing with the queue.
+
+Usage (from backend/):
+    # 1. Start the proxy + load run (defaults: proxy on 27018 -> mongod on 27017)
+    python benchmarks/fault_injection.py --path /products \\
+        --phases "healthy:15,latency=2500:15,errors=0.5:15,down:15,healthy:15"
+    # 2. In another shell, start the API through the proxy before phase one ends
+    MONGO_URL="mongodb://localhost:27018/?directConnection=true" uvicorn server:app --port 8001
+
+Phases are "<fault>:<seconds>" where fault is healthy, latency=<ms>,
+errors=<probability of dropping each request> or down.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import httpx
+
+
+class Fault:
+    def __init__(self, spec: str):
+        self.name = spec
+        self.latency_ms = 0.0
+        self.error_rate = 0.0
+        self.down = False
+        kind, _, value = spec.partition('=')
+        if kind == 'latency':
+            self.latency_ms = float(value)
+        elif kind == 'errors':
+            self.error_rate = float(value)
+        elif kind == 'down':
+            self.down = True
+        elif kind != 'healthy':
+            raise ValueError(f"Unknown fault: {spec}")
+
+
+def parse_phases(raw: str) -> List[Tuple[Fault, float]]:
+    phases = []
+    for entry in raw.split(','):
+        spec, _, seconds = entry.strip().rpartition(':')
+        phases.append((Fault(spec), float(seconds)))
+    return phases
+
+
+class FaultyProxy:
+    """Byte-level relay; the current fault applies to each client->server chunk (one or more wire messages)."""
+
+    def __init__(self, upstream_host: str, upstream_port: int):
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.fault = Fault('healthy')
+        self._writers = set()
+
+    def drop_all(self):
+        for writer in list(self._writers):
+            writer.close()
+
+    async def handle(self, client_reader, client_writer):
+        if self.fault.down:
+            client_writer.close()
+            return
+        try:
+            server_reader, server_writer = await asyncio.open_connection(self.upstream_host, self.upstream_port)
+        except OSError:
+            client_writer.close()
+            return
+        self._writers.update((client_writer, server_writer))
+
+        async def pump(reader, writer, inject: bool):
+            try:
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    if inject:
+                        fault = self.fault
+                        if fault.down or random.random() < fault.error_rate:
+                            break
+                        if fault.latency_ms:
+                            await asyncio.sleep(fault.latency_ms / 1000 * random.uniform(0.8, 1.2))
+                    writer.write(data)
+                    await writer.drain()
+            except (ConnectionError, OSError):
+                pass
+            finally:
+                writer.close()
+                self._writers.discard(writer)
+
+        await asyncio.gather(
+            pump(client_reader, server_writer, inject=True),
+            pump(server_reader, client_writer, inject=False),
+        )
+
+
+async def drive_load(http: httpx.AsyncClient, path: str, concurrency: int, stop_at: float,
+                     samples: List[Tuple[float, int, float]]):
+    async def worker():
+        while time.monotonic() < stop_at:
+            started = time.monotonic()
+            try:
+                status = (await http.get(path)).status_code
+            except httpx.HTTPError:
+                status = 0  # client-side timeout or connection failure
+            samples.append((started, status, (time.monotonic() - started) * 1000))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def summarize(name: str, samples: List[Tuple[float, int, float]]) -> Dict:
+    latencies = sorted(sample[2] for sample in samples)
+    if not latencies:
+        return {'phase': name, 'requests': 0}
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    return {
+        'phase': name,
+        'requests': len(latencies),
+        'statuses': dict(Counter(sample[1] for sample in samples)),
+        'p50': round(statistics.median(latencies), 1),
+        'p95': round(pct(95), 1),
+        'p99': round(pct(99), 1),
+        'max': round(latencies[-1], 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--upstream', default='localhost:27017')
+    parser.add_argument('--listen-port', type=int, default=27018)
+    parser.add_argument('--base-url', default='http://localhost:8001/api')
+    parser.add_argument('--path', default='/products')
+    parser.add_argument('--token', help='Bearer token for authenticated paths')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--phases', default='healthy:15,latency=2500:15,errors=0.5:15,down:15,healthy:15')
+    args = parser.parse_args()
+
+    host, _, port = args.upstream.partition(':')
+    proxy = FaultyProxy(host, int(port or 27017))
+    server = await asyncio.start_server(proxy.handle, 'localhost', args.listen_port)
+    print(f"Proxy listening on localhost:{args.listen_port} -> {args.upstream}")
+
+    headers = {'Authorization': f"Bearer {args.token}"} if args.token else {}
+    samples: List[Tuple[float, int, float]] = []
+    boundaries = []
+    async with server, httpx.AsyncClient(base_url=args.base_url, headers=headers, timeout=30) as http:
+        for fault, seconds in parse_phases(args.phases):
+            proxy.fault = fault
+            if fault.down:
+                proxy.drop_all()
+            started = time.monotonic()
+            boundaries.append((fault.name, started, started + seconds))
+            print(f"Phase {fault.name} for {seconds:.0f}s")
+            await drive_load(http, args.path, args.concurrency, started + seconds, samples)
+
+    print(f"\n{'phase':<16}{'requests':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  statuses")
+    for name, started, ended in boundaries:
+        row = summarize(name, [sample for sample in samples if started <= sample[0] < ended])
+        if row['requests']:
+            print(f"{name:<16}{row['requests']:>10}{row['p50']:>9}{row['p95']:>9}{row['p99']:>9}{row['max']:>9}  {row['statuses']}")
+        else:
+            print(f"{name:<16}{0:>10}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
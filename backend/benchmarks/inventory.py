@@ -0,0 +1,99 @@
+"""
+Stock concurrency check: fires N parallel purchases at a product with S units
+against a local MongoDB and verifies that exactly S succeed, stock ends at zero
+and the product is marked unavailable. The same run is repeated with the old
+read-then-$set update for comparison (it oversells), and with reservations:
+N parallel holds, then an expiry sweep that must put every held unit back.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/inventory.py --orders 1000 --stock 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inventory import StockReservations, take_stock  # noqa: E402
+
+PRODUCT_ID = 'bench-product'
+
+
+async def reset_product(db, stock: int):
+    await db.products.replace_one(
+        {'id': PRODUCT_ID}, {'id': PRODUCT_ID, 'quantity': stock, 'is_available': True}, upsert=True
+    )
+
+
+async def legacy_purchase(db, quantity: int) -> bool:
+    product = await db.products.find_one({'id': PRODUCT_ID, 'is_available': True})
+    if not product or product['quantity'] < quantity:
+        return False
+    await asyncio.sleep(0)  # the payment and order writes that sat between the read and the $set
+    new_qty = product['quantity'] - quantity
+    await db.products.update_one({'id': PRODUCT_ID}, {'$set': {'quantity': new_qty, 'is_available': new_qty > 0}})
+    return True
+
+
+async def atomic_purchase(db, quantity: int) -> bool:
+    return await take_stock(db.products, PRODUCT_ID, quantity) is not None
+
+
+async def run(name: str, db, stock: int, orders: int, purchase) -> bool:
+    await reset_product(db, stock)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(purchase(db, 1) for _ in range(orders)))
+    elapsed = time.perf_counter() - started
+    product = await db.products.find_one({'id': PRODUCT_ID})
+    sold = sum(results)
+    ok = sold == stock and product['quantity'] == 0 and not product['is_available']
+    print(f"{name:<12} sold {sold}/{stock}, final quantity {product['quantity']}, "
+          f"available {product['is_available']} in {elapsed * 1000:.0f}ms -> {'ok' if ok else 'OVERSOLD/INCONSISTENT'}")
+    return ok
+
+
+async def run_reservations(db, stock: int, orders: int) -> bool:
+    await reset_product(db, stock)
+    reservations = StockReservations(db, hold_minutes=0.01)
+    held = await asyncio.gather(*(reservations.reserve(PRODUCT_ID, f"user-{i}", 1) for i in range(orders)))
+    held_count = sum(1 for reservation in held if reservation)
+    product = await db.products.find_one({'id': PRODUCT_ID})
+    await asyncio.sleep(1)
+    # Several workers sweeping at once must still return each unit exactly once
+    released = sum(await asyncio.gather(*(reservations.sweep() for _ in range(4))))
+    restored = await db.products.find_one({'id': PRODUCT_ID})
+    ok = (held_count == stock and product['quantity'] == 0 and released == stock
+          and restored['quantity'] == stock and restored['is_available'])
+    print(f"{'reservations':<12} held {held_count}/{stock}, released {released} after expiry, "
+          f"final quantity {restored['quantity']} -> {'ok' if ok else 'INCONSISTENT'}")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default='commuteshare_inventory_bench')
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--stock', type=int, default=10)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(args.mongo_url, maxPoolSize=200)
+    await client.drop_database(args.db_name)
+    db = client[args.db_name]
+    await db.products.create_index('id', unique=True)
+    await db.stock_reservations.create_index('id', unique=True)
+
+    await run('legacy', db, args.stock, args.orders, legacy_purchase)
+    ok = await run('atomic', db, args.stock, args.orders, atomic_purchase)
+    ok &= await run_reservations(db, args.stock, args.orders)
+    await client.drop_database(args.db_name)
+    print('PASS' if ok else 'FAIL')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
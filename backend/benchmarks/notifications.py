@@ -0,0 +1,104 @@
+"""
+Notification dispatcher harness: submits bursts of order/booking/status events
+for many recipients against a local MongoDB, delivers them through the
+push/SMS/email channels to the in-process provider stand-in
+(scripts/notification_standin.py, over httpx.ASGITransport) and reports the
+coalescing ratio, provider requests, retries and delivery counts. Passes when
+every recipient got exactly one message per topic per window on each channel,
+despite the injected errors.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/notifications.py \\
+        --recipients 500 --events 20000 --error-rate 0.1 --max-rps 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import notification_standin as standin  # noqa: E402
+from events import EventHub  # noqa: E402
+from notifications import EmailChannel, NotificationDispatcher, PushChannel, SmsChannel  # noqa: E402
+
+TOPICS = [('order.created', 'order', 'pending'), ('booking.created', 'booking', 'pending'),
+          ('food_order.created', 'food_order', 'pending'), ('order.status', 'order', 'delivered')]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default='commuteshare_notification_bench')
+    parser.add_argument('--recipients', type=int, default=500)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--window', type=float, default=1.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--max-rps', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    standin.FAULTS.update(error_rate=args.error_rate, max_rps=args.max_rps, latency_ms=args.latency_ms)
+    client = AsyncIOMotorClient(args.mongo_url)
+    await client.drop_database(args.db_name)
+    db = client[args.db_name]
+    users = [{
+        'id': f"user-{i}",
+        'email': f"user{i}@example.com",
+        'phone': f"+2348000{i:06d}",
+        'push_token': f"ExponentPushToken[{i:022d}]",
+    } for i in range(args.recipients)]
+    await db.users.insert_many(users)
+
+    transport = httpx.ASGITransport(app=standin.app)
+    channels = [
+        PushChannel('http://standin/push', transport=transport, backoff_base=0.05),
+        SmsChannel('http://standin/sms', transport=transport, concurrency=20, backoff_base=0.05, max_retries=6),
+        EmailChannel('http://standin/email', transport=transport, backoff_base=0.05),
+    ]
+    dispatcher = NotificationDispatcher(db, channels, window_seconds=args.window, tick_seconds=args.window / 10)
+    dispatcher.start()
+
+    # Bursts: a few busy sellers get most of the events, all within one window
+    rng = random.Random(11)
+    weights = [1 / (rank + 1) for rank in range(args.recipients)]
+    expected = set()
+    started = time.perf_counter()
+    for index in range(args.events):
+        recipient = rng.choices(users, weights)[0]['id']
+        topic, kind, status = rng.choice(TOPICS)
+        expected.add((recipient, topic))
+        dispatcher.submit_many([EventHub.build_event(topic, kind, f"{kind}-{index}", status, ['buyer', recipient])],
+                               exclude='buyer')
+    submit_seconds = time.perf_counter() - started
+    await dispatcher.stop()
+    total_seconds = time.perf_counter() - started
+
+    stats = dispatcher.snapshot()
+    print(f"Submitted {args.events} events in {submit_seconds * 1000:.0f}ms "
+          f"({submit_seconds / args.events * 1e6:.1f}us each); drained in {total_seconds:.2f}s")
+    print(f"  messages {stats['messages']} ({args.events / max(stats['messages'], 1):.1f} events per message)")
+    for name, channel_stats in stats['channels'].items():
+        print(f"  {name:<6}{channel_stats}  provider requests {standin.STATE['requests'][name]}")
+
+    ok = stats['messages'] == len(expected)
+    for channel in channels:
+        received = standin.STATE['counts'][channel.name]
+        matches = received == len(expected)
+        ok &= matches
+        print(f"  {channel.name}: received {received} of {len(expected)} {'ok' if matches else 'MISSING'}")
+    stored = await db.notifications.count_documents({})
+    ok &= stored == len(expected)
+    await client.drop_database(args.db_name)
+    print('PASS' if ok else 'FAIL')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
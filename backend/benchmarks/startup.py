@@ -0,0 +1,93 @@
+"""
+Cold-start benchmark: time from launching uvicorn (which imports server.py)
+to the first 200 from /api/ready.
+
+Each run is appended to benchmarks/results/startup.jsonl with the current git
+revision so regressions show up across releases.
+
+Usage (from backend/, with MONGO_URL set):
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_FILE = Path(__file__).resolve().parent / 'results' / 'startup.jsonl'
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--tags', '--always', '--dirty'], cwd=BACKEND_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def measure_once(port: int, timeout: float) -> float:
+    url = f'http://127.0.0.1:{port}/api/ready'
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--port', str(port), '--log-level', 'warning'],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f'Server not ready after {timeout}s')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    samples = [measure_once(args.port, args.timeout) for _ in range(args.runs)]
+    result = {
+        'revision': git_revision(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'runs': args.runs,
+        'median_ms': round(statistics.median(samples), 1),
+        'min_ms': round(min(samples), 1),
+        'max_ms': round(max(samples), 1),
+    }
+
+    previous = None
+    if RESULTS_FILE.exists():
+        lines = RESULTS_FILE.read_text().strip().splitlines()
+        if lines:
+            previous = json.loads(lines[-1])
+    RESULTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with RESULTS_FILE.open('a') as f:
+        f.write(json.dumps(result) + '\n')
+
+    print(f"import-to-first-200: median {result['median_ms']}ms "
+          f"(min {result['min_ms']}ms, max {result['max_ms']}ms) @ {result['revision']}")
+    if previous:
+        delta = result['median_ms'] - previous['median_ms']
+        print(f"vs {previous['revision']}: {delta:+.1f}ms")
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    main()
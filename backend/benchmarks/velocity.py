@@ -0,0 +1,79 @@
+"""
+Velocity check microbenchmark: cost of VelocityEngine.check() (which also counts the attempt) per call with the
+server's rule set, across a population of users, devices and IPs, plus the
+snapshot cost used by VELOCITY_PERSIST. Runs in-process; no MongoDB needed.
+
+Usage (from backend/):
+    python benchmarks/velocity.py --calls 200000 --users 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from velocity import BLOCK, FLAG, HOLD, VelocityEngine, VelocityRule  # noqa: E402
+
+# Mirrors VELOCITY_RULES in server.py (importing server would need the full app environment)
+RULES = [
+    VelocityRule('swap-burst', ['swap'], 'user', 60, BLOCK, max_count=5),
+    VelocityRule('swap-volume', ['swap'], 'user', 3600, FLAG, max_amount=2000),
+    VelocityRule('withdraw-burst', ['withdraw'], 'user', 600, BLOCK, max_count=3),
+    VelocityRule('withdraw-volume', ['withdraw'], 'user', 86400, HOLD, max_amount=5000),
+    VelocityRule('checkout-burst', ['checkout'], 'user', 60, BLOCK, max_count=10),
+    VelocityRule('device-fanout', ['swap', 'withdraw'], 'device', 3600, HOLD, max_count=30),
+    VelocityRule('ip-volume', ['swap', 'withdraw', 'checkout'], 'ip', 3600, FLAG, max_amount=20000),
+]
+OPERATIONS = ['checkout'] * 6 + ['swap'] * 3 + ['withdraw']
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--buckets', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=500.0, help='simulated attempts per second')
+    args = parser.parse_args()
+
+    engine = VelocityEngine(RULES, buckets_per_window=args.buckets)
+    rng = random.Random(7)
+    attempts = [(
+        rng.choice(OPERATIONS),
+        round(rng.expovariate(1 / 80), 2),
+        f"user-{rng.randrange(args.users)}",
+        f"device-{rng.randrange(args.users)}",
+        f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+    ) for _ in range(args.calls)]
+
+    now = time.time()
+    step = 1 / args.rate
+    timings = []
+    clock = time.perf_counter_ns
+    for operation, amount, user, device, ip in attempts:
+        now += step
+        started = clock()
+        engine.check(operation, amount, user=user, device=device, ip=ip, now=now)
+        timings.append(clock() - started)
+
+    timings.sort()
+    micros = [t / 1000 for t in timings]
+    print(f"{args.calls} checks over {len(engine._windows)} keys "
+          f"({args.calls / args.rate:.0f}s simulated at {args.rate:.0f}/s)")
+    print(f"  mean {statistics.fmean(micros):.2f}us  p50 {percentile(micros, 0.5):.2f}us  "
+          f"p99 {percentile(micros, 0.99):.2f}us  max {micros[-1]:.2f}us")
+    print(f"  decisions {engine.stats}")
+
+    started = time.perf_counter()
+    entries = engine.snapshot(now)
+    print(f"  snapshot of {len(entries)} dirty keys in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Withdrawal queue harness: reserves N synthetic crypto withdrawals against a
+local MongoDB, drains them through the queue against the in-process Solana
+RPC stand-in (scripts/solana_rpc_standin.py, over httpx.ASGITransport) and
+reports reservation throughput, packing density, confirmation latency and a
+ledger conservation check: for every currency, remaining balances plus
+completed withdrawals must equal the starting balances.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/withdrawals.py \\
+        --withdrawals 2000 --users 200 --drop-rate 0.05 --fail-rate 0.02
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import solana_rpc_standin as standin  # noqa: E402
+from solana_rpc import SolanaRpcClient, base58_encode  # noqa: E402
+from solana_tx import Keypair  # noqa: E402
+from withdrawals import (  # noqa: E402
+    BALANCE_FIELDS, CLAIMED, COMPLETED, FAILED, IN_FLIGHT, QUEUED, InsufficientFunds, WithdrawalQueue,
+    enqueue_withdrawal,
+)
+
+STARTING_BALANCE = 1000.0
+
+
+def random_pubkey() -> str:
+    return base58_encode(os.urandom(32))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default='commuteshare_withdrawal_bench')
+    parser.add_argument('--withdrawals', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--currencies', default='SOL,USDT,COST')
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--finality-ms', type=float, default=200.0)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=300.0)
+    args = parser.parse_args()
+
+    standin.FAULTS.update(drop_rate=args.drop_rate, fail_rate=args.fail_rate,
+                         finality_ms=args.finality_ms, latency_ms=args.latency_ms)
+    client = AsyncIOMotorClient(args.mongo_url)
+    await client.drop_database(args.db_name)
+    db = client[args.db_name]
+    await db.crypto_withdrawals.create_index('id', unique=True)
+    await db.crypto_withdrawals.create_index([('status', 1), ('created_at', 1)])
+    await db.crypto_withdrawals.create_index('signature')
+
+    currencies = args.currencies.split(',')
+    users = [{'id': f"user-{i}", **{BALANCE_FIELDS[c]: STARTING_BALANCE for c in currencies}}
+             for i in range(args.users)]
+    await db.users.insert_many(users)
+    destinations = {user['id']: random_pubkey() for user in users}
+
+    rpc = SolanaRpcClient('http://standin/', transport=httpx.ASGITransport(app=standin.app), max_batch_size=100)
+    queue = WithdrawalQueue(db, client, rpc, Keypair(os.urandom(32)),
+                            {c: random_pubkey() for c in currencies if c != 'SOL'}, interval_seconds=0)
+
+    # Concurrent reservations, several per user so the guarded $inc is contended
+    started = time.perf_counter()
+    rejected = 0
+
+    async def reserve(index):
+        nonlocal rejected
+        user = users[index % len(users)]
+        try:
+            await enqueue_withdrawal(db, user['id'], random.choice(currencies),
+                                     round(random.uniform(0.01, 20), 4), destinations[user['id']])
+        except InsufficientFunds:
+            rejected += 1
+
+    await asyncio.gather(*(reserve(i) for i in range(args.withdrawals)))
+    reserve_seconds = time.perf_counter() - started
+    print(f"Reserved {args.withdrawals - rejected} withdrawals ({rejected} insufficient) "
+          f"in {reserve_seconds:.2f}s ({args.withdrawals / reserve_seconds:.0f}/s)")
+
+    started = time.perf_counter()
+    deadline = started + args.timeout
+    while time.perf_counter() < deadline:
+        await queue.run_once()
+        open_count = await db.crypto_withdrawals.count_documents({'status': {'$in': [QUEUED, CLAIMED, *IN_FLIGHT]}})
+        unrefunded = await db.crypto_withdrawals.count_documents({'status': FAILED, 'refunded': False})
+        if not open_count and not unrefunded:
+            break
+        await asyncio.sleep(0.05)
+    drain_seconds = time.perf_counter() - started
+
+    stats = await queue.stats()
+    print(f"Drained in {drain_seconds:.2f}s over {stats['rounds']} rounds")
+    for key in ('transactions_sent', 'withdrawals_sent', 'withdrawals_per_transaction', 'completed',
+                'failed', 'requeued', 'refunded', 'send_errors', 'latency_seconds', 'queue'):
+        print(f"  {key:<28}{stats[key]}")
+    print(f"  {'completed_per_second':<28}{stats['completed'] / drain_seconds:.1f}")
+    print(f"  rpc: {rpc.stats}")
+
+    ok = True
+    for currency in currencies:
+        field = BALANCE_FIELDS[currency]
+        remaining = (await db.users.aggregate([{'$group': {'_id': None, 'sum': {'$sum': f'${field}'}}}])
+                     .to_list(1))[0]['sum']
+        paid = (await db.crypto_withdrawals.aggregate([
+            {'$match': {'currency': currency, 'status': COMPLETED}},
+            {'$group': {'_id': None, 'sum': {'$sum': '$amount'}}},
+        ]).to_list(1) or [{'sum': 0.0}])[0]['sum']
+        balanced = abs(remaining + paid - STARTING_BALANCE * len(users)) < 1e-6 * len(users)
+        ok &= balanced
+        print(f"  {currency}: remaining {remaining:.4f} + paid {paid:.4f} "
+              f"{'==' if balanced else '!='} {STARTING_BALANCE * len(users):.4f}")
+    await rpc.close()
+    await client.drop_database(args.db_name)
+    print('PASS' if ok else 'FAIL: ledger does not balance')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
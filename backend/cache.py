@@ -0,0 +1,176 @@
+"""In-process caches with cross-worker invalidation driven by MongoDB change streams."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Server error codes meaning the resume token can no longer be used
+CHANGE_STREAM_HISTORY_LOST = 286
+INVALID_RESUME_TOKEN = 260
+NOT_A_REPLICA_SET = 40573
+
+
+class LocalCache:
+    """
+    Per-worker LRU cache. Entries live for `ttl` seconds while change-stream
+    invalidation is healthy and only `fallback_ttl` seconds while it is not.
+    """
+
+    def __init__(self, name: str, ttl: float = 300.0, fallback_ttl: float = 5.0, max_entries: int = 10000):
+        self.name = name
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.max_entries = max_entries
+        self.degraded = True  # until the subscriber confirms the stream is open
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        ttl = self.fallback_ttl if self.degraded else self.ttl
+        if time.monotonic() - stored_at > ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CacheRegistry:
+    """Named caches that the invalidation subscriber can address as a group."""
+
+    def __init__(self):
+        self._caches: Dict[str, LocalCache] = {}
+
+    def register(self, cache: LocalCache) -> LocalCache:
+        self._caches[cache.name] = cache
+        return cache
+
+    def __getitem__(self, name: str) -> LocalCache:
+        return self._caches[name]
+
+    def set_degraded(self, degraded: bool):
+        for cache in self._caches.values():
+            cache.degraded = degraded
+
+    def clear_all(self):
+        for cache in self._caches.values():
+            cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {name: len(cache) for name, cache in self._caches.items()}
+
+
+class ChangeStreamInvalidator:
+    """
+    Watches the configured collections on one change stream and evicts the
+    matching cache entries. `watched` maps collection -> (cache name, key field),
+    e.g. {"menu_items": ("menus", "restaurant_id")}.
+
+    The resume token is kept across reconnects so no event is missed after a
+    transient drop; if the token is no longer resumable every cache is cleared.
+    While the stream is down caches fall back to their short TTL.
+    """
+
+    def __init__(self, db, registry: CacheRegistry, watched: Dict[str, Tuple[str, str]],
+                 ignored_fields=('views',), retry_delay: float = 1.0, max_retry_delay: float = 30.0):
+        self.db = db
+        self.registry = registry
+        self.watched = watched
+        # Updates touching only these fields (e.g. view counters) don't evict
+        self.ignored_fields = set(ignored_fields)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.resume_token: Optional[Dict] = None
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def apply(self, event: Dict):
+        collection = event.get('ns', {}).get('coll')
+        if collection not in self.watched:
+            return
+        cache_name, key_field = self.watched[collection]
+        cache = self.registry[cache_name]
+        if event.get('operationType') == 'update':
+            changed = set(event.get('updateDescription', {}).get('updatedFields', {}))
+            if changed and changed <= self.ignored_fields:
+                return
+        document = event.get('fullDocument') or {}
+        if event.get('operationType') in ('insert', 'update', 'replace') and key_field in document:
+            cache.invalidate(document[key_field])
+        else:
+            # Deletes (and updates whose document vanished) don't carry our key field
+            cache.clear()
+
+    async def _run(self):
+        delay = self.retry_delay
+        pipeline = [{'$match': {'ns.coll': {'$in': list(self.watched)}}}]
+        while True:
+            try:
+                async with self.db.watch(
+                    pipeline, full_document='updateLookup', resume_after=self.resume_token
+                ) as stream:
+                    self._set_connected(True)
+                    delay = self.retry_delay
+                    async for event in stream:
+                        self.apply(event)
+                        self.resume_token = stream.resume_token
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                self._set_connected(False)
+                if e.code in (CHANGE_STREAM_HISTORY_LOST, INVALID_RESUME_TOKEN):
+                    logger.warning("Change stream resume token expired, clearing caches")
+                    self.resume_token = None
+                    self.registry.clear_all()
+                elif e.code == NOT_A_REPLICA_SET:
+                    logger.warning("Change streams need a replica set; caches stay on short TTLs")
+                    return
+                else:
+                    logger.warning(f"Change stream failed: {e}")
+            except PyMongoError as e:
+                self._set_connected(False)
+                logger.warning(f"Change stream dropped: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def _set_connected(self, connected: bool):
+        if connected and self.resume_token is None:
+            # Entries cached before the stream opened may have missed writes
+            self.registry.clear_all()
+        self.connected = connected
+        self.registry.set_degraded(not connected)
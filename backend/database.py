@@ -0,0 +1,319 @@
+"""MongoDB access layer: pooled client, per-route read routing and causal sessions."""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel, WriteConcern
+from pymongo.errors import OperationFailure, PyMongoError
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+logger = logging.getLogger(__name__)
+
+# Routes that only read catalog data and can tolerate bounded staleness
+BROWSE_ROUTES = ('get_products', 'get_services', 'get_restaurants', 'get_menu', 'get_reviews')
+
+# Indexes backing the hot query paths in server.py, created idempotently at startup
+INDEXES = {
+    'users': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('email', ASCENDING)], unique=True),
+        # Stalest-first scan of the on-chain balance sync
+        IndexModel([('onchain_balances.synced_at', ASCENDING)]),
+    ],
+    'products': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('is_available', ASCENDING), ('category', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('seller_id', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('geo_location', GEOSPHERE)]),
+    ],
+    # Per-user history indexes end in id so the activity timeline (activity.py) can
+    # sort on (created_at, id) straight off the index
+    'orders': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('buyer_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('seller_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+        # Changed-document pass of scripts/export_parquet.py
+        IndexModel([('updated_at', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    'services': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('is_available', ASCENDING), ('service_type', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('provider_id', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('geo_location', GEOSPHERE)]),
+    ],
+    'service_bookings': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('client_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('provider_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        # Interval overlap checks: provider + start_at < end AND end_at > start
+        IndexModel([('provider_id', ASCENDING), ('start_at', ASCENDING), ('end_at', ASCENDING)]),
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+    ],
+    # One claim per provider per slot grain; the unique index makes double-booking impossible
+    'provider_slots': [
+        IndexModel([('provider_id', ASCENDING), ('grain_start', ASCENDING)], unique=True),
+        IndexModel([('booking_id', ASCENDING)]),
+    ],
+    'stock_reservations': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('status', ASCENDING), ('expires_at', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING)]),
+        IndexModel([('purge_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'provider_availability': [
+        IndexModel([('provider_id', ASCENDING)], unique=True),
+    ],
+    'restaurants': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('is_open', ASCENDING), ('rating', DESCENDING)]),
+        IndexModel([('owner_id', ASCENDING)]),
+        IndexModel([('geo_location', GEOSPHERE)]),
+    ],
+    'menu_items': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('restaurant_id', ASCENDING), ('is_available', ASCENDING)]),
+    ],
+    'food_orders': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('customer_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('restaurant_id', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+    ],
+    'reviews': [
+        IndexModel([('target_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+    'transactions': [
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+        IndexModel([('updated_at', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    # Cold tier written by archive.Archiver; history lookups and the export's changed-document pass
+    'orders_archive': [
+        IndexModel([('buyer_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('seller_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('updated_at', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    'food_orders_archive': [
+        IndexModel([('customer_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+    ],
+    'service_bookings_archive': [
+        IndexModel([('client_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('provider_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+    ],
+    'transactions_archive': [
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('updated_at', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    # Deposit watcher: followed addresses with their signature cursors, and detected deposits
+    'deposit_addresses': [
+        IndexModel([('address', ASCENDING)], unique=True),
+        IndexModel([('owner', ASCENDING), ('kind', ASCENDING)]),
+    ],
+    'chain_deposits': [
+        IndexModel([('signature', ASCENDING)]),
+        IndexModel([('status', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('slot', DESCENDING)]),
+        IndexModel([('credit_round', ASCENDING)], sparse=True),
+    ],
+    # Crypto withdrawal queue: FIFO claims, confirmation tracking by signature, user history
+    'crypto_withdrawals': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+        IndexModel([('signature', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+    # Hourly/daily platform rollups (rollups.py); hourly buckets expire
+    'platform_rollups': [
+        IndexModel([('granularity', ASCENDING), ('start', ASCENDING)]),
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'notifications': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('read', ASCENDING)]),
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=90 * 24 * 3600),
+    ],
+    'velocity_flags': [
+        IndexModel([('created_at', DESCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+    # Snapshots of in-memory velocity windows, dropped once the window has emptied
+    'velocity_state': [
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    # Replay window for Idempotency-Key retries
+    'idempotency_keys': [
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=86400),
+    ],
+    # Bulk import progress, polled by id and kept for a week
+    'import_jobs': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=7 * 86400),
+    ],
+    # Shared rate-limit windows (RATE_LIMIT_BACKEND=mongo)
+    'rate_limits': [
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    # Cross-worker status event fan-out only needs a short replay window
+    'status_events': [
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=3600),
+    ],
+}
+
+# Indexes replaced by one in INDEXES, dropped at startup once the replacement exists.
+# The (user, created_at) history indexes are prefixes of the (user, created_at, id) ones.
+SUPERSEDED_INDEXES = {
+    'orders': ['buyer_id_1_created_at_-1', 'seller_id_1_created_at_-1'],
+    'service_bookings': ['client_id_1_created_at_-1', 'provider_id_1_created_at_-1'],
+    'food_orders': ['customer_id_1_created_at_-1'],
+    'transactions': ['user_id_1_created_at_-1'],
+    'orders_archive': ['buyer_id_1_created_at_-1', 'seller_id_1_created_at_-1'],
+    'food_orders_archive': ['customer_id_1_created_at_-1'],
+    'service_bookings_archive': ['client_id_1_created_at_-1', 'provider_id_1_created_at_-1'],
+    'transactions_archive': ['user_id_1_created_at_-1'],
+}
+# Server error codes for a drop of something already gone
+NAMESPACE_NOT_FOUND = 26
+INDEX_NOT_FOUND = 27
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+class DatabaseSettings:
+    """Connection settings, read from the environment with production-friendly defaults."""
+
+    def __init__(self):
+        self.db_name = os.environ.get('DB_NAME', 'commuteshare')
+        self.max_pool_size = _env_int('MONGO_MAX_POOL_SIZE', 100)
+        self.min_pool_size = _env_int('MONGO_MIN_POOL_SIZE', 10)
+        self.max_idle_time_ms = _env_int('MONGO_MAX_IDLE_TIME_MS', 60000)
+        self.wait_queue_timeout_ms = _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)
+        self.connect_timeout_ms = _env_int('MONGO_CONNECT_TIMEOUT_MS', 5000)
+        self.server_selection_timeout_ms = _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+        self.socket_timeout_ms = _env_int('MONGO_SOCKET_TIMEOUT_MS', 20000)
+        # zstd/snappy need their optional packages installed; zlib ships with Python
+        self.compressors = os.environ.get('MONGO_COMPRESSORS', 'zlib')
+        # Browse reads: secondaryPreferred with bounded staleness (90s is the server minimum)
+        self.browse_read_preference = os.environ.get('MONGO_BROWSE_READ_PREFERENCE', 'secondaryPreferred')
+        self.max_staleness_seconds = _env_int('MONGO_MAX_STALENESS_SECONDS', 90)
+        # Per-route overrides, e.g. "get_reviews=primary,get_menu=nearest"
+        self.route_read_preferences = self._parse_route_overrides(
+            os.environ.get('MONGO_ROUTE_READ_PREFERENCES', '')
+        )
+
+    @staticmethod
+    def _parse_route_overrides(raw: str) -> Dict[str, str]:
+        overrides = {}
+        for entry in raw.split(','):
+            if '=' in entry:
+                route, mode = entry.split('=', 1)
+                overrides[route.strip()] = mode.strip()
+        return overrides
+
+    def client_options(self) -> Dict:
+        return {
+            'maxPoolSize': self.max_pool_size,
+            'minPoolSize': self.min_pool_size,
+            'maxIdleTimeMS': self.max_idle_time_ms,
+            'waitQueueTimeoutMS': self.wait_queue_timeout_ms,
+            'connectTimeoutMS': self.connect_timeout_ms,
+            'serverSelectionTimeoutMS': self.server_selection_timeout_ms,
+            'socketTimeoutMS': self.socket_timeout_ms,
+            'compressors': self.compressors,
+            'retryWrites': True,
+            'retryReads': True,
+        }
+
+
+def build_read_preference(mode_name: str, max_staleness_seconds: int = -1):
+    """Build a pymongo read preference from its mode name ("primary", "secondaryPreferred", ...)."""
+    mode = read_pref_mode_from_name(mode_name)
+    # Staleness bounds are only valid for non-primary modes
+    staleness = -1 if mode_name == 'primary' else max_staleness_seconds
+    return make_read_preference(mode, None, staleness)
+
+
+class Database:
+    """
+    Wraps the Motor client and hands out database handles per access pattern:
+    - primary(): money-moving paths, primary reads with majority read/write concern
+    - for_route(name): browse paths, routed to secondaries unless overridden
+    """
+
+    def __init__(self, mongo_url: str, settings: Optional[DatabaseSettings] = None):
+        self.settings = settings or DatabaseSettings()
+        self.client = AsyncIOMotorClient(mongo_url, **self.settings.client_options())
+        self._primary = self.client.get_database(
+            self.settings.db_name,
+            read_preference=build_read_preference('primary'),
+            write_concern=WriteConcern('majority'),
+            read_concern=ReadConcern('majority'),
+        )
+        self._route_handles = {}
+
+    def primary(self):
+        return self._primary
+
+    def for_route(self, route_name: str):
+        handle = self._route_handles.get(route_name)
+        if handle is None:
+            mode_name = self.settings.route_read_preferences.get(route_name)
+            if mode_name is None:
+                mode_name = self.settings.browse_read_preference if route_name in BROWSE_ROUTES else 'primary'
+            handle = self.client.get_database(
+                self.settings.db_name,
+                read_preference=build_read_preference(mode_name, self.settings.max_staleness_seconds),
+            )
+            self._route_handles[route_name] = handle
+        return handle
+
+    @asynccontextmanager
+    async def causal_session(self):
+        """Causally consistent session so a request always reads its own writes."""
+        async with await self.client.start_session(causal_consistency=True) as session:
+            yield session
+
+    async def ping(self) -> bool:
+        try:
+            await self.client.admin.command('ping')
+            return True
+        except PyMongoError:
+            return False
+
+    async def warm_up(self):
+        """Open min_pool_size connections up front so the first requests don't pay for handshakes."""
+        await asyncio.gather(*(
+            self.client.admin.command('ping') for _ in range(max(self.settings.min_pool_size, 1))
+        ))
+
+    async def ensure_indexes(self):
+        for collection_name, indexes in INDEXES.items():
+            try:
+                await self._primary[collection_name].create_indexes(indexes)
+            except PyMongoError as e:
+                # A conflicting legacy index shouldn't keep the API from starting
+                logger.warning(f"Index creation failed for {collection_name}: {e}")
+                continue
+            for index_name in SUPERSEDED_INDEXES.get(collection_name, ()):
+                await self._drop_index(collection_name, index_name)
+
+    async def _drop_index(self, collection_name: str, index_name: str):
+        try:
+            await self._primary[collection_name].drop_index(index_name)
+            logger.info(f"Dropped superseded index {collection_name}.{index_name}")
+        except OperationFailure as e:
+            if e.code not in (NAMESPACE_NOT_FOUND, INDEX_NOT_FOUND):
+                logger.warning(f"Dropping index {collection_name}.{index_name} failed: {e}")
+        except PyMongoError as e:
+            logger.warning(f"Dropping index {collection_name}.{index_name} failed: {e}")
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,182 @@
+"""
+Per-request deadlines and a MongoDB circuit breaker, as ASGI middleware.
+
+The deadline is applied with pymongo.timeout(), so every Motor call made while
+handling the request shares it: finds and aggregates get a maxTimeMS of the
+remaining budget and writes fail once it is spent, instead of queueing forever
+behind a degraded server.
+"""
+import logging
+import re
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import pymongo
+from pymongo.errors import ConnectionFailure, PyMongoError
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class RouteDeadline:
+    """Deadline for requests whose method and path match; None disables it (e.g. long uploads)."""
+
+    def __init__(self, method: str, path_pattern: str, deadline_ms: Optional[int]):
+        self.method = method
+        self.path = re.compile(path_pattern)
+        self.deadline_ms = deadline_ms
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method == '*' or self.method == method) and bool(self.path.match(path))
+
+
+def is_outage(error: PyMongoError) -> bool:
+    """Timeouts and lost connections say the database is struggling; other errors are the request's own."""
+    return error.timeout or isinstance(error, ConnectionFailure)
+
+
+class CircuitBreaker:
+    """
+    Trips OPEN when, within the last `window_seconds`, at least `min_requests`
+    requests completed and `failure_ratio` of them timed out or lost their
+    database connection. After
+    `cooldown_seconds` one probe request is let through (HALF_OPEN): success
+    closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, failure_ratio: float = 0.5, min_requests: int = 20,
+                 window_seconds: float = 10.0, cooldown_seconds: float = 5.0):
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+
+    def _trim(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if ok:
+                logger.info("Database circuit closed")
+                self.state = CLOSED
+                self._outcomes.clear()
+            else:
+                self._open(now)
+            return
+        self._outcomes.append((now, ok))
+        self._trim(now)
+        if self.state == CLOSED and len(self._outcomes) >= self.min_requests:
+            failures = sum(1 for _, outcome in self._outcomes if not outcome)
+            if failures / len(self._outcomes) >= self.failure_ratio:
+                self._open(now)
+
+    def _open(self, now: float):
+        logger.warning("Database circuit opened; failing fast until it recovers")
+        self.state = OPEN
+        self.opened_at = now
+        self._outcomes.clear()
+
+    def stats(self) -> dict:
+        self._trim(time.monotonic())
+        return {
+            'state': self.state,
+            'window_requests': len(self._outcomes),
+            'window_failures': sum(1 for _, outcome in self._outcomes if not outcome),
+        }
+
+
+class DeadlineMiddleware:
+    """
+    Runs each HTTP request under its route's deadline and the circuit breaker.
+    Timeouts and connection errors that escape a handler become 504 (deadline
+    spent) or 503 (database unavailable) and count against the breaker; other
+    database errors (a duplicate key, say) propagate as they are. While the
+    breaker is open, requests fail fast with 503 and Retry-After. Paths in
+    `exempt_paths` (liveness probes) bypass both.
+    """
+
+    def __init__(self, app, deadlines: List[RouteDeadline], default_deadline_ms: Optional[int],
+                 breaker: CircuitBreaker, exempt_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.deadlines = deadlines
+        self.default_deadline_ms = default_deadline_ms
+        self.breaker = breaker
+        self.exempt_paths = set(exempt_paths)
+
+    def _deadline_for(self, method: str, path: str) -> Optional[int]:
+        for deadline in self.deadlines:
+            if deadline.matches(method, path):
+                return deadline.deadline_ms
+        return self.default_deadline_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'OPTIONS' or scope['path'] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        if not self.breaker.allow():
+            await JSONResponse(
+                {'detail': 'Service temporarily unavailable'},
+                status_code=503,
+                headers={'Retry-After': str(int(self.breaker.cooldown_seconds))},
+            )(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        deadline_ms = self._deadline_for(scope['method'], scope['path'])
+        try:
+            # None means "no deadline" to pymongo, so exempt routes run unbounded
+            with pymongo.timeout(deadline_ms / 1000 if deadline_ms else None):
+                await self.app(scope, receive, tracking_send)
+        except PyMongoError as e:
+            if not is_outage(e):
+                self.breaker.record(True)
+                raise
+            self.breaker.record(False)
+            if response_started:
+                raise
+            if e.timeout:
+                logger.warning(f"Deadline of {deadline_ms}ms exceeded for {scope['method']} {scope['path']}")
+                await JSONResponse({'detail': 'Request deadline exceeded'}, status_code=504)(scope, receive, send)
+            else:
+                logger.error(f"Database error for {scope['method']} {scope['path']}: {e}")
+                await JSONResponse(
+                    {'detail': 'Service temporarily unavailable'},
+                    status_code=503,
+                    headers={'Retry-After': str(int(self.breaker.cooldown_seconds))},
+                )(scope, receive, send)
+            return
+        except BaseException:
+            # Not a database failure; let the breaker's probe slot go and re-raise
+            self.breaker.record(True)
+            raise
+        self.breaker.record(True)
@@ -0,0 +1,404 @@
+"""
+On-chain deposit watcher: follows users' Solana wallet and token accounts with
+batched getSignaturesForAddress polling, decodes SOL/SPL transfers from
+finalized transactions and credits the ledger in batches.
+
+Crediting:
+1. Decoded deposits are inserted into chain_deposits as "pending", keyed by
+   "<signature>:<user_id>:<currency>", so a re-read signature is a no-op.
+2. Only then does the address cursor (last signature/slot) move forward. An
+   address whose signature pages or transactions couldn't all be read keeps
+   its cursor behind them and is read again next round.
+3. Pending deposits are claimed ("crediting", tagged with the round), credited
+   with one $inc per user and marked "credited". Only claimed rows are credited,
+   so watchers in several workers never credit the same deposit.
+With transactions all of step 3 is atomic and a crash resumes from the cursor
+and the pending set: exactly once. Without them (standalone mongod) a crash
+after the claim leaves rows "crediting"; they are never credited again, only
+counted in stats as stale for reconciliation: at most once.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from solana_rpc import LAMPORTS_PER_SOL, SolanaRpcClient, SolanaRpcError, is_valid_pubkey
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+CREDITING = 'crediting'
+CREDITED = 'credited'
+
+WALLET = 'wallet'
+TOKEN_ACCOUNT = 'token_account'
+
+SIGNATURES_PAGE_SIZE = 1000
+# Transactions fetched per JSON-RPC batch
+TRANSACTIONS_PER_BATCH = 50
+CREDIT_BATCH_SIZE = 500
+# Rows still "crediting" after this long were claimed by a round that didn't finish
+STALE_CLAIM_MINUTES = 10
+# Mongo error code for transactions on a standalone server
+ILLEGAL_OPERATION = 20
+
+BALANCE_FIELDS = {
+    'SOL': 'sol_balance',
+    'USDT': 'usdt_balance',
+    'COST': 'cost_balance',
+}
+
+
+def decode_deposits(transaction: Dict, wallets: Dict[str, str], mints: Dict[str, str]) -> List[Tuple[str, str, float]]:
+    """
+    Positive balance changes to watched wallets in one jsonParsed transaction,
+    as (user_id, currency, amount). SOL comes from pre/postBalances of the wallet
+    account; SPL tokens from pre/postTokenBalances grouped by owner and mint.
+    """
+    meta = transaction.get('meta') or {}
+    if meta.get('err') is not None:
+        return []
+    deposits = []
+    keys = transaction['transaction']['message']['accountKeys']
+    for index, key in enumerate(keys):
+        address = key['pubkey'] if isinstance(key, dict) else key
+        if address in wallets:
+            delta = meta['postBalances'][index] - meta['preBalances'][index]
+            if delta > 0:
+                deposits.append((wallets[address], 'SOL', delta / LAMPORTS_PER_SOL))
+
+    currency_by_mint = {mint: currency for currency, mint in mints.items() if mint}
+    token_deltas: Dict[Tuple[str, str], float] = {}
+    for balances, sign in ((meta.get('preTokenBalances') or [], -1), (meta.get('postTokenBalances') or [], 1)):
+        for balance in balances:
+            owner, mint = balance.get('owner'), balance.get('mint')
+            if owner in wallets and mint in currency_by_mint:
+                amount = float(balance['uiTokenAmount'].get('uiAmountString') or 0)
+                token_deltas[(owner, mint)] = token_deltas.get((owner, mint), 0.0) + sign * amount
+    for (owner, mint), delta in token_deltas.items():
+        if delta > 0:
+            deposits.append((wallets[owner], currency_by_mint[mint], delta))
+    return deposits
+
+
+def token_accounts_of(transaction: Dict, wallets: Dict[str, str], mints: Dict[str, str]) -> List[Tuple[str, str]]:
+    """(token account, owner wallet) pairs for watched owners holding a watched mint after this transaction."""
+    keys = transaction['transaction']['message']['accountKeys']
+    watched_mints = {mint for mint in mints.values() if mint}
+    accounts = []
+    for balance in (transaction.get('meta') or {}).get('postTokenBalances') or []:
+        if balance.get('owner') in wallets and balance.get('mint') in watched_mints:
+            key = keys[balance['accountIndex']]
+            accounts.append((key['pubkey'] if isinstance(key, dict) else key, balance['owner']))
+    return accounts
+
+
+def advance_cursor(signatures: List[Tuple[str, int]], unavailable: Set[str]) -> Optional[Tuple[str, int]]:
+    """
+    Newest (signature, slot) the cursor may move to: everything from it back to
+    the old cursor was read. Signatures are newest first; None keeps the cursor.
+    """
+    blocked = [index for index, (signature, _) in enumerate(signatures) if signature in unavailable]
+    position = blocked[-1] + 1 if blocked else 0
+    return signatures[position] if position < len(signatures) else None
+
+
+def ledger_entries(deposits: List[Dict], now: datetime) -> List[Dict]:
+    return [{
+        'id': str(uuid.uuid4()),
+        'user_id': deposit['user_id'],
+        'amount': deposit['amount'],
+        'currency': deposit['currency'],
+        'transaction_type': 'deposit',
+        'description': f"On-chain deposit of {deposit['amount']} {deposit['currency']}",
+        'status': 'completed',
+        'reference': deposit['signature'],
+        'discount_applied': 0.0,
+        'original_amount': 0.0,
+        'created_at': now,
+        'updated_at': now,
+    } for deposit in deposits]
+
+
+class DepositWatcher:
+    def __init__(self, db, client, rpc: SolanaRpcClient, mints: Dict[str, str],
+                 interval_seconds: float = 15.0):
+        self.db = db
+        self.client = client
+        self.rpc = rpc
+        self.mints = mints
+        self.interval_seconds = interval_seconds
+        self.addresses = db.deposit_addresses
+        self.deposits = db.chain_deposits
+        self.use_transactions = True
+        self.stats = {'rounds': 0, 'signatures': 0, 'deposits': 0, 'credited': 0, 'stale_claims': 0,
+                      'held_back': 0}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Deposit watcher round failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self):
+        # Credit anything a previous (possibly crashed) round recorded but didn't credit
+        await self.credit_pending()
+        await self.register_new_wallets()
+        addresses = await self.addresses.find({}, {'_id': 0}).to_list(None)
+        wallets = {entry['owner']: entry['user_id'] for entry in addresses if entry['kind'] == WALLET}
+        if addresses:
+            await self.poll(addresses, wallets)
+        await self.credit_pending()
+        self.stats['rounds'] += 1
+
+    # ---- watch list ----
+
+    async def register_new_wallets(self):
+        """Start following wallets (and their existing token accounts) that aren't watched yet."""
+        watched = set(await self.addresses.distinct('owner', {'kind': WALLET}))
+        users = await self.db.users.find(
+            {'solana_wallet': {'$ne': None}}, {'_id': 0, 'id': 1, 'solana_wallet': 1}
+        ).to_list(None)
+        new_users = [u for u in users if u['solana_wallet'] not in watched and is_valid_pubkey(u['solana_wallet'])]
+        if not new_users:
+            return
+        token_mints = [mint for mint in self.mints.values() if mint]
+        lookups = [(user, mint) for user in new_users for mint in token_mints]
+        results = await self.rpc.batch([
+            ('getTokenAccountsByOwner', [user['solana_wallet'], {'mint': mint}, {'encoding': 'jsonParsed'}])
+            for user, mint in lookups
+        ])
+        targets = [(user['solana_wallet'], user['solana_wallet'], user['id'], WALLET) for user in new_users]
+        for (user, _), result in zip(lookups, results):
+            if not isinstance(result, SolanaRpcError):
+                targets.extend(
+                    (account['pubkey'], user['solana_wallet'], user['id'], TOKEN_ACCOUNT) for account in result['value']
+                )
+
+        # Follow from each address's newest signature: history before registration isn't credited
+        latest = await self.rpc.batch([
+            ('getSignaturesForAddress', [address, {'limit': 1, 'commitment': 'finalized'}])
+            for address, _, _, _ in targets
+        ])
+        now = datetime.utcnow()
+        operations = []
+        for (address, owner, user_id, kind), result in zip(targets, latest):
+            if isinstance(result, SolanaRpcError):
+                # Retry next round rather than risk following from the start of history
+                continue
+            newest = result[0] if result else {}
+            operations.append(UpdateOne({'address': address}, {'$setOnInsert': {
+                'address': address,
+                'owner': owner,
+                'user_id': user_id,
+                'kind': kind,
+                'last_signature': newest.get('signature'),
+                'last_slot': newest.get('slot'),
+                'created_at': now,
+            }}, upsert=True))
+        if operations:
+            await self.addresses.bulk_write(operations, ordered=False)
+        logger.info(f"Watching {len(new_users)} new wallets for deposits")
+
+    # ---- polling ----
+
+    async def poll(self, addresses: List[Dict], wallets: Dict[str, str]):
+        new_signatures = await self._new_signatures(addresses)
+        ordered = sorted({sig for sigs in new_signatures.values() for sig in sigs}, key=lambda s: s[1])
+        if not ordered:
+            return
+        self.stats['signatures'] += len(ordered)
+
+        # Transactions already decoded by an earlier round don't need re-fetching
+        seen = set(await self.deposits.distinct('signature', {'signature': {'$in': [s for s, _ in ordered]}}))
+        to_fetch = [signature for signature, _ in ordered if signature not in seen]
+        transactions = []
+        unavailable = set()
+        for start in range(0, len(to_fetch), TRANSACTIONS_PER_BATCH):
+            chunk = to_fetch[start:start + TRANSACTIONS_PER_BATCH]
+            results = await self.rpc.batch([
+                ('getTransaction', [signature, {
+                    'encoding': 'jsonParsed', 'commitment': 'finalized', 'maxSupportedTransactionVersion': 0,
+                }])
+                for signature in chunk
+            ])
+            for signature, result in zip(chunk, results):
+                if isinstance(result, SolanaRpcError) or result is None:
+                    # Not retrievable yet; only the addresses it belongs to wait for it
+                    logger.warning(f"Transaction {signature} unavailable: {result}")
+                    unavailable.add(signature)
+                else:
+                    transactions.append((signature, result))
+
+        now = datetime.utcnow()
+        records = []
+        discovered: Dict[str, Dict] = {}
+        for signature, transaction in transactions:
+            for address, owner in token_accounts_of(transaction, wallets, self.mints):
+                # Usually an associated token account created by this very deposit
+                discovered.setdefault(address, {
+                    'address': address,
+                    'owner': owner,
+                    'user_id': wallets[owner],
+                    'kind': TOKEN_ACCOUNT,
+                    'last_signature': signature,
+                    'last_slot': transaction.get('slot'),
+                    'created_at': now,
+                })
+            for user_id, currency, amount in decode_deposits(transaction, wallets, self.mints):
+                records.append({
+                    '_id': f"{signature}:{user_id}:{currency}",
+                    'signature': signature,
+                    'slot': transaction.get('slot'),
+                    'block_time': transaction.get('blockTime'),
+                    'user_id': user_id,
+                    'currency': currency,
+                    'amount': amount,
+                    'status': PENDING,
+                    'created_at': now,
+                })
+        if records:
+            try:
+                await self.deposits.bulk_write([InsertOne(record) for record in records], ordered=False)
+            except BulkWriteError as e:
+                # Duplicates are deposits recorded before a crash; anything else is a real failure
+                if any(error['code'] != 11000 for error in e.details.get('writeErrors', [])):
+                    raise
+            self.stats['deposits'] += len(records)
+
+        # Deposits are durable; now the cursors can move past them
+        operations = []
+        for address, sigs in new_signatures.items():
+            cursor = advance_cursor(sigs, unavailable)
+            if cursor is None:
+                continue
+            if cursor != sigs[0]:
+                self.stats['held_back'] += 1
+            operations.append(UpdateOne({'address': address}, {'$set': {
+                'last_signature': cursor[0], 'last_slot': cursor[1],
+            }}))
+        operations += [
+            UpdateOne({'address': address}, {'$setOnInsert': entry}, upsert=True)
+            for address, entry in discovered.items()
+        ]
+        if operations:
+            await self.addresses.bulk_write(operations, ordered=False)
+
+    async def _new_signatures(self, addresses: List[Dict]) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Successful finalized signatures after each address's cursor, newest first.
+        An address with a page that failed is left out, so its cursor stays put.
+        """
+        def options(entry, before=None):
+            opts = {'limit': SIGNATURES_PAGE_SIZE, 'commitment': 'finalized'}
+            if entry.get('last_signature'):
+                opts['until'] = entry['last_signature']
+            if before:
+                opts['before'] = before
+            return opts
+
+        signatures: Dict[str, List[Tuple[str, int]]] = {}
+        pending = [(entry, None) for entry in addresses]
+        while pending:
+            results = await self.rpc.batch([
+                ('getSignaturesForAddress', [entry['address'], options(entry, before)]) for entry, before in pending
+            ])
+            next_pages = []
+            for (entry, _), result in zip(pending, results):
+                if isinstance(result, SolanaRpcError):
+                    # Its newer pages alone would move the cursor past the ones we couldn't read
+                    logger.warning(f"Signature poll failed for {entry['address']}: {result}")
+                    signatures.pop(entry['address'], None)
+                    continue
+                page = signatures.setdefault(entry['address'], [])
+                page.extend((item['signature'], item['slot']) for item in result if item.get('err') is None)
+                if len(result) == SIGNATURES_PAGE_SIZE:
+                    # More than a page since the cursor: keep walking back towards it
+                    next_pages.append((entry, result[-1]['signature']))
+            pending = next_pages
+        return signatures
+
+    # ---- ledger ----
+
+    async def credit_pending(self):
+        stale = await self.deposits.count_documents({
+            'status': CREDITING, 'claimed_at': {'$lt': datetime.utcnow() - timedelta(minutes=STALE_CLAIM_MINUTES)},
+        })
+        if stale:
+            logger.warning(f"{stale} deposits were claimed by a crediting round that never finished; reconcile them")
+        self.stats['stale_claims'] = stale
+        while True:
+            pending = await self.deposits.find({'status': PENDING}, {'_id': 1}) \
+                .limit(CREDIT_BATCH_SIZE).to_list(CREDIT_BATCH_SIZE)
+            if not pending:
+                return
+            self.stats['credited'] += await self._credit([deposit['_id'] for deposit in pending])
+
+    async def _credit(self, deposit_ids: List[str]) -> int:
+        """Credit the given pending deposits that no other round has claimed; returns how many."""
+        credit_round = str(uuid.uuid4())
+        now = datetime.utcnow()
+
+        async def apply(session=None) -> int:
+            # Claim first: once a row is "crediting" no other round can credit it, even if
+            # this one stops before marking it credited
+            await self.deposits.update_many(
+                {'_id': {'$in': deposit_ids}, 'status': PENDING},
+                {'$set': {'status': CREDITING, 'credit_round': credit_round, 'claimed_at': now}},
+                session=session
+            )
+            claimed = await self.deposits.find({'credit_round': credit_round}, session=session).to_list(None)
+            if not claimed:
+                return 0
+            increments: Dict[str, Dict[str, float]] = {}
+            for deposit in claimed:
+                field = BALANCE_FIELDS[deposit['currency']]
+                user_inc = increments.setdefault(deposit['user_id'], {})
+                user_inc[field] = user_inc.get(field, 0.0) + deposit['amount']
+            await self.db.users.bulk_write(
+                [UpdateOne({'id': user_id}, {'$inc': inc}) for user_id, inc in increments.items()],
+                ordered=False, session=session
+            )
+            await self.db.transactions.insert_many(ledger_entries(claimed, now), ordered=False, session=session)
+            await self.deposits.update_many(
+                {'credit_round': credit_round, 'status': CREDITING},
+                {'$set': {'status': CREDITED, 'credited_at': now}},
+                session=session
+            )
+            return len(claimed)
+
+        if self.use_transactions:
+            try:
+                async with await self.client.start_session() as session:
+                    async with session.start_transaction():
+                        return await apply(session)
+            except OperationFailure as e:
+                if e.code != ILLEGAL_OPERATION:
+                    raise
+                # Standalone mongod: no transactions, fall back to ordered writes
+                logger.warning("Transactions unavailable; crediting deposits without them")
+                self.use_transactions = False
+        return await apply()
+
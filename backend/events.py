@@ -0,0 +1,139 @@
+"""In-process pub/sub for order/booking status events, optionally fanned out across workers."""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from cache import NOT_A_REPLICA_SET
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    """
+    Delivers events to the connections of their recipients in this worker.
+
+    With a backend attached, publish() goes through the backend instead (which
+    calls deliver() in every worker); without one, events stay in-process.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.backend: Optional["ChangeStreamEventBackend"] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def connection_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def deliver(self, event: Dict):
+        payload = {k: v for k, v in event.items() if k not in ('_id', 'recipients', 'created_at')}
+        for user_id in event.get('recipients', []):
+            for queue in self._subscribers.get(user_id, ()):
+                if queue.full():
+                    # Slow consumer: drop its oldest event rather than block publishers
+                    queue.get_nowait()
+                queue.put_nowait(payload)
+
+    @staticmethod
+    def build_event(event_type: str, kind: str, doc_id: str, status: str, recipients: List[str]) -> Dict:
+        return {
+            'type': event_type,
+            'kind': kind,
+            'id': doc_id,
+            'status': status,
+            'at': datetime.utcnow().isoformat(),
+            'recipients': sorted(set(r for r in recipients if r)),
+        }
+
+    async def publish(self, event_type: str, kind: str, doc_id: str, status: str, recipients: List[str]):
+        await self.publish_many([self.build_event(event_type, kind, doc_id, status, recipients)])
+
+    async def publish_many(self, events: List[Dict]):
+        """Publish events built with build_event; the backend writes them in one insert."""
+        if not events:
+            return
+        if self.backend is not None:
+            try:
+                await self.backend.publish_many(events)
+                return
+            except PyMongoError as e:
+                logger.warning(f"Event backend publish failed, delivering locally: {e}")
+        for event in events:
+            self.deliver(event)
+
+
+class ChangeStreamEventBackend:
+    """
+    Cross-worker fan-out: events are inserted into a TTL-indexed collection and
+    every worker tails it with a change stream. The backend only attaches itself
+    to the hub while its stream is open, so a standalone mongod (or a dropped
+    stream) degrades to in-process delivery.
+    """
+
+    def __init__(self, collection, hub: EventHub, retry_delay: float = 1.0, max_retry_delay: float = 30.0):
+        self.collection = collection
+        self.hub = hub
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish_many(self, events: List[Dict]):
+        created_at = datetime.utcnow()
+        await self.collection.insert_many([{**event, 'created_at': created_at} for event in events])
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.hub.backend = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        delay = self.retry_delay
+        resume_token = None
+        while True:
+            try:
+                async with self.collection.watch(
+                    [{'$match': {'operationType': 'insert'}}], resume_after=resume_token
+                ) as stream:
+                    self.hub.backend = self
+                    delay = self.retry_delay
+                    async for change in stream:
+                        self.hub.deliver(change['fullDocument'])
+                        resume_token = stream.resume_token
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                self.hub.backend = None
+                if e.code == NOT_A_REPLICA_SET:
+                    logger.info("Change streams unavailable; status events are delivered in-process only")
+                    return
+                logger.warning(f"Status event stream failed: {e}")
+                resume_token = None
+            except PyMongoError as e:
+                self.hub.backend = None
+                logger.warning(f"Status event stream dropped: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
@@ -0,0 +1,220 @@
+"""
+Idempotency-Key support for money-moving POSTs: first request runs, duplicates replay its response.
+
+A key is only released for another attempt when the route never ran. Once it
+may have written (a debit, an order), a failure leaves the key UNKNOWN and
+retries get 409 until it expires: charging twice is worse than asking the
+client to check what happened.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = 'in_progress'
+COMPLETED = 'completed'
+# The route ran but its response couldn't be stored; the outcome is unknown
+UNKNOWN = 'unknown'
+
+# Scope key the middleware sets and mark_route_started() flips
+SCOPE_KEY = 'idempotency'
+
+
+def mark_route_started(request: Request):
+    """Router dependency: from here on the route may write, so the key is never released."""
+    marker = request.scope.get(SCOPE_KEY)
+    if marker is not None:
+        marker['route_started'] = True
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+
+
+class IdempotencyStore:
+    """
+    Records live in a TTL-indexed collection keyed by "<user_id>:<key>".
+    The first request claims the key with a single insert; a duplicate either
+    waits for the in-progress marker to complete or gets the stored response.
+    """
+
+    def __init__(self, collection, wait_timeout: float = 10.0, poll_interval: float = 0.1,
+                 complete_attempts: int = 3):
+        self.collection = collection
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.complete_attempts = complete_attempts
+
+    async def begin(self, record_id: str, fingerprint: str) -> Optional[dict]:
+        """Claim the key. Returns None if claimed, or the stored record to replay."""
+        try:
+            await self.collection.insert_one({
+                '_id': record_id,
+                'fingerprint': fingerprint,
+                'status': IN_PROGRESS,
+                'created_at': datetime.utcnow(),
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            record = await self.collection.find_one({'_id': record_id})
+            if record is None:
+                # The original attempt failed and released the key; try to claim it again
+                return await self.begin(record_id, fingerprint)
+            if record['fingerprint'] != fingerprint:
+                raise IdempotencyConflict(422, "Idempotency-Key was already used with a different request")
+            if record['status'] == COMPLETED:
+                return record
+            if record['status'] == UNKNOWN:
+                raise IdempotencyConflict(
+                    409, "The request with this Idempotency-Key failed after it started; check its outcome before retrying"
+                )
+            if time.monotonic() >= deadline:
+                raise IdempotencyConflict(409, "A request with this Idempotency-Key is still being processed")
+            await asyncio.sleep(self.poll_interval)
+
+    async def complete(self, record_id: str, status_code: int, content_type: Optional[str], body: bytes):
+        """Store the response, retrying with backoff; raises if every attempt fails."""
+        for attempt in range(self.complete_attempts):
+            try:
+                await self.collection.update_one(
+                    {'_id': record_id},
+                    {'$set': {
+                        'status': COMPLETED,
+                        'status_code': status_code,
+                        'content_type': content_type,
+                        'body': body,
+                        'completed_at': datetime.utcnow(),
+                    }}
+                )
+                return
+            except PyMongoError as e:
+                if attempt + 1 == self.complete_attempts:
+                    raise
+                logger.warning(f"Completing idempotency key {record_id} failed, retrying: {e}")
+                await asyncio.sleep(self.poll_interval * 2 ** attempt)
+
+    async def release(self, record_id: str):
+        await self.collection.delete_one({'_id': record_id, 'status': IN_PROGRESS})
+
+    async def mark_unknown(self, record_id: str):
+        await self.collection.update_one(
+            {'_id': record_id, 'status': IN_PROGRESS},
+            {'$set': {'status': UNKNOWN, 'completed_at': datetime.utcnow()}}
+        )
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware applying Idempotency-Key to the configured POST paths.
+
+    `identify` maps request headers to a user id without touching the database
+    (keys are scoped per user); requests it can't identify pass straight through
+    so the route returns its usual 401. Responses below 500 are stored and
+    replayed. A server error releases the key only if the route never started
+    (mark_route_started must be a dependency of the routes); otherwise the key
+    is marked UNKNOWN. If storing a response keeps failing, the key is left in
+    progress, so retries also get 409 until it expires.
+    """
+
+    def __init__(self, app, get_store: Callable[[], Optional[IdempotencyStore]],
+                 paths: Iterable[str], identify: Callable[[Headers], Optional[str]]):
+        self.app = app
+        self.get_store = get_store
+        self.paths = set(paths)
+        self.identify = identify
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get('idempotency-key')
+        store = self.get_store()
+        user_id = self.identify(headers) if key else None
+        if not key or store is None or user_id is None:
+            await self.app(scope, receive, send)
+            return
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        record_id = f"{user_id}:{key}"
+        fingerprint = hashlib.sha256(scope['path'].encode() + b'\n' + body).hexdigest()
+        try:
+            record = await store.begin(record_id, fingerprint)
+        except IdempotencyConflict as e:
+            await JSONResponse({'detail': e.detail}, status_code=e.status_code)(scope, receive, send)
+            return
+        if record is not None:
+            response = Response(
+                content=record['body'],
+                status_code=record['status_code'],
+                media_type=record.get('content_type'),
+                headers={'Idempotent-Replayed': 'true'},
+            )
+            await response(scope, receive, send)
+            return
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            return await receive()
+
+        captured = {'status': 500, 'content_type': None, 'body': b''}
+
+        async def capture_send(message):
+            if message['type'] == 'http.response.start':
+                captured['status'] = message['status']
+                captured['content_type'] = Headers(raw=message.get('headers', [])).get('content-type')
+            elif message['type'] == 'http.response.body':
+                captured['body'] += message.get('body', b'')
+            await send(message)
+
+        marker = scope[SCOPE_KEY] = {'route_started': False}
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await self._failed(store, record_id, marker)
+            raise
+        if captured['status'] >= 500:
+            await self._failed(store, record_id, marker)
+            return
+        try:
+            await store.complete(record_id, captured['status'], captured['content_type'], captured['body'])
+        except PyMongoError as e:
+            # The route succeeded: releasing would let a retry run it again
+            logger.error(f"Could not store the response for idempotency key {record_id}; "
+                         f"it stays in progress until it expires: {e}")
+
+    async def _failed(self, store: IdempotencyStore, record_id: str, marker: dict):
+        try:
+            if marker['route_started']:
+                logger.warning(f"Request for idempotency key {record_id} failed after the route started")
+                await store.mark_unknown(record_id)
+            else:
+                await store.release(record_id)
+        except PyMongoError as e:
+            logger.error(f"Could not settle idempotency key {record_id}: {e}")
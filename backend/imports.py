@@ -0,0 +1,331 @@
+"""
+Bulk listing imports: stream a CSV or NDJSON upload, validate rows in chunks,
+write each chunk with one unordered insert_many and report per-row errors.
+Large uploads are spooled to disk and processed as a background job whose
+progress lives in the import_jobs collection.
+"""
+import asyncio
+import codecs
+import contextvars
+import csv
+import json
+import logging
+import tempfile
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+IMPORT_CHUNK_SIZE = 500
+# Uploads larger than this run as a background job instead of inline
+IMPORT_INLINE_MAX_BYTES = 1024 * 1024
+IMPORT_MAX_ROWS = 50000
+# Keeps job documents well under the 16MB BSON limit
+IMPORT_MAX_REPORTED_ERRORS = 1000
+# Spooled uploads stay in memory up to this size, then move to a temp file
+SPOOL_MAX_MEMORY_BYTES = 4 * 1024 * 1024
+# Uploads past this are refused outright, whether or not they declare a Content-Length
+IMPORT_MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+
+PROCESSING = 'processing'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+# CSV cells are strings: lists are "|"-separated and coordinates come as two columns
+LIST_SEPARATOR = '|'
+LIST_FIELDS = ('images',)
+
+
+class ImportRejected(Exception):
+    """Raised for uploads that can't be imported at all."""
+
+
+class UploadTooLarge(ImportRejected):
+    """Raised while spooling an upload that runs past the size cap."""
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str]) -> str:
+    if requested:
+        if requested.lower() not in (CSV, NDJSON):
+            raise ImportRejected("format must be csv or ndjson")
+        return requested.lower()
+    content_type = (content_type or '').lower()
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type:
+        return NDJSON
+    return CSV
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream incrementally and yield complete lines."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def normalize_csv_row(row: Dict[str, str]) -> Dict:
+    """Drop empty cells and turn CSV strings into the shapes the create models expect."""
+    data = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+    for field in LIST_FIELDS:
+        if field in data:
+            data[field] = [item.strip() for item in data[field].split(LIST_SEPARATOR) if item.strip()]
+    latitude, longitude = data.pop('latitude', None), data.pop('longitude', None)
+    if latitude is not None and longitude is not None:
+        data['geo_location'] = {'type': 'Point', 'coordinates': [longitude, latitude]}
+    return data
+
+
+async def iter_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Yields (row_number, data, parse_error) without buffering the upload.
+    Row numbers are 1-based data rows (the CSV header is not counted).
+    """
+    lines = iter_lines(chunks)
+    if fmt == CSV:
+        header = None
+        async for line in lines:
+            if line.strip():
+                header = next(csv.reader([line]))
+                break
+        if header is None:
+            return
+        row_number = 0
+        # csv needs whole records; quoted cells may span lines, so feed it line by line
+        buffered = ''
+        async for line in lines:
+            buffered = f"{buffered}\n{line}" if buffered else line
+            if buffered.count('"') % 2:
+                continue
+            record, buffered = buffered, ''
+            if not record.strip():
+                continue
+            row_number += 1
+            values = next(csv.reader([record]))
+            if len(values) > len(header):
+                yield row_number, None, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            yield row_number, normalize_csv_row(dict(zip(header, values))), None
+        if buffered.strip():
+            yield row_number + 1, None, "Unterminated quoted field"
+    else:
+        row_number = 0
+        async for line in lines:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield row_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(data, dict):
+                yield row_number, None, "Each line must be a JSON object"
+                continue
+            yield row_number, data, None
+
+
+def validation_errors(error: ValidationError) -> List[Dict]:
+    return [
+        {'field': '.'.join(str(part) for part in item['loc']) or None, 'message': item['msg']}
+        for item in error.errors()
+    ]
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.truncated = False
+
+    def add_error(self, row: int, errors: List[Dict]):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def dict(self) -> Dict:
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'truncated': self.truncated,
+        }
+
+
+class ListingImporter:
+    """
+    Validates rows (merged over `defaults`) against `create_model`, turns each
+    valid row into a document with `build_document(validated)` (which may raise
+    ValueError to reject the row), and inserts every chunk with one unordered
+    insert_many.
+    """
+
+    def __init__(self, collection, create_model: type, build_document: Callable[[BaseModel], Dict],
+                 defaults: Optional[Dict] = None, chunk_size: int = IMPORT_CHUNK_SIZE,
+                 max_rows: int = IMPORT_MAX_ROWS):
+        self.collection = collection
+        self.create_model = create_model
+        self.build_document = build_document
+        self.defaults = defaults or {}
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+
+    async def run(self, rows: AsyncIterator[Tuple[int, Optional[Dict], Optional[str]]],
+                  on_progress: Optional[Callable[[ImportReport], object]] = None) -> ImportReport:
+        report = ImportReport()
+        chunk: List[Tuple[int, Dict]] = []
+        async for row_number, data, parse_error in rows:
+            if report.rows >= self.max_rows:
+                # Rows past the limit are not read; everything before it is kept
+                report.truncated = True
+                break
+            report.rows += 1
+            if parse_error:
+                report.add_error(row_number, [{'field': None, 'message': parse_error}])
+                continue
+            try:
+                document = self.build_document(self.create_model(**{**self.defaults, **data}))
+            except ValidationError as e:
+                report.add_error(row_number, validation_errors(e))
+                continue
+            except ValueError as e:
+                report.add_error(row_number, [{'field': None, 'message': str(e)}])
+                continue
+            chunk.append((row_number, document))
+            if len(chunk) >= self.chunk_size:
+                await self._flush(chunk, report)
+                chunk = []
+                if on_progress:
+                    await on_progress(report)
+        if chunk:
+            await self._flush(chunk, report)
+        return report
+
+    async def _flush(self, chunk: List[Tuple[int, Dict]], report: ImportReport):
+        documents = [document for _, document in chunk]
+        try:
+            result = await self.collection.insert_many(documents, ordered=False)
+            report.inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Unordered: everything except the reported indexes was written
+            write_errors = e.details.get('writeErrors', [])
+            report.inserted += e.details.get('nInserted', len(documents) - len(write_errors))
+            for write_error in write_errors:
+                row_number = chunk[write_error['index']][0]
+                report.add_error(row_number, [{'field': None, 'message': write_error.get('errmsg', 'Write failed')}])
+
+
+class ImportJobs:
+    """Background import jobs, tracked in a collection so any worker can answer progress polls."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._tasks = set()
+
+    async def create(self, user_id: str, kind: str, fmt: str, size: int) -> Dict:
+        job = {
+            'id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'kind': kind,
+            'format': fmt,
+            'size_bytes': size,
+            'status': PROCESSING,
+            'rows': 0,
+            'inserted': 0,
+            'failed': 0,
+            'errors': [],
+            'created_at': datetime.utcnow(),
+            'finished_at': None,
+        }
+        await self.collection.insert_one(dict(job))
+        return job
+
+    async def get(self, job_id: str, user_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({'id': job_id, 'user_id': user_id}, {'_id': 0})
+
+    async def _progress(self, job_id: str, report: ImportReport):
+        await self.collection.update_one(
+            {'id': job_id},
+            {'$set': {'rows': report.rows, 'inserted': report.inserted, 'failed': report.failed}}
+        )
+
+    def start(self, job_id: str, importer: ListingImporter, spool, fmt: str,
+              on_complete: Optional[Callable[[], None]] = None):
+        # A fresh context, so the job doesn't inherit the starting request's database deadline
+        task = asyncio.create_task(self._run(job_id, importer, spool, fmt, on_complete), context=contextvars.Context())
+        # Hold a reference so the task isn't garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job_id: str, importer: ListingImporter, spool, fmt: str, on_complete):
+        try:
+            report = await importer.run(
+                iter_rows(read_spool(spool), fmt),
+                on_progress=lambda report: self._progress(job_id, report),
+            )
+            await self.collection.update_one(
+                {'id': job_id},
+                {'$set': {**report.dict(), 'status': COMPLETED, 'finished_at': datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.error(f"Import job {job_id} failed: {e}")
+            await self.collection.update_one(
+                {'id': job_id},
+                {'$set': {'status': FAILED, 'detail': 'Import failed', 'finished_at': datetime.utcnow()}}
+            )
+        finally:
+            spool.close()
+            if on_complete:
+                on_complete()
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def spool_upload(chunks: AsyncIterator[bytes], max_bytes: int = IMPORT_MAX_UPLOAD_BYTES):
+    """
+    Copy an upload into a spooled temp file (memory first, disk past the threshold).
+    Stops reading and raises UploadTooLarge as soon as it passes `max_bytes`.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, size
+
+
+async def read_spool(spool, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    while True:
+        chunk = spool.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+        # Let request handlers run between chunks
+        await asyncio.sleep(0)
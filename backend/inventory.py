@@ -0,0 +1,164 @@
+"""
+Product stock: atomic decrements and time-limited reservations.
+
+Stock is taken with a guarded $inc (`quantity >= n` in the filter), so two
+buyers can never both take the last unit; the write that takes stock to zero
+also flips `is_available` off and marks the product `sold_out`, guarded on the
+quantity it left behind so a concurrent restock isn't hidden. Returned stock
+re-lists only products that selling out took down, never ones a seller hid.
+
+A reservation takes its units off the product immediately and records them in
+stock_reservations with an expiry. Checkout consumes it; otherwise the sweeper
+returns the units once it expires. Each reservation is claimed with a status
+transition before its units move, so stock is returned exactly once however
+many workers sweep. Finished reservations are removed by the TTL index on
+`purge_at`.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+HELD = 'held'
+CONSUMED = 'consumed'
+RELEASED = 'released'
+# How long finished reservations are kept for support lookups before the TTL index drops them
+RESERVATION_RETENTION = timedelta(days=7)
+
+
+async def take_stock(products, product_id: str, quantity: int, session=None) -> Optional[Dict]:
+    """Atomically remove `quantity` units; the updated product, or None if there isn't enough stock."""
+    product = await products.find_one_and_update(
+        {'id': product_id, 'is_available': True, 'quantity': {'$gte': quantity}},
+        {'$inc': {'quantity': -quantity}, '$set': {'updated_at': datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if product is not None and product['quantity'] <= 0:
+        await products.update_one(
+            {'id': product_id, 'quantity': {'$lte': 0}}, {'$set': {'is_available': False, 'sold_out': True}},
+            session=session
+        )
+        product['is_available'] = False
+    return product
+
+
+async def return_stock(products, product_id: str, quantity: int, session=None):
+    """Put units back (failed checkout, released reservation), re-listing the product if selling out delisted it."""
+    await products.update_one(
+        {'id': product_id},
+        {'$inc': {'quantity': quantity}, '$set': {'updated_at': datetime.utcnow()}},
+        session=session,
+    )
+    await products.update_one(
+        {'id': product_id, 'sold_out': True, 'quantity': {'$gt': 0}},
+        {'$set': {'is_available': True}, '$unset': {'sold_out': ''}},
+        session=session,
+    )
+
+
+class StockReservations:
+    def __init__(self, db, hold_minutes: float = 10.0, max_active_per_user: int = 5,
+                 sweep_interval_seconds: float = 30.0):
+        self.products = db.products
+        self.collection = db.stock_reservations
+        self.hold_minutes = hold_minutes
+        self.max_active_per_user = max_active_per_user
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def reserve(self, product_id: str, user_id: str, quantity: int) -> Optional[Dict]:
+        """Hold `quantity` units for hold_minutes; None if there isn't enough stock."""
+        if await take_stock(self.products, product_id, quantity) is None:
+            return None
+        now = datetime.utcnow()
+        expires_at = now + timedelta(minutes=self.hold_minutes)
+        reservation = {
+            'id': str(uuid.uuid4()),
+            'product_id': product_id,
+            'user_id': user_id,
+            'quantity': quantity,
+            'status': HELD,
+            'created_at': now,
+            'expires_at': expires_at,
+            'purge_at': expires_at + RESERVATION_RETENTION,
+        }
+        try:
+            await self.collection.insert_one(reservation)
+        except Exception:
+            await return_stock(self.products, product_id, quantity)
+            raise
+        reservation.pop('_id', None)
+        return reservation
+
+    async def active_count(self, user_id: str) -> int:
+        return await self.collection.count_documents(
+            {'user_id': user_id, 'status': HELD, 'expires_at': {'$gt': datetime.utcnow()}}
+        )
+
+    async def consume(self, reservation_id: str, user_id: str, session=None) -> Optional[Dict]:
+        """Claim an unexpired reservation for checkout; its units are already off the product."""
+        return await self.collection.find_one_and_update(
+            {'id': reservation_id, 'user_id': user_id, 'status': HELD, 'expires_at': {'$gt': datetime.utcnow()}},
+            {'$set': {'status': CONSUMED, 'consumed_at': datetime.utcnow()}},
+            projection={'_id': 0},
+            session=session,
+        )
+
+    async def unconsume(self, reservation_id: str, session=None):
+        """Undo consume() when the checkout fails after claiming the reservation."""
+        await self.collection.update_one(
+            {'id': reservation_id, 'status': CONSUMED}, {'$set': {'status': HELD}, '$unset': {'consumed_at': ''}},
+            session=session,
+        )
+
+    async def release(self, reservation_id: str, user_id: Optional[str] = None) -> bool:
+        query = {'id': reservation_id, 'status': HELD}
+        if user_id is not None:
+            query['user_id'] = user_id
+        return await self._release_one(query) is not None
+
+    async def sweep(self) -> int:
+        """Return stock for every expired reservation; safe to run from several workers."""
+        released = 0
+        while await self._release_one({'status': HELD, 'expires_at': {'$lte': datetime.utcnow()}}) is not None:
+            released += 1
+        return released
+
+    async def _release_one(self, query: Dict) -> Optional[Dict]:
+        reservation = await self.collection.find_one_and_update(
+            query, {'$set': {'status': RELEASED, 'released_at': datetime.utcnow()}}, projection={'_id': 0}
+        )
+        if reservation is not None:
+            await return_stock(self.products, reservation['product_id'], reservation['quantity'])
+        return reservation
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval_seconds)
+            try:
+                released = await self.sweep()
+                if released:
+                    logger.info(f"Released {released} expired stock reservations")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Stock reservation sweep failed: {e}")
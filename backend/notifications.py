@@ -0,0 +1,302 @@
+"""
+Notifications for sellers, service providers and restaurant owners (and the
+other party on status changes), fed by the order, booking and status paths.
+
+submit_many() only appends events to an in-memory buffer per recipient. The
+first event opens a coalescing window for that recipient; when it closes,
+everything buffered becomes one message per topic ("5 new orders" rather than
+five pushes), written to the notifications collection (the in-app feed) and
+delivered through every channel the recipient can be reached on. Deliveries
+run as background tasks, at most max_inflight_deliveries at once, so a slow
+or rate-limiting provider never holds up the flush of other windows.
+
+Channels post JSON to an HTTP provider on a pooled httpx client, with a
+per-channel concurrency limit and retries with backoff on transport errors,
+429 (honouring Retry-After, capped at max_retry_after) and 5xx. Point them at
+scripts/notification_standin.py to run without real providers. Buffers are per
+worker, so a burst split across workers may produce one message per worker.
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set
+
+import httpx
+
+from ratelimit import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# topic -> (single, coalesced) message text
+MESSAGES = {
+    'order.created': ('You have a new order', 'You have {count} new orders'),
+    'booking.created': ('You have a new service booking', 'You have {count} new service bookings'),
+    'food_order.created': ('You have a new food order', 'You have {count} new food orders'),
+    'order.status': ('An order is now {status}', '{count} of your orders were updated'),
+    'booking.status': ('A booking is now {status}', '{count} of your bookings were updated'),
+    'food_order.status': ('A food order is now {status}', '{count} of your food orders were updated'),
+}
+TITLE = 'CommuteShare'
+
+
+class Channel:
+    """One delivery provider. Subclasses pick the address field and request shape."""
+
+    name = 'channel'
+    address_field = ''
+    batch_size = 1
+
+    def __init__(self, url: str, api_key: str = '', max_connections: int = 10, concurrency: int = 5,
+                 timeout: float = 10.0, max_retries: int = 3, backoff_base: float = 0.5, max_backoff: float = 8.0,
+                 max_retry_after: float = 30.0, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        headers = {'Authorization': f"Bearer {api_key}"} if api_key else {}
+        self._http = httpx.AsyncClient(
+            timeout=timeout,
+            headers=headers,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._slots = asyncio.Semaphore(concurrency)
+        self.stats = {'requests': 0, 'delivered': 0, 'failed': 0, 'retries': 0}
+
+    async def close(self):
+        await self._http.aclose()
+
+    def build_message(self, to: str, message: Dict) -> Dict:
+        return {'to': to, 'title': message['title'], 'body': message['body']}
+
+    def build_body(self, batch: List[Dict]):
+        return {'messages': batch}
+
+    def rejected(self, response_body, batch: List[Dict]) -> int:
+        """Messages the provider accepted the request for but refused individually."""
+        return 0
+
+    async def send(self, messages: Sequence[Dict]):
+        """Deliver messages from build_message in provider-sized batches, concurrency-limited."""
+        batches = [messages[start:start + self.batch_size] for start in range(0, len(messages), self.batch_size)]
+        await asyncio.gather(*(self._send_batch(batch) for batch in batches))
+
+    async def _send_batch(self, batch: List[Dict]):
+        async with self._slots:
+            try:
+                body = await self._post(self.build_body(batch))
+            except Exception as e:
+                self.stats['failed'] += len(batch)
+                logger.warning(f"{self.name} delivery of {len(batch)} messages failed: {e}")
+                return
+        rejected = self.rejected(body, batch)
+        self.stats['failed'] += rejected
+        self.stats['delivered'] += len(batch) - rejected
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _post(self, payload):
+        attempt = 0
+        while True:
+            try:
+                self.stats['requests'] += 1
+                response = await self._http.post(self.url, json=payload)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                retryable = response.status_code == 429 or response.status_code >= 500
+                if not retryable or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json() if response.content else None
+                delay = parse_retry_after(response.headers.get('retry-after'), self._backoff(attempt),
+                                          self.max_retry_after)
+            attempt += 1
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+
+class PushChannel(Channel):
+    """Expo push API format: a JSON array of up to 100 messages, one ticket per message back."""
+
+    name = 'push'
+    address_field = 'push_token'
+    batch_size = 100
+
+    def build_message(self, to: str, message: Dict) -> Dict:
+        return {'to': to, 'title': message['title'], 'body': message['body'], 'sound': 'default',
+                'data': {'topic': message['topic'], 'ids': message['ids']}}
+
+    def build_body(self, batch: List[Dict]):
+        return batch
+
+    def rejected(self, response_body, batch: List[Dict]) -> int:
+        tickets = (response_body or {}).get('data') or []
+        return sum(1 for ticket in tickets if ticket.get('status') == 'error')
+
+
+class SmsChannel(Channel):
+    name = 'sms'
+    address_field = 'phone'
+    batch_size = 1
+
+    def build_message(self, to: str, message: Dict) -> Dict:
+        return {'to': to, 'body': f"{TITLE}: {message['body']}"}
+
+    def build_body(self, batch: List[Dict]):
+        return batch[0]
+
+
+class EmailChannel(Channel):
+    name = 'email'
+    address_field = 'email'
+    batch_size = 50
+
+    def build_message(self, to: str, message: Dict) -> Dict:
+        return {'to': to, 'subject': f"{TITLE}: {message['body']}",
+                'text': f"{message['body']}. Open the app to see the details."}
+
+
+def render(topic: str, events: List[Dict]) -> Dict:
+    single, coalesced = MESSAGES.get(topic, ('You have an update', 'You have {count} updates'))
+    ids = list(dict.fromkeys(event['id'] for event in events))
+    if len(ids) == 1:
+        text = single.format(status=events[-1]['status'].replace('_', ' '))
+    else:
+        text = coalesced.format(count=len(ids))
+    return {'topic': topic, 'kind': events[0]['kind'], 'ids': ids, 'count': len(ids), 'title': TITLE, 'body': text}
+
+
+class NotificationDispatcher:
+    def __init__(self, db, channels: List[Channel], window_seconds: float = 10.0, tick_seconds: float = 1.0,
+                 max_pending_recipients: int = 50000, max_inflight_deliveries: int = 100,
+                 shutdown_timeout: float = 30.0):
+        self.users = db.users
+        self.notifications = db.notifications
+        self.channels = channels
+        self.window_seconds = window_seconds
+        self.tick_seconds = tick_seconds
+        self.max_pending_recipients = max_pending_recipients
+        self.max_inflight_deliveries = max_inflight_deliveries
+        self.shutdown_timeout = shutdown_timeout
+        # recipient -> {"opened": monotonic time, "events": [event, ...]}
+        self._pending: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+        self.stats = {'events': 0, 'messages': 0, 'flushes': 0, 'dropped': 0, 'deliveries_dropped': 0}
+
+    def submit_many(self, events: List[Dict], exclude: Optional[str] = None):
+        """Buffer EventHub events for each of their recipients except `exclude` (the user who acted)."""
+        now = time.monotonic()
+        for event in events:
+            for recipient in event.get('recipients', []):
+                if recipient == exclude:
+                    continue
+                pending = self._pending.get(recipient)
+                if pending is None:
+                    if len(self._pending) >= self.max_pending_recipients:
+                        self.stats['dropped'] += 1
+                        continue
+                    pending = self._pending[recipient] = {'opened': now, 'events': []}
+                pending['events'].append(event)
+                self.stats['events'] += 1
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush(force=True)
+        except Exception as e:
+            logger.warning(f"Notification flush on shutdown failed: {e}")
+        if self._deliveries:
+            _, unfinished = await asyncio.wait(self._deliveries, timeout=self.shutdown_timeout)
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                logger.warning(f"Cancelled {len(unfinished)} notification deliveries still running at shutdown")
+        for channel in self.channels:
+            await channel.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Notification flush failed: {e}")
+
+    async def flush(self, force: bool = False):
+        """Send every recipient whose window has closed (or everyone, with force)."""
+        cutoff = time.monotonic() - self.window_seconds
+        due = {recipient: pending['events'] for recipient, pending in self._pending.items()
+               if force or pending['opened'] <= cutoff}
+        if not due:
+            return
+        for recipient in due:
+            del self._pending[recipient]
+        self.stats['flushes'] += 1
+
+        now = datetime.utcnow()
+        docs = []
+        for recipient, events in due.items():
+            by_topic: Dict[str, List[Dict]] = {}
+            for event in events:
+                by_topic.setdefault(event['type'], []).append(event)
+            for topic, topic_events in by_topic.items():
+                docs.append({'id': str(uuid.uuid4()), 'user_id': recipient, **render(topic, topic_events),
+                             'read': False, 'created_at': now})
+        self.stats['messages'] += len(docs)
+        await self.notifications.insert_many([dict(doc) for doc in docs])
+
+        projection = {'_id': 0, 'id': 1, 'notification_preferences': 1,
+                      **{channel.address_field: 1 for channel in self.channels}}
+        users = await self.users.find({'id': {'$in': list(due)}}, projection).to_list(None)
+        users_by_id = {user['id']: user for user in users}
+
+        for channel in self.channels:
+            messages = []
+            for doc in docs:
+                user = users_by_id.get(doc['user_id'])
+                if user is None or not (user.get('notification_preferences') or {}).get(channel.name, True):
+                    continue
+                to = user.get(channel.address_field)
+                if to:
+                    messages.append(channel.build_message(to, doc))
+            if messages:
+                self._deliver(channel, messages)
+
+    def _deliver(self, channel: Channel, messages: List[Dict]):
+        """Send in the background; when too many sends are already running, the in-app feed has to do."""
+        if len(self._deliveries) >= self.max_inflight_deliveries:
+            self.stats['deliveries_dropped'] += len(messages)
+            logger.warning(f"{len(self._deliveries)} notification deliveries in flight; "
+                           f"dropping {len(messages)} {channel.name} messages")
+            return
+        task = asyncio.create_task(channel.send(messages))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            'pending_recipients': len(self._pending),
+            'deliveries_in_flight': len(self._deliveries),
+            'channels': {channel.name: channel.stats for channel in self.channels},
+        }
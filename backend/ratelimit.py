@@ -0,0 +1,278 @@
+"""Token-bucket rate limiting and adaptive load shedding, as ASGI middleware."""
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Request priorities: LOW is shed first under overload, CRITICAL never is
+LOW = 0
+NORMAL = 1
+CRITICAL = 2
+
+
+def parse_retry_after(value: Optional[str], default: float, maximum: float) -> float:
+    """
+    Seconds to wait from an upstream Retry-After header (delta-seconds or an
+    HTTP date), capped at `maximum`; `default` when it is missing or malformed.
+    """
+    if not value:
+        return min(default, maximum)
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return min(default, maximum)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - datetime.now(timezone.utc)).total_seconds()
+    if math.isnan(seconds):
+        return min(default, maximum)
+    return min(max(seconds, 0.0), maximum)
+
+
+class RateLimit:
+    """Bucket of `capacity` tokens refilled at `capacity / per_seconds` tokens per second."""
+
+    def __init__(self, capacity: int, per_seconds: float):
+        self.capacity = capacity
+        self.per_seconds = per_seconds
+        self.refill_rate = capacity / per_seconds
+
+
+class RoutePolicy:
+    """
+    Applies to requests whose method and path match. `scope` picks the bucket
+    key: "ip", "user" (falls back to IP for anonymous requests) or "both".
+    """
+
+    def __init__(self, method: str, path_pattern: str, limit: Optional[RateLimit],
+                 scope: str = 'user', priority: int = NORMAL, name: Optional[str] = None):
+        self.method = method
+        self.path = re.compile(path_pattern)
+        self.limit = limit
+        self.scope = scope
+        self.priority = priority
+        self.name = name or path_pattern
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method == '*' or self.method == method) and bool(self.path.match(path))
+
+
+class MemoryBucketBackend:
+    """Per-process buckets. Bounded LRU so a scan over many IPs can't grow it without limit."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, limit: RateLimit, cost: float = 1.0) -> float:
+        """Consume `cost` tokens. Returns 0 if allowed, else seconds until enough tokens refill."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(limit.capacity), now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now)
+            retry_after = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            retry_after = (cost - tokens) / limit.refill_rate
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class MongoBucketBackend:
+    """
+    Shared limits across workers. Approximates each bucket with a fixed window of
+    `per_seconds` holding `capacity` requests, counted by one atomic upsert per
+    request. The collection needs a TTL index on `expires_at`.
+
+    When the database can't be reached, buckets fall back to this worker's own
+    MemoryBucketBackend, so limits keep applying per worker instead of every
+    request failing with a 500.
+    """
+
+    def __init__(self, collection, fallback: Optional[MemoryBucketBackend] = None):
+        self.collection = collection
+        self.fallback = fallback or MemoryBucketBackend()
+        self.degraded = False
+
+    async def take(self, key: str, limit: RateLimit, cost: float = 1.0) -> float:
+        now = time.time()
+        window = int(now // limit.per_seconds)
+        window_end = (window + 1) * limit.per_seconds
+        try:
+            doc = await self._count(f"{key}:{window}", limit, cost)
+        except PyMongoError as e:
+            if not self.degraded:
+                logger.error(f"Rate limit store unavailable, limiting per worker: {e}")
+                self.degraded = True
+            return await self.fallback.take(key, limit, cost)
+        if self.degraded:
+            logger.info("Rate limit store reachable again")
+            self.degraded = False
+        if doc['count'] <= limit.capacity:
+            return 0.0
+        return window_end - now
+
+    async def _count(self, window_id: str, limit: RateLimit, cost: float) -> dict:
+        update = {
+            '$inc': {'count': cost},
+            '$setOnInsert': {'expires_at': datetime.utcnow() + timedelta(seconds=limit.per_seconds * 2)},
+        }
+        for attempt in range(2):
+            try:
+                return await self.collection.find_one_and_update(
+                    {'_id': window_id}, update, upsert=True, return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Two workers raced to create the window; retrying matches the one that won
+                if attempt:
+                    raise
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag: how late a sleep(interval) wakes up, smoothed with an EWMA."""
+
+    def __init__(self, interval: float = 0.1, alpha: float = 0.3):
+        self.interval = interval
+        self.alpha = alpha
+        self.lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, (time.perf_counter() - started - self.interval) * 1000)
+            self.lag_ms = self.alpha * lag + (1 - self.alpha) * self.lag_ms
+
+
+class AdmissionController:
+    """
+    Sheds load by priority once in-flight requests or event-loop lag pass their
+    thresholds. LOW requests are shed at the thresholds and NORMAL ones at twice
+    them. CRITICAL requests (checkout, wallet) are always admitted.
+    """
+
+    def __init__(self, lag_monitor: LoopLagMonitor, max_inflight: int = 200,
+                 max_lag_ms: float = 100.0, retry_after: int = 2):
+        self.lag_monitor = lag_monitor
+        self.max_inflight = max_inflight
+        self.max_lag_ms = max_lag_ms
+        self.retry_after = retry_after
+        self.inflight = 0
+        self.shed_count = 0
+
+    def overload_factor(self) -> float:
+        return max(self.inflight / self.max_inflight, self.lag_monitor.lag_ms / self.max_lag_ms)
+
+    def admit(self, priority: int) -> bool:
+        if priority >= CRITICAL:
+            return True
+        factor = self.overload_factor()
+        if (priority == LOW and factor >= 1.0) or (priority == NORMAL and factor >= 2.0):
+            self.shed_count += 1
+            return False
+        return True
+
+
+class RateLimitMiddleware:
+    """
+    Applies the first matching RoutePolicy: token-bucket limit (429), then
+    admission control (503), both with Retry-After.
+    """
+
+    def __init__(self, app, policies: List[RoutePolicy], default_policy: RoutePolicy,
+                 get_backend: Callable[[], object], admission: AdmissionController,
+                 identify: Callable[[Headers], Optional[str]], trust_forwarded_for: bool = False):
+        self.app = app
+        self.policies = policies
+        self.default_policy = default_policy
+        self.get_backend = get_backend
+        self.admission = admission
+        self.identify = identify
+        self.trust_forwarded_for = trust_forwarded_for
+
+    def _client_ip(self, scope, headers: Headers) -> str:
+        if self.trust_forwarded_for and 'x-forwarded-for' in headers:
+            return headers['x-forwarded-for'].split(',')[0].strip()
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    def _policy_for(self, method: str, path: str) -> RoutePolicy:
+        for policy in self.policies:
+            if policy.matches(method, path):
+                return policy
+        return self.default_policy
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'OPTIONS':
+            await self.app(scope, receive, send)
+            return
+
+        policy = self._policy_for(scope['method'], scope['path'])
+        if policy.limit is not None:
+            headers = Headers(scope=scope)
+            ip = self._client_ip(scope, headers)
+            keys = []
+            if policy.scope in ('ip', 'both'):
+                keys.append(f"{policy.name}:ip:{ip}")
+            if policy.scope in ('user', 'both'):
+                user_id = self.identify(headers)
+                if user_id:
+                    keys.append(f"{policy.name}:user:{user_id}")
+                elif policy.scope == 'user':
+                    keys.append(f"{policy.name}:ip:{ip}")
+            backend = self.get_backend()
+            for key in keys:
+                retry_after = await backend.take(key, policy.limit)
+                if retry_after > 0:
+                    await JSONResponse(
+                        {'detail': 'Too many requests'},
+                        status_code=429,
+                        headers={'Retry-After': str(math.ceil(retry_after))},
+                    )(scope, receive, send)
+                    return
+
+        if not self.admission.admit(policy.priority):
+            await JSONResponse(
+                {'detail': 'Server busy, please retry shortly'},
+                status_code=503,
+                headers={'Retry-After': str(self.admission.retry_after)},
+            )(scope, receive, send)
+            return
+
+        self.admission.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.inflight -= 1
@@ -0,0 +1,232 @@
+"""
+Platform rollups: hourly and daily buckets of gross bookings by vertical and
+payment currency, discounts granted by membership tier, registrations and
+approximate distinct active buyers, maintained incrementally from the write paths.
+
+Sales are recorded when an order or booking is placed and are never reversed,
+so "sales" is gross bookings: cancellations and refunds are not subtracted.
+
+Writes are buffered in memory and flushed every few seconds as one upsert per
+touched bucket. Counters use $inc and the HyperLogLog registers use $max, so
+flushes from any number of workers merge without coordination and the admin
+view never aggregates the live order collections. A crash loses at most one
+flush interval of increments.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+HOUR = 'hour'
+DAY = 'day'
+GRANULARITIES = (HOUR, DAY)
+# Hourly buckets are dropped after this long; daily buckets are kept
+HOURLY_RETENTION_DAYS = 90
+
+# 2^11 registers: ~2.3% standard error, at most 2048 small ints per bucket
+HLL_PRECISION = 11
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    if granularity == HOUR:
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Buckets are stored as naive UTC; aware values are converted, naive ones taken as UTC."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def bucket_id(granularity: str, start: datetime) -> str:
+    return f"{granularity}:{start.isoformat()}"
+
+
+def hll_register(value: str) -> tuple:
+    """(register index, rank) of a value: first bits pick the register, the rest give the rank."""
+    hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+    index = hashed >> (64 - HLL_PRECISION)
+    remainder = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - remainder.bit_length() + 1
+    return index, rank
+
+
+def hll_estimate(registers: Dict[str, int]) -> int:
+    """Cardinality estimate from sparse registers ({str(index): rank}; missing means 0)."""
+    if not registers:
+        return 0
+    m = HLL_REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    total = sum(2.0 ** -rank for rank in registers.values()) + (m - len(registers))
+    estimate = alpha * m * m / total
+    zeros = m - len(registers)
+    if estimate <= 2.5 * m and zeros:
+        # Small-range correction: linear counting
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+
+def hll_union(register_sets: List[Dict[str, int]]) -> Dict[str, int]:
+    merged: Dict[str, int] = {}
+    for registers in register_sets:
+        for index, rank in registers.items():
+            if rank > merged.get(index, 0):
+                merged[index] = rank
+    return merged
+
+
+def _add_nested(target: Dict, source: Dict):
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _add_nested(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+class RollupRecorder:
+    def __init__(self, collection, flush_interval_seconds: float = 5.0, max_pending_buckets: int = 1000):
+        self.collection = collection
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_pending_buckets = max_pending_buckets
+        # bucket id -> {"start", "granularity", "inc": {field: n}, "max": {field: n}}
+        self._pending: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'events': 0, 'flushes': 0, 'flush_errors': 0, 'dropped': 0}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Rollup flush failed: {e}")
+
+    # ---- recording (synchronous, in-memory) ----
+
+    def record_sale(self, vertical: str, currency: str, gross: float, net: float, discount: float,
+                    tier: str, buyer_id: str, at: Optional[datetime] = None):
+        index, rank = hll_register(buyer_id)
+        self._add(at, {
+            f'sales.{vertical}.{currency}.count': 1,
+            f'sales.{vertical}.{currency}.gross': gross,
+            f'sales.{vertical}.{currency}.net': net,
+            f'discounts.{tier}.{currency}.count': 1,
+            f'discounts.{tier}.{currency}.amount': discount,
+        }, {f'active_buyers.{index}': rank})
+
+    def record_registration(self, at: Optional[datetime] = None):
+        self._add(at, {'registrations': 1}, {})
+
+    def _add(self, at: Optional[datetime], inc: Dict[str, float], maxes: Dict[str, int]):
+        at = at or datetime.utcnow()
+        self.stats['events'] += 1
+        for granularity in GRANULARITIES:
+            start = bucket_start(at, granularity)
+            key = bucket_id(granularity, start)
+            bucket = self._pending.get(key)
+            if bucket is None:
+                if len(self._pending) >= self.max_pending_buckets:
+                    # Flushes are failing for a long time; don't grow without bound
+                    self.stats['dropped'] += 1
+                    continue
+                bucket = self._pending[key] = {'start': start, 'granularity': granularity, 'inc': {}, 'max': {}}
+            for field, value in inc.items():
+                bucket['inc'][field] = bucket['inc'].get(field, 0) + value
+            for field, value in maxes.items():
+                if value > bucket['max'].get(field, 0):
+                    bucket['max'][field] = value
+
+    # ---- flushing ----
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        now = datetime.utcnow()
+        operations = []
+        for key, bucket in pending.items():
+            update = {'$setOnInsert': {'granularity': bucket['granularity'], 'start': bucket['start']},
+                      '$set': {'updated_at': now}}
+            if bucket['granularity'] == HOUR:
+                update['$setOnInsert']['expires_at'] = bucket['start'] + timedelta(days=HOURLY_RETENTION_DAYS)
+            if bucket['inc']:
+                update['$inc'] = bucket['inc']
+            if bucket['max']:
+                update['$max'] = bucket['max']
+            operations.append(UpdateOne({'_id': key}, update, upsert=True))
+        keys = list(pending)
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+            self.stats['flushes'] += 1
+        except BulkWriteError as e:
+            # Applied buckets must not be retried (that would double count); requeue only
+            # the failed ones, e.g. a duplicate key from two workers upserting a new bucket
+            self.stats['flush_errors'] += 1
+            self._requeue({keys[error['index']]: pending[keys[error['index']]]
+                           for error in e.details.get('writeErrors', [])})
+            raise
+        except Exception:
+            self.stats['flush_errors'] += 1
+            self._requeue(pending)
+            raise
+
+    def _requeue(self, buckets: Dict[str, Dict]):
+        for key, bucket in buckets.items():
+            current = self._pending.setdefault(key, {**bucket, 'inc': {}, 'max': {}})
+            for field, value in bucket['inc'].items():
+                current['inc'][field] = current['inc'].get(field, 0) + value
+            for field, value in bucket['max'].items():
+                current['max'][field] = max(value, current['max'].get(field, 0))
+
+
+async def read_rollups(collection, granularity: str, start: datetime, end: datetime) -> Dict:
+    """
+    Buckets in [start, end) with active buyers estimated per bucket, plus range
+    totals; distinct buyers over the range come from the union of the registers.
+    Sales figures are gross bookings (see the module docstring).
+    """
+    buckets = await collection.find(
+        {'granularity': granularity, 'start': {'$gte': bucket_start(start, granularity), '$lt': end}},
+        {'_id': 0, 'expires_at': 0},
+    ).sort('start', 1).to_list(None)
+    totals = {'registrations': 0, 'sales': {}, 'discounts': {}}
+    registers = []
+    for bucket in buckets:
+        buyers = {index: int(rank) for index, rank in (bucket.pop('active_buyers', None) or {}).items()}
+        registers.append(buyers)
+        bucket['active_buyers'] = hll_estimate(buyers)
+        bucket.setdefault('registrations', 0)
+        bucket['sales'] = bucket.get('sales') or {}
+        bucket['discounts'] = bucket.get('discounts') or {}
+        totals['registrations'] += bucket['registrations']
+        _add_nested(totals['sales'], bucket['sales'])
+        _add_nested(totals['discounts'], bucket['discounts'])
+    totals['active_buyers'] = hll_estimate(hll_union(registers))
+    return {'granularity': granularity, 'start': start, 'end': end, 'sales_basis': 'gross_bookings',
+            'buckets': buckets, 'totals': totals}
@@ -0,0 +1,358 @@
+"""
+Incremental columnar export of orders, food orders (with items flattened into
+their own dataset), service bookings and the transaction ledger to
+date-partitioned Parquet, for offline analytics without mongoexport dumps.
+
+Each collection is streamed from a secondary in _id order with a projection,
+converted batch by batch into typed Arrow record batches and appended to
+    <out>/<dataset>/dt=YYYY-MM-DD/part-<run>-<n>.parquet
+Memory stays bounded by --batch-rows and --max-open-files whatever the
+collection size. Progress is a per-collection high-water mark (_id) in
+<out>/_export_state.json, advanced only after the files covering it are
+complete (written as .tmp and renamed), so an interrupted run never leaves
+partial files behind and the next run resumes where the last checkpoint left off.
+Documents newer than --lag-minutes are left for the next run: ObjectIds are
+generated client-side, and the lag also covers replication delay.
+
+The _id mark only finds new documents. Orders and transactions also carry
+updated_at, set on every status write, so for those a second mark on
+(updated_at, _id) re-exports documents changed since the last run, from the hot
+collection and from its archive (the archiver copies documents unchanged).
+Such a document then has more than one row; readers keep the row with the
+latest updated_at per id. Food orders and service bookings have no updated_at:
+they are exported once, with the status they had at the time, and later
+changes (cancellations, completions) are not picked up.
+
+Needs pyarrow (in requirements.txt); timestamps are UTC.
+
+Usage (from backend/, with MONGO_URL set):
+    python scripts/export_parquet.py --out exports/ [--collections orders,transactions] [--full]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import archive_name  # noqa: E402
+
+STATE_FILE = '_export_state.json'
+
+# Column types by name; resolved to pyarrow types once pyarrow is imported
+STRING, INT, FLOAT, TIMESTAMP = 'string', 'int64', 'float64', 'timestamp'
+
+ORDER_COLUMNS = [
+    ('id', STRING), ('buyer_id', STRING), ('seller_id', STRING), ('product_id', STRING),
+    ('quantity', INT), ('unit_price', FLOAT), ('total_amount', FLOAT), ('discount_applied', FLOAT),
+    ('final_amount', FLOAT), ('payment_currency', STRING), ('status', STRING),
+    ('created_at', TIMESTAMP), ('updated_at', TIMESTAMP),
+]
+FOOD_ORDER_COLUMNS = [
+    ('id', STRING), ('customer_id', STRING), ('restaurant_id', STRING), ('item_count', INT),
+    ('subtotal', FLOAT), ('delivery_fee', FLOAT), ('discount_applied', FLOAT), ('total_amount', FLOAT),
+    ('final_amount', FLOAT), ('payment_currency', STRING), ('status', STRING), ('created_at', TIMESTAMP),
+]
+FOOD_ORDER_ITEM_COLUMNS = [
+    ('order_id', STRING), ('line', INT), ('customer_id', STRING), ('restaurant_id', STRING),
+    ('menu_item_id', STRING), ('name', STRING), ('price', FLOAT), ('quantity', INT), ('total', FLOAT),
+    ('payment_currency', STRING), ('created_at', TIMESTAMP),
+]
+BOOKING_COLUMNS = [
+    ('id', STRING), ('service_id', STRING), ('client_id', STRING), ('provider_id', STRING),
+    ('amount', FLOAT), ('discount_applied', FLOAT), ('final_amount', FLOAT), ('payment_currency', STRING),
+    ('status', STRING), ('start_at', TIMESTAMP), ('end_at', TIMESTAMP), ('created_at', TIMESTAMP),
+]
+TRANSACTION_COLUMNS = [
+    ('id', STRING), ('user_id', STRING), ('amount', FLOAT), ('currency', STRING),
+    ('transaction_type', STRING), ('status', STRING), ('reference', STRING), ('discount_applied', FLOAT),
+    ('original_amount', FLOAT), ('created_at', TIMESTAMP), ('updated_at', TIMESTAMP),
+]
+
+
+def food_order_items(doc: Dict) -> List[Dict]:
+    return [{
+        'order_id': doc.get('id'),
+        'line': line,
+        'customer_id': doc.get('customer_id'),
+        'restaurant_id': doc.get('restaurant_id'),
+        'menu_item_id': item.get('menu_item_id'),
+        'name': item.get('name'),
+        'price': item.get('price'),
+        'quantity': item.get('quantity'),
+        'total': item.get('total'),
+        'payment_currency': doc.get('payment_currency'),
+        'created_at': doc.get('created_at'),
+    } for line, item in enumerate(doc.get('items') or [])]
+
+
+def food_order_row(doc: Dict) -> Dict:
+    return {**doc, 'item_count': len(doc.get('items') or [])}
+
+
+# collection -> [(dataset, columns, doc -> rows)]
+EXPORTS: Dict[str, List[Tuple[str, List[Tuple[str, str]], Callable[[Dict], List[Dict]]]]] = {
+    'orders': [('orders', ORDER_COLUMNS, lambda doc: [doc])],
+    'food_orders': [
+        ('food_orders', FOOD_ORDER_COLUMNS, lambda doc: [food_order_row(doc)]),
+        ('food_order_items', FOOD_ORDER_ITEM_COLUMNS, food_order_items),
+    ],
+    'service_bookings': [('service_bookings', BOOKING_COLUMNS, lambda doc: [doc])],
+    'transactions': [('transactions', TRANSACTION_COLUMNS, lambda doc: [doc])],
+}
+# Collections whose writes maintain updated_at, so changed documents can be re-exported
+CHANGE_TRACKED = ('orders', 'transactions')
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("The Parquet export needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def projection_for(collection_name: str) -> Dict[str, int]:
+    """Fields of the collection's main dataset (derived rows are built from the same fields)."""
+    _, columns, _ = EXPORTS[collection_name][0]
+    fields = {name: 1 for name, _ in columns if name != 'item_count'}
+    if collection_name == 'food_orders':
+        fields['items'] = 1
+    return fields
+
+
+def coerce(value: Any, kind: str):
+    """Tolerate the loose typing of older documents (ints stored as floats, numbers as strings)."""
+    if value is None:
+        return None
+    try:
+        if kind == FLOAT:
+            return float(value)
+        if kind == INT:
+            return int(value)
+        if kind == STRING:
+            return str(value)
+        if kind == TIMESTAMP:
+            return value if isinstance(value, datetime) else None
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
+class PartitionWriters:
+    """
+    Open ParquetWriters keyed by (dataset, date), least recently used closed
+    first. Files are written as .tmp and renamed by commit(); discard() drops them.
+    """
+
+    def __init__(self, pa, root: Path, run_id: str, max_open: int, schemas: Dict[str, Any]):
+        self.pa = pa
+        self.root = root
+        self.run_id = run_id
+        self.max_open = max_open
+        self.schemas = schemas
+        self._open: 'OrderedDict[Tuple[str, str], Tuple[Any, Path]]' = OrderedDict()
+        self._closed: List[Path] = []
+        self._sequence = 0
+        self.files_written = 0
+
+    def write(self, dataset: str, day: str, batch):
+        key = (dataset, day)
+        entry = self._open.get(key)
+        if entry is None:
+            if len(self._open) >= self.max_open:
+                _, oldest = self._open.popitem(last=False)
+                self._close(*oldest)
+            directory = self.root / dataset / f"dt={day}"
+            directory.mkdir(parents=True, exist_ok=True)
+            self._sequence += 1
+            path = directory / f"part-{self.run_id}-{self._sequence:05d}.parquet.tmp"
+            entry = self._open[key] = (
+                self.pa.parquet.ParquetWriter(str(path), self.schemas[dataset], compression='zstd'), path
+            )
+        else:
+            self._open.move_to_end(key)
+        entry[0].write_batch(batch)
+
+    def _close(self, writer, path: Path):
+        writer.close()
+        self._closed.append(path)
+
+    def commit(self):
+        while self._open:
+            _, entry = self._open.popitem(last=False)
+            self._close(*entry)
+        for path in self._closed:
+            os.replace(path, path.with_suffix(''))
+        self.files_written += len(self._closed)
+        self._closed = []
+
+    def discard(self):
+        for entry in self._open.values():
+            self._close(*entry)
+        self._open.clear()
+        for path in self._closed:
+            path.unlink(missing_ok=True)
+        self._closed = []
+
+
+def load_state(root: Path) -> Dict[str, Any]:
+    path = root / STATE_FILE
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(root: Path, state: Dict[str, Any]):
+    tmp_path = root / f"{STATE_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, root / STATE_FILE)
+
+
+def changes_key(source: str) -> str:
+    return f"{source}.updated_at"
+
+
+def export_collection(pa, db, collection_name: str, root: Path, state: Dict[str, Any], cutoff: datetime,
+                      batch_rows: int, checkpoint_rows: int, max_open: int) -> Dict[str, int]:
+    specs = EXPORTS[collection_name]
+    schemas = {
+        dataset: pa.schema([(name, {
+            STRING: pa.string(), INT: pa.int64(), FLOAT: pa.float64(), TIMESTAMP: pa.timestamp('ms'),
+        }[kind]) for name, kind in columns])
+        for dataset, columns, _ in specs
+    }
+    writers = PartitionWriters(pa, root, uuid.uuid4().hex[:8], max_open, schemas)
+    exported = 0
+
+    # Rows buffered per (dataset, day), flushed as one record batch each
+    buffers: Dict[Tuple[str, str], List[Dict]] = {}
+
+    def flush_buffers():
+        for (dataset, day), rows in buffers.items():
+            columns = next(columns for name, columns, _ in specs if name == dataset)
+            arrays = [pa.array([coerce(row.get(name), kind) for row in rows], type=schemas[dataset].field(name).type)
+                      for name, kind in columns]
+            writers.write(dataset, day, pa.RecordBatch.from_arrays(arrays, schema=schemas[dataset]))
+        buffers.clear()
+
+    def run(source: str, query: Dict, sort: List[Tuple[str, int]], mark: Callable[[Dict], Any], key: str):
+        """Export the query's documents in sort order, checkpointing mark(last document) under key."""
+        nonlocal exported
+        buffered = 0
+        since_checkpoint = 0
+        last = None
+        cursor = db[source].find(query, projection_for(collection_name)).sort(sort).batch_size(1000)
+        try:
+            for doc in cursor:
+                created_at = doc.get('created_at')
+                day = created_at.strftime('%Y-%m-%d') if isinstance(created_at, datetime) else 'unknown'
+                for dataset, _, to_rows in specs:
+                    rows = to_rows(doc)
+                    buffers.setdefault((dataset, day), []).extend(rows)
+                    buffered += len(rows)
+                last = doc
+                exported += 1
+                since_checkpoint += 1
+                if buffered >= batch_rows:
+                    flush_buffers()
+                    buffered = 0
+                if since_checkpoint >= checkpoint_rows:
+                    flush_buffers()
+                    buffered = 0
+                    writers.commit()
+                    state[key] = mark(last)
+                    save_state(root, state)
+                    since_checkpoint = 0
+            flush_buffers()
+            writers.commit()
+        except BaseException:
+            buffers.clear()
+            writers.discard()
+            raise
+        finally:
+            cursor.close()
+        if last is not None:
+            state[key] = mark(last)
+            save_state(root, state)
+
+    # New documents, in _id order
+    exported_before = state.get(collection_name)
+    query: Dict[str, Any] = {'_id': {'$lt': ObjectId.from_datetime(cutoff)}}
+    if exported_before:
+        query['_id']['$gt'] = ObjectId(exported_before)
+    run(collection_name, query, [('_id', 1)], lambda doc: str(doc['_id']), collection_name)
+
+    # Documents exported by an earlier run and changed since, in (updated_at, _id) order
+    if collection_name in CHANGE_TRACKED:
+        for source in (collection_name, archive_name(collection_name)):
+            key = changes_key(source)
+            since = state.get(key)
+            hot = source == collection_name
+            # Nothing earlier to re-export before the first run of the hot collection
+            if since and (exported_before or not hot):
+                changed_at, after_id = datetime.fromisoformat(since[0]), ObjectId(since[1])
+                query = {
+                    '$or': [{'updated_at': {'$gt': changed_at}}, {'updated_at': changed_at, '_id': {'$gt': after_id}}],
+                    'updated_at': {'$lt': cutoff},
+                }
+                if hot:
+                    # New documents were just exported as they are now
+                    query['_id'] = {'$lte': ObjectId(exported_before)}
+                run(source, query, [('updated_at', 1), ('_id', 1)],
+                    lambda doc: [doc['updated_at'].isoformat(), str(doc['_id'])], key)
+            # Every change before the cutoff is covered; the next run starts from it
+            state[key] = [cutoff.isoformat(), str(ObjectId(b'\x00' * 12))]
+            save_state(root, state)
+    return {'documents': exported, 'files': writers.files_written}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=os.environ.get('EXPORT_DIR', 'exports'))
+    parser.add_argument('--collections', default=','.join(EXPORTS))
+    parser.add_argument('--read-preference', default='secondaryPreferred')
+    parser.add_argument('--batch-rows', type=int, default=50_000, help='rows buffered before writing a row group')
+    parser.add_argument('--checkpoint-rows', type=int, default=1_000_000, help='documents between committed checkpoints')
+    parser.add_argument('--max-open-files', type=int, default=16)
+    parser.add_argument('--lag-minutes', type=float, default=10.0)
+    parser.add_argument('--full', action='store_true',
+                        help='ignore the stored high-water marks (use with a fresh --out directory)')
+    args = parser.parse_args()
+
+    pa = import_pyarrow()
+    collections = [name.strip() for name in args.collections.split(',') if name.strip()]
+    unknown = [name for name in collections if name not in EXPORTS]
+    if unknown:
+        raise SystemExit(f"Unknown collections: {', '.join(unknown)} (choose from {', '.join(EXPORTS)})")
+
+    root = Path(args.out)
+    root.mkdir(parents=True, exist_ok=True)
+    state = {} if args.full else load_state(root)
+    client = MongoClient(os.environ['MONGO_URL'], readPreference=args.read_preference)
+    db = client[os.environ.get('DB_NAME', 'commuteshare')]
+    cutoff = datetime.utcnow() - timedelta(minutes=args.lag_minutes)
+
+    for collection_name in collections:
+        started = time.perf_counter()
+        result = export_collection(pa, db, collection_name, root, state, cutoff,
+                                   args.batch_rows, args.checkpoint_rows, args.max_open_files)
+        print(f"{collection_name}: {result['documents']} documents -> {result['files']} files "
+              f"in {time.perf_counter() - started:.1f}s")
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
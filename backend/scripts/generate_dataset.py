@@ -0,0 +1,617 @@
+"""
+Seeded synthetic dataset for scale testing: users, products, services,
+restaurants, menu items, orders, service bookings, food orders, reviews and
+wallet transactions, with realistic skew:
+
+- seller, provider and restaurant popularity is Zipfian, so a few hot sellers
+  see most of the orders, like production
+- orders and bookings peak in the evening; food orders spike at lunch (and
+  dinner)
+- users are spread over CURRENCY_DATA countries (mostly NG) with COST
+  balances drawn so MEMBERSHIP_TIERS are populated from basic to platinum
+- prices and discounts follow calculate_discount, and every purchase has its
+  ledger entry
+
+Every document is derived from (seed, collection, index), so the output is
+identical for the same --seed, --documents and --end-date however many
+workers load it. Chunks are generated and written with insert_many by a pool
+of worker processes; indexes are built afterwards (--indexes), which is faster
+than maintaining them during the load. All users share the password
+"password123".
+
+Usage (from backend/, with MONGO_URL set):
+    python scripts/generate_dataset.py --documents 100000 --db-name commuteshare_scale --drop --indexes
+    python scripts/generate_dataset.py --documents 10000000 --workers 8 --db-name commuteshare_scale --drop
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from typing import Dict, List, Tuple
+
+import bcrypt
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import INDEXES  # noqa: E402
+from server import CURRENCY_DATA, MEMBERSHIP_TIERS, calculate_discount, get_membership_tier  # noqa: E402
+
+# Share of the requested documents per collection; transactions are one per
+# user (welcome bonus) plus one per order, booking and food order
+SHARES = {
+    'users': 8.0,
+    'products': 6.0,
+    'services': 2.0,
+    'restaurants': 0.2,
+    'menu_items': 2.0,
+    'orders': 18.0,
+    'service_bookings': 5.0,
+    'food_orders': 14.0,
+    'reviews': 7.8,
+}
+TRANSACTION_SHARE = SHARES['users'] + SHARES['orders'] + SHARES['service_bookings'] + SHARES['food_orders']
+# Fraction of users who sell, provide services or own a restaurant
+SELLER_FRACTION = 0.10
+PROVIDER_FRACTION = 0.04
+ZIPF_EXPONENT = 1.1
+
+COUNTRY_WEIGHTS = {'NG': 60, 'GH': 10, 'KE': 8, 'ZA': 6, 'US': 4, 'GB': 4, 'CA': 2, 'IN': 2, 'AE': 1,
+                   'EU': 1, 'AU': 0.5, 'BR': 0.5, 'MX': 0.5, 'CN': 0.3, 'JP': 0.2}
+TIER_WEIGHTS = {'basic': 80, 'bronze': 10, 'silver': 5, 'gold': 3, 'platinum': 2}
+PAYMENT_WEIGHTS = {'FIAT': 70, 'COST': 15, 'USDT': 10, 'SOL': 5}
+# Relative volume per hour of day (UTC+1 campus time is close enough for skew)
+ORDER_HOURS = [1, 1, 0.5, 0.5, 0.5, 1, 2, 3, 4, 5, 5, 6, 7, 6, 5, 5, 6, 7, 9, 10, 9, 7, 4, 2]
+FOOD_HOURS = [1, 0.5, 0.3, 0.3, 0.3, 0.5, 2, 5, 6, 3, 3, 10, 20, 18, 6, 3, 3, 6, 12, 14, 10, 5, 3, 2]
+
+FIRST_NAMES = ['Ada', 'Chinedu', 'Tunde', 'Ngozi', 'Kwame', 'Amina', 'Wanjiru', 'Thabo', 'Emeka', 'Funmi',
+               'Kofi', 'Zainab', 'Sipho', 'Yemi', 'Halima', 'David', 'Grace', 'Samuel', 'Fatima', 'Daniel']
+LAST_NAMES = ['Okafor', 'Adeyemi', 'Mensah', 'Otieno', 'Nkosi', 'Bello', 'Eze', 'Owusu', 'Ibrahim', 'Mwangi',
+              'Balogun', 'Dlamini', 'Nwosu', 'Asante', 'Kamau', 'Abubakar', 'Johnson', 'Smith', 'Okoro', 'Ali']
+UNIVERSITIES = ['University of Lagos', 'University of Ibadan', 'Obafemi Awolowo University', 'University of Ghana',
+                'University of Nairobi', 'University of Cape Town', 'Covenant University', 'Ahmadu Bello University']
+PRODUCT_CATEGORIES = {
+    'electronics': (['Phone', 'Laptop', 'Headphones', 'Power Bank', 'Calculator'], 15000, 400000),
+    'books': (['Textbook', 'Past Questions', 'Novel', 'Lab Manual'], 1500, 15000),
+    'fashion': (['Sneakers', 'Hoodie', 'Bag', 'Dress', 'Watch'], 3000, 60000),
+    'home': (['Mattress', 'Fan', 'Kettle', 'Desk Lamp', 'Bucket'], 2000, 80000),
+    'sports': (['Football', 'Jersey', 'Dumbbells', 'Yoga Mat'], 2500, 40000),
+}
+SERVICE_TYPES = {
+    'tutoring': (['Calculus Tutoring', 'Physics Lessons', 'Coding Lessons', 'Essay Review'], 2000, 15000),
+    'beauty': (['Braiding', 'Haircut', 'Makeup', 'Manicure'], 1500, 20000),
+    'repairs': (['Phone Repair', 'Laptop Repair', 'Tailoring', 'Shoe Repair'], 1000, 25000),
+    'transport': (['Campus Ride', 'Airport Drop-off', 'Moving Help'], 500, 20000),
+    'cleaning': (['Room Cleaning', 'Laundry', 'Deep Cleaning'], 1500, 12000),
+}
+CUISINES = ['Nigerian', 'Ghanaian', 'Fast Food', 'Chinese', 'Grills', 'Pastries', 'Vegetarian']
+DISHES = {'Mains': (['Jollof Rice', 'Fried Rice', 'Pounded Yam & Egusi', 'Amala & Ewedu', 'Shawarma', 'Burger'],
+                    1200, 4500),
+          'Sides': (['Plantain', 'Moi Moi', 'Coleslaw', 'Chips'], 300, 1200),
+          'Drinks': (['Zobo', 'Chapman', 'Water', 'Malt', 'Smoothie'], 200, 1500)}
+REVIEW_COMMENTS = ['Great value', 'Fast delivery', 'As described', 'Would buy again', 'Okay', 'Took too long',
+                   'Excellent service', 'Not as expected', None, None]
+
+
+class Plan:
+    """Document counts and popularity distributions shared by every worker."""
+
+    def __init__(self, documents: int, seed: int, end: datetime, days: int):
+        unit = documents / (sum(SHARES.values()) + TRANSACTION_SHARE)
+        self.counts = {name: max(1, int(share * unit)) for name, share in SHARES.items()}
+        self.seed = seed
+        self.end = end
+        self.days = days
+        users = self.counts['users']
+        self.sellers = max(1, int(users * SELLER_FRACTION))
+        self.providers = max(1, int(users * PROVIDER_FRACTION))
+        self.owners = self.counts['restaurants']
+        # Cumulative Zipf weights: index 0 is the most popular
+        self.seller_cdf = zipf_cdf(self.sellers)
+        self.provider_cdf = zipf_cdf(self.providers)
+        self.product_cdf = zipf_cdf(self.counts['products'])
+        self.service_cdf = zipf_cdf(self.counts['services'])
+        self.restaurant_cdf = zipf_cdf(self.counts['restaurants'])
+        self.password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt(rounds=4)).decode('utf-8')
+
+    def rng(self, kind: str, index: int) -> random.Random:
+        return random.Random(f"{self.seed}:{kind}:{index}")
+
+    def id_for(self, kind: str, index: int) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"commuteshare:{self.seed}:{kind}:{index}"))
+
+    def timestamp(self, rng: random.Random, hours: List[float]) -> datetime:
+        start = self.end - timedelta(days=self.days)
+        day = rng.randrange(max(1, self.days))
+        hour = rng.choices(range(24), weights=hours)[0]
+        return (start + timedelta(days=day)).replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60))
+
+
+def zipf_cdf(n: int) -> List[float]:
+    return list(itertools.accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(n)))
+
+
+def pick(rng: random.Random, cdf: List[float]) -> int:
+    return bisect.bisect_left(cdf, rng.random() * cdf[-1])
+
+
+def weighted(rng: random.Random, weights: Dict[str, float]) -> str:
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def full_name(plan: Plan, index: int) -> str:
+    rng = plan.rng('name', index)
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def tier_balance(rng: random.Random) -> float:
+    tier = weighted(rng, TIER_WEIGHTS)
+    floors = sorted(spec['min_balance'] for spec in MEMBERSHIP_TIERS.values())
+    low = MEMBERSHIP_TIERS[tier]['min_balance']
+    above = [floor for floor in floors if floor > low]
+    high = above[0] if above else low * 2
+    return round(rng.uniform(low, high - 1), 2)
+
+
+# ---- per-entity attributes, recomputed wherever another document references them ----
+
+def product_attrs(plan: Plan, index: int) -> Dict:
+    rng = plan.rng('products', index)
+    category = rng.choice(list(PRODUCT_CATEGORIES))
+    names, low, high = PRODUCT_CATEGORIES[category]
+    price = round(rng.lognormvariate(0, 0.6) * (low + high) / 4, -1)
+    return {'seller': pick(rng, plan.seller_cdf), 'category': category,
+            'title': f"{rng.choice(['Used', 'New', 'Clean', 'Mint'])} {rng.choice(names)}",
+            'price': min(max(price, low), high), 'stock': rng.choice([1, 1, 1, 2, 3, 5, 10, 25])}
+
+
+def service_attrs(plan: Plan, index: int) -> Dict:
+    rng = plan.rng('services', index)
+    service_type = rng.choice(list(SERVICE_TYPES))
+    names, low, high = SERVICE_TYPES[service_type]
+    return {'provider': plan.sellers + pick(rng, plan.provider_cdf), 'service_type': service_type,
+            'title': rng.choice(names), 'price': round(rng.uniform(low, high), -1),
+            'duration_minutes': rng.choice([30, 60, 60, 90, 120])}
+
+
+def restaurant_attrs(plan: Plan, index: int) -> Dict:
+    rng = plan.rng('restaurants', index)
+    return {'owner': plan.sellers + plan.providers + index % max(1, plan.owners),
+            'name': f"{rng.choice(LAST_NAMES)}'s {rng.choice(['Kitchen', 'Spot', 'Grill', 'Buka', 'Cafe'])}",
+            'cuisine': rng.choice(CUISINES)}
+
+
+def user_attrs(plan: Plan, index: int) -> Dict:
+    rng = plan.rng('users', index)
+    country = weighted(rng, COUNTRY_WEIGHTS)
+    return {'country': country, 'currency': CURRENCY_DATA.get(country, CURRENCY_DATA['DEFAULT']),
+            'cost_balance': tier_balance(rng) if rng.random() < 0.6 else 10.0}
+
+
+# ---- generators: (collection, start, stop) -> {collection: [docs]} ----
+
+def gen_users(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    users, transactions = [], []
+    for index in range(start, stop):
+        rng = plan.rng('users-extra', index)
+        attrs = user_attrs(plan, index)
+        created_at = plan.timestamp(rng, ORDER_HOURS) - timedelta(days=plan.days)
+        user_id = plan.id_for('users', index)
+        users.append({
+            'id': user_id,
+            'email': f"user{index}@example.test",
+            'password': plan.password_hash,
+            'full_name': full_name(plan, index),
+            'phone': f"+234{800000000 + index}",
+            'nin': None,
+            'university_name': rng.choice(UNIVERSITIES),
+            'country_code': attrs['country'],
+            'currency': attrs['currency'],
+            'is_verified': rng.random() < 0.7,
+            'wallet_balance': round(rng.lognormvariate(9, 1.2), 2),
+            'loyalty_points': rng.randrange(500),
+            'solana_wallet': None,
+            'cost_balance': attrs['cost_balance'],
+            'sol_balance': round(rng.random() * 5, 4) if rng.random() < 0.2 else 0.0,
+            'usdt_balance': round(rng.random() * 300, 2) if rng.random() < 0.3 else 0.0,
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+        transactions.append(ledger_entry(plan, 'welcome', index, user_id, 10.0, 'COST', 'deposit',
+                                         'Welcome Bonus - 10 COST tokens!', created_at))
+    return {'users': users, 'transactions': transactions}
+
+
+def gen_products(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    products = []
+    for index in range(start, stop):
+        rng = plan.rng('products-extra', index)
+        attrs = product_attrs(plan, index)
+        created_at = plan.timestamp(rng, ORDER_HOURS)
+        products.append({
+            'id': plan.id_for('products', index),
+            'seller_id': plan.id_for('users', attrs['seller']),
+            'seller_name': full_name(plan, attrs['seller']),
+            'title': attrs['title'],
+            'description': f"{attrs['title']} in good condition. Pick up on campus or delivery.",
+            'price': attrs['price'],
+            'price_in_cost': round(attrs['price'] / 10, 2) if rng.random() < 0.5 else None,
+            'category': attrs['category'],
+            'subcategory': None,
+            'condition': rng.choice(['new', 'like_new', 'used']),
+            'images': [],
+            'location': rng.choice(UNIVERSITIES),
+            'quantity': attrs['stock'],
+            'is_available': rng.random() < 0.9,
+            'views': int(rng.paretovariate(1.2) * 10),
+            'accept_cost_token': True,
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+    return {'products': products}
+
+
+def gen_services(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    services = []
+    for index in range(start, stop):
+        rng = plan.rng('services-extra', index)
+        attrs = service_attrs(plan, index)
+        services.append({
+            'id': plan.id_for('services', index),
+            'provider_id': plan.id_for('users', attrs['provider']),
+            'provider_name': full_name(plan, attrs['provider']),
+            'title': attrs['title'],
+            'description': f"{attrs['title']} by an experienced student provider.",
+            'price': attrs['price'],
+            'price_in_cost': round(attrs['price'] / 10, 2) if rng.random() < 0.5 else None,
+            'service_type': attrs['service_type'],
+            'duration': f"{attrs['duration_minutes']} minutes",
+            'duration_minutes': attrs['duration_minutes'],
+            'images': [],
+            'location': rng.choice(UNIVERSITIES),
+            'availability': 'Weekdays 9am - 6pm',
+            'rating': round(rng.uniform(3.5, 5.0), 1),
+            'total_reviews': rng.randrange(50),
+            'is_available': rng.random() < 0.9,
+            'accept_cost_token': True,
+            'created_at': plan.timestamp(rng, ORDER_HOURS),
+        })
+    return {'services': services}
+
+
+def gen_restaurants(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    restaurants = []
+    for index in range(start, stop):
+        rng = plan.rng('restaurants-extra', index)
+        attrs = restaurant_attrs(plan, index)
+        restaurants.append({
+            'id': plan.id_for('restaurants', index),
+            'owner_id': plan.id_for('users', attrs['owner']),
+            'name': attrs['name'],
+            'description': f"{attrs['cuisine']} meals near campus.",
+            'cuisine_type': attrs['cuisine'],
+            'address': rng.choice(UNIVERSITIES),
+            'phone': f"+234{700000000 + index}",
+            'opening_hours': '8am - 10pm',
+            'image': None,
+            'rating': round(rng.uniform(3.0, 5.0), 1),
+            'total_reviews': rng.randrange(200),
+            'is_open': rng.random() < 0.85,
+            'is_verified': rng.random() < 0.5,
+            'accept_cost_token': True,
+            'created_at': plan.timestamp(rng, ORDER_HOURS),
+        })
+    return {'restaurants': restaurants}
+
+
+def menu_attrs(plan: Plan, index: int) -> Dict:
+    rng = plan.rng('menu_items', index)
+    category = rng.choice(list(DISHES))
+    names, low, high = DISHES[category]
+    return {'restaurant': index % plan.counts['restaurants'], 'category': category,
+            'name': rng.choice(names), 'price': round(rng.uniform(low, high), -1)}
+
+
+def gen_menu_items(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    items = []
+    for index in range(start, stop):
+        attrs = menu_attrs(plan, index)
+        items.append({
+            'id': plan.id_for('menu_items', index),
+            'restaurant_id': plan.id_for('restaurants', attrs['restaurant']),
+            'name': attrs['name'],
+            'description': f"{attrs['name']}, freshly made.",
+            'price': attrs['price'],
+            'price_in_cost': round(attrs['price'] / 10, 2),
+            'category': attrs['category'],
+            'image': None,
+            'is_available': True,
+            'created_at': plan.end - timedelta(days=plan.days),
+        })
+    return {'menu_items': items}
+
+
+def status_for(rng: random.Random, created_at: datetime, end: datetime, statuses: List[str], done: str) -> str:
+    """Older documents are mostly settled; recent ones are spread over the open statuses."""
+    if end - created_at > timedelta(days=3):
+        return done if rng.random() < 0.92 else 'cancelled'
+    return rng.choice(statuses)
+
+
+def buyer_for(plan: Plan, rng: random.Random, seller_index: int) -> Tuple[int, Dict]:
+    buyer = rng.randrange(plan.counts['users'])
+    if buyer == seller_index:
+        buyer = (buyer + 1) % plan.counts['users']
+    return buyer, user_attrs(plan, buyer)
+
+
+def price(buyer: Dict, currency: str, amount: float) -> Tuple[float, float]:
+    _, discount, final = calculate_discount({'cost_balance': buyer['cost_balance']}, currency, amount)
+    return round(discount, 2), round(final, 2)
+
+
+def ledger_entry(plan: Plan, kind: str, index: int, user_id: str, amount: float, currency: str,
+                 transaction_type: str, description: str, created_at: datetime, discount: float = 0.0,
+                 original: float = 0.0) -> Dict:
+    return {
+        'id': plan.id_for(f"transactions-{kind}", index),
+        'user_id': user_id,
+        'amount': amount,
+        'currency': currency,
+        'transaction_type': transaction_type,
+        'description': description,
+        'status': 'completed',
+        'reference': f"{kind[:3].upper()}-{index:08d}",
+        'discount_applied': discount,
+        'original_amount': original,
+        'created_at': created_at,
+    }
+
+
+def gen_orders(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    orders, transactions = [], []
+    for index in range(start, stop):
+        rng = plan.rng('orders', index)
+        product = pick(rng, plan.product_cdf)
+        attrs = product_attrs(plan, product)
+        buyer, buyer_attrs = buyer_for(plan, rng, attrs['seller'])
+        currency = weighted(rng, PAYMENT_WEIGHTS)
+        quantity = 1 if rng.random() < 0.85 else rng.randint(2, 3)
+        total = attrs['price'] * quantity
+        discount, final = price(buyer_attrs, currency, total)
+        created_at = plan.timestamp(rng, ORDER_HOURS)
+        order_id = plan.id_for('orders', index)
+        buyer_id = plan.id_for('users', buyer)
+        orders.append({
+            'id': order_id,
+            'buyer_id': buyer_id,
+            'buyer_name': full_name(plan, buyer),
+            'seller_id': plan.id_for('users', attrs['seller']),
+            'seller_name': full_name(plan, attrs['seller']),
+            'product_id': plan.id_for('products', product),
+            'product_title': attrs['title'],
+            'product_image': None,
+            'quantity': quantity,
+            'unit_price': attrs['price'],
+            'total_amount': total,
+            'discount_applied': discount,
+            'final_amount': final,
+            'payment_currency': currency,
+            'delivery_address': rng.choice(UNIVERSITIES),
+            'notes': None,
+            'status': status_for(rng, created_at, plan.end, ['pending', 'confirmed', 'in_transit'], 'delivered'),
+            'checkout_id': None,
+            'items': [],
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+        transactions.append(ledger_entry(plan, 'orders', index, buyer_id, final, currency, 'purchase',
+                                         f"Purchase: {attrs['title']}", created_at, discount, total))
+    return {'orders': orders, 'transactions': transactions}
+
+
+def gen_service_bookings(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    bookings, transactions = [], []
+    for index in range(start, stop):
+        rng = plan.rng('service_bookings', index)
+        service = pick(rng, plan.service_cdf)
+        attrs = service_attrs(plan, service)
+        client, client_attrs = buyer_for(plan, rng, attrs['provider'])
+        currency = weighted(rng, PAYMENT_WEIGHTS)
+        discount, final = price(client_attrs, currency, attrs['price'])
+        created_at = plan.timestamp(rng, ORDER_HOURS)
+        start_at = (created_at + timedelta(days=rng.randint(1, 7))).replace(
+            hour=rng.randint(9, 17), minute=0, second=0, microsecond=0)
+        client_id = plan.id_for('users', client)
+        bookings.append({
+            'id': plan.id_for('service_bookings', index),
+            'service_id': plan.id_for('services', service),
+            'service_title': attrs['title'],
+            'client_id': client_id,
+            'client_name': full_name(plan, client),
+            'provider_id': plan.id_for('users', attrs['provider']),
+            'provider_name': full_name(plan, attrs['provider']),
+            'scheduled_date': start_at.strftime('%Y-%m-%d'),
+            'scheduled_time': start_at.strftime('%H:%M'),
+            'start_at': start_at,
+            'end_at': start_at + timedelta(minutes=attrs['duration_minutes']),
+            'notes': None,
+            'location': rng.choice(UNIVERSITIES),
+            'amount': attrs['price'],
+            'discount_applied': discount,
+            'final_amount': final,
+            'payment_currency': currency,
+            'status': status_for(rng, created_at, plan.end, ['pending', 'confirmed', 'in_progress'], 'completed'),
+            'created_at': created_at,
+        })
+        transactions.append(ledger_entry(plan, 'bookings', index, client_id, final, currency, 'purchase',
+                                         f"Service booking: {attrs['title']}", created_at, discount,
+                                         attrs['price']))
+    return {'service_bookings': bookings, 'transactions': transactions}
+
+
+def gen_food_orders(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    orders, transactions = [], []
+    menu_count = plan.counts['menu_items']
+    restaurant_count = plan.counts['restaurants']
+    for index in range(start, stop):
+        rng = plan.rng('food_orders', index)
+        restaurant = pick(rng, plan.restaurant_cdf)
+        attrs = restaurant_attrs(plan, restaurant)
+        customer, customer_attrs = buyer_for(plan, rng, attrs['owner'])
+        currency = weighted(rng, PAYMENT_WEIGHTS)
+        items = []
+        # Menu item i belongs to restaurant i % restaurant_count
+        for _ in range(rng.choice([1, 1, 2, 2, 3, 4])):
+            slot = rng.randrange(max(1, menu_count // restaurant_count))
+            menu_index = min(slot * restaurant_count + restaurant, menu_count - 1)
+            menu = menu_attrs(plan, menu_index)
+            quantity = rng.choice([1, 1, 1, 2])
+            items.append({'menu_item_id': plan.id_for('menu_items', menu_index), 'name': menu['name'],
+                          'price': menu['price'], 'quantity': quantity, 'total': menu['price'] * quantity})
+        subtotal = sum(item['total'] for item in items)
+        total = subtotal + 200.0
+        discount, final = price(customer_attrs, currency, total)
+        created_at = plan.timestamp(rng, FOOD_HOURS)
+        customer_id = plan.id_for('users', customer)
+        orders.append({
+            'id': plan.id_for('food_orders', index),
+            'customer_id': customer_id,
+            'customer_name': full_name(plan, customer),
+            'restaurant_id': plan.id_for('restaurants', restaurant),
+            'restaurant_name': attrs['name'],
+            'items': items,
+            'subtotal': subtotal,
+            'delivery_fee': 200.0,
+            'discount_applied': discount,
+            'total_amount': total,
+            'final_amount': final,
+            'payment_currency': currency,
+            'delivery_address': rng.choice(UNIVERSITIES),
+            'notes': None,
+            'status': status_for(rng, created_at, plan.end, ['pending', 'preparing', 'ready', 'in_transit'],
+                                 'delivered'),
+            'created_at': created_at,
+        })
+        transactions.append(ledger_entry(plan, 'food', index, customer_id, final, currency, 'purchase',
+                                         f"Food order: {attrs['name']}", created_at, discount, total))
+    return {'food_orders': orders, 'transactions': transactions}
+
+
+def gen_reviews(plan: Plan, start: int, stop: int) -> Dict[str, List[Dict]]:
+    reviews = []
+    for index in range(start, stop):
+        rng = plan.rng('reviews', index)
+        target_type = rng.choices(['product', 'service', 'restaurant'], weights=[5, 2, 3])[0]
+        cdf = {'product': plan.product_cdf, 'service': plan.service_cdf, 'restaurant': plan.restaurant_cdf}[target_type]
+        target = pick(rng, cdf)
+        reviewer = rng.randrange(plan.counts['users'])
+        reviews.append({
+            'id': plan.id_for('reviews', index),
+            'user_id': plan.id_for('users', reviewer),
+            'user_name': full_name(plan, reviewer),
+            'target_id': plan.id_for(f"{target_type}s", target),
+            'target_type': target_type,
+            'rating': rng.choices([1, 2, 3, 4, 5], weights=[4, 4, 10, 30, 52])[0],
+            'comment': rng.choice(REVIEW_COMMENTS),
+            'created_at': plan.timestamp(rng, ORDER_HOURS),
+        })
+    return {'reviews': reviews}
+
+
+GENERATORS = {
+    'users': gen_users,
+    'products': gen_products,
+    'services': gen_services,
+    'restaurants': gen_restaurants,
+    'menu_items': gen_menu_items,
+    'orders': gen_orders,
+    'service_bookings': gen_service_bookings,
+    'food_orders': gen_food_orders,
+    'reviews': gen_reviews,
+}
+
+# Set in each worker process by init_worker
+_plan = None
+_db = None
+
+
+def init_worker(mongo_url: str, db_name: str, plan: Plan):
+    global _plan, _db
+    _plan = plan
+    _db = MongoClient(mongo_url, w=1)[db_name]
+
+
+def load_chunk(task: Tuple[str, int, int]) -> Dict[str, int]:
+    kind, start, stop = task
+    written = {}
+    for collection, docs in GENERATORS[kind](_plan, start, stop).items():
+        if docs:
+            _db[collection].insert_many(docs, ordered=False)
+        written[collection] = len(docs)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'commuteshare_scale'))
+    parser.add_argument('--documents', type=int, default=100000, help='approximate total documents (10k-10M)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end-date', default='2026-01-01', help='newest activity date (YYYY-MM-DD)')
+    parser.add_argument('--days', type=int, default=180, help='days of activity before --end-date')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--drop', action='store_true', help='drop the target database first')
+    parser.add_argument('--indexes', action='store_true', help='build the API indexes after loading')
+    args = parser.parse_args()
+
+    plan = Plan(args.documents, args.seed, datetime.strptime(args.end_date, '%Y-%m-%d'), args.days)
+    client = MongoClient(args.mongo_url)
+    if args.drop:
+        client.drop_database(args.db_name)
+    transactions = plan.counts['users'] + plan.counts['orders'] + plan.counts['service_bookings'] + \
+        plan.counts['food_orders']
+    print(f"Generating ~{sum(plan.counts.values()) + transactions} documents into {args.db_name} "
+          f"with {args.workers} workers (seed {args.seed})")
+    for name, count in plan.counts.items():
+        print(f"  {name:<18}{count:>10}")
+    print(f"  {'transactions':<18}{transactions:>10}")
+
+    tasks = [(kind, start, min(start + args.chunk_size, count))
+             for kind, count in plan.counts.items() for start in range(0, count, args.chunk_size)]
+    totals: Dict[str, int] = {}
+    started = time.perf_counter()
+    with Pool(args.workers, initializer=init_worker, initargs=(args.mongo_url, args.db_name, plan)) as pool:
+        for written in pool.imap_unordered(load_chunk, tasks):
+            for collection, count in written.items():
+                totals[collection] = totals.get(collection, 0) + count
+            loaded = sum(totals.values())
+            elapsed = time.perf_counter() - started
+            print(f"\r  {loaded} documents, {loaded / elapsed:,.0f} docs/s", end='', flush=True)
+    elapsed = time.perf_counter() - started
+    loaded = sum(totals.values())
+    print(f"\nLoaded {loaded} documents in {elapsed:.1f}s ({loaded / elapsed:,.0f} docs/s)")
+
+    if args.indexes:
+        started = time.perf_counter()
+        db = client[args.db_name]
+        for collection in totals:
+            db[collection].create_indexes(INDEXES[collection])
+        print(f"Built indexes in {time.perf_counter() - started:.1f}s")
+
+    tiers: Dict[str, int] = {}
+    for user in client[args.db_name].users.find({}, {'_id': 0, 'cost_balance': 1}).limit(10000):
+        tier = get_membership_tier(user['cost_balance'])['tier']
+        tiers[tier] = tiers.get(tier, 0) + 1
+    print(f"Membership tiers (first 10k users): {tiers}")
+
+
+if __name__ == '__main__':
+    main()
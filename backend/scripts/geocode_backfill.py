@@ -0,0 +1,98 @@
+"""
+Backfill geo_location on restaurants, products and services from their free-text
+address/location using a local gazetteer file, so no external geocoder is hit.
+
+Gazetteer: CSV with a header row `name,latitude,longitude`, one place per line,
+e.g. `Moremi Hall UNILAG,6.5170,3.3975`. An address matches a place when its
+normalized text equals the place name or contains it; the longest match wins.
+
+Usage (from backend/, with MONGO_URL set):
+    python scripts/geocode_backfill.py gazetteer.csv [--dry-run]
+"""
+import argparse
+import csv
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import MongoClient, UpdateOne
+
+# collection -> free-text field to geocode
+SOURCES = {
+    'restaurants': 'address',
+    'products': 'location',
+    'services': 'location',
+}
+BATCH_SIZE = 500
+
+
+def normalize(text: str) -> str:
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+
+def load_gazetteer(path: str) -> List[Tuple[str, List[float]]]:
+    places = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            name = normalize(row['name'])
+            if name:
+                places.append((name, [float(row['longitude']), float(row['latitude'])]))
+    # Longest names first so "moremi hall unilag" beats "unilag"
+    places.sort(key=lambda place: len(place[0]), reverse=True)
+    return places
+
+
+def geocode(address: str, exact: Dict[str, List[float]], places: List[Tuple[str, List[float]]]) -> Optional[List[float]]:
+    text = normalize(address)
+    if text in exact:
+        return exact[text]
+    padded = f' {text} '
+    for name, coordinates in places:
+        if f' {name} ' in padded:
+            return coordinates
+    return None
+
+
+def backfill(db, places, dry_run: bool):
+    exact = dict(places)
+    for collection_name, field in SOURCES.items():
+        collection = db[collection_name]
+        cursor = collection.find(
+            {'geo_location': None, field: {'$nin': [None, '']}},
+            {'_id': 1, field: 1},
+        ).batch_size(BATCH_SIZE)
+        matched = unmatched = 0
+        batch = []
+        for doc in cursor:
+            coordinates = geocode(doc[field], exact, places)
+            if coordinates is None:
+                unmatched += 1
+                continue
+            matched += 1
+            batch.append(UpdateOne(
+                {'_id': doc['_id']},
+                {'$set': {'geo_location': {'type': 'Point', 'coordinates': coordinates}}},
+            ))
+            if len(batch) >= BATCH_SIZE:
+                if not dry_run:
+                    collection.bulk_write(batch, ordered=False)
+                batch = []
+        if batch and not dry_run:
+            collection.bulk_write(batch, ordered=False)
+        print(f"{collection_name}: {matched} geocoded, {unmatched} unmatched")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('gazetteer')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'commuteshare')]
+    backfill(db, load_gazetteer(args.gazetteer), args.dry_run)
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
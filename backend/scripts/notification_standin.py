@@ -0,0 +1,126 @@
+"""
+Local stand-in for the push, SMS and email providers used by notifications.py.
+Every accepted message is recorded; GET /_received returns per-channel counts
+and the messages per recipient, DELETE /_received clears them. Latency, 5xx
+errors and 429 rate limiting can be injected like the Solana RPC stand-in.
+
+POST /push takes an Expo-style JSON array and answers with one ticket per
+message (tokens not shaped like "ExponentPushToken[...]" get an error ticket);
+POST /sms takes {"to", "body"}; POST /email takes {"messages": [...]}.
+
+Usage (from backend/):
+    python scripts/notification_standin.py --port 8898 [--latency-ms 50] [--error-rate 0.05] [--max-rps 50]
+    NOTIFY_PUSH_URL=http://localhost:8898/push NOTIFY_SMS_URL=http://localhost:8898/sms \\
+        NOTIFY_EMAIL_URL=http://localhost:8898/email uvicorn server:app --port 8001
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import defaultdict
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+STATE = {'received': defaultdict(list), 'counts': defaultdict(int), 'requests': defaultdict(int)}
+FAULTS = {'latency_ms': 0.0, 'error_rate': 0.0, 'max_rps': 0, 'window': [0, 0.0]}
+
+
+async def inject_faults():
+    """A response to return instead of handling the request, or None."""
+    now = time.monotonic()
+    window = FAULTS['window']
+    if now - window[1] >= 1:
+        window[:] = [0, now]
+    window[0] += 1
+    if FAULTS['max_rps'] and window[0] > FAULTS['max_rps']:
+        return JSONResponse({'error': 'Too many requests'}, status_code=429, headers={'Retry-After': '1'})
+    if FAULTS['latency_ms']:
+        await asyncio.sleep(FAULTS['latency_ms'] / 1000 * random.uniform(0.5, 1.5))
+    if random.random() < FAULTS['error_rate']:
+        return JSONResponse({'error': 'Internal error'}, status_code=503)
+    return None
+
+
+def record(channel: str, message: dict):
+    STATE['counts'][channel] += 1
+    STATE['received'][message.get('to')].append({'channel': channel, **message})
+
+
+async def push(request: Request):
+    STATE['requests']['push'] += 1
+    faulted = await inject_faults()
+    if faulted is not None:
+        return faulted
+    messages = await request.json()
+    if not isinstance(messages, list) or len(messages) > 100:
+        return JSONResponse({'errors': [{'code': 'VALIDATION_ERROR', 'message': 'Send 1-100 messages'}]},
+                            status_code=400)
+    tickets = []
+    for message in messages:
+        if str(message.get('to', '')).startswith('ExponentPushToken['):
+            record('push', message)
+            tickets.append({'status': 'ok', 'id': str(uuid.uuid4())})
+        else:
+            tickets.append({'status': 'error', 'message': 'Not a registered push token',
+                            'details': {'error': 'DeviceNotRegistered'}})
+    return JSONResponse({'data': tickets})
+
+
+async def sms(request: Request):
+    STATE['requests']['sms'] += 1
+    faulted = await inject_faults()
+    if faulted is not None:
+        return faulted
+    message = await request.json()
+    if not message.get('to') or not message.get('body'):
+        return JSONResponse({'error': 'to and body are required'}, status_code=400)
+    record('sms', message)
+    return JSONResponse({'id': str(uuid.uuid4()), 'status': 'queued'})
+
+
+async def email(request: Request):
+    STATE['requests']['email'] += 1
+    faulted = await inject_faults()
+    if faulted is not None:
+        return faulted
+    body = await request.json()
+    for message in body.get('messages', []):
+        record('email', message)
+    return JSONResponse({'accepted': len(body.get('messages', []))})
+
+
+async def received(request: Request):
+    if request.method == 'DELETE':
+        for value in STATE.values():
+            value.clear()
+        return JSONResponse({'cleared': True})
+    return JSONResponse({'counts': STATE['counts'], 'requests': STATE['requests'], 'messages': STATE['received']})
+
+
+app = Starlette(routes=[
+    Route('/push', push, methods=['POST']),
+    Route('/sms', sms, methods=['POST']),
+    Route('/email', email, methods=['POST']),
+    Route('/_received', received, methods=['GET', 'DELETE']),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8898)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--max-rps', type=int, default=0)
+    args = parser.parse_args()
+
+    FAULTS.update(latency_ms=args.latency_ms, error_rate=args.error_rate, max_rps=args.max_rps)
+    uvicorn.run(app, host='127.0.0.1', port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+Local stand-in for a Solana JSON-RPC node, for exercising solana_rpc.py, the
+deposit watcher and the withdrawal queue without a cluster. Balances are
+deterministic per address (or loaded from a fixture), and latency, 5xx errors
+and 429 rate limiting can be injected. POST /_transfer {"to": <wallet>,
+"amount": <ui amount>, "mint": <optional>} records a finalized transfer that
+getSignaturesForAddress/getTransaction then serve.
+
+sendTransaction checks size and blockhash validity, then "lands" the
+transaction: it is confirmed at once and finalized after --finality-ms.
+--drop-rate silently loses sent transactions (they expire) and --fail-rate
+lands them with an InstructionError on a random transfer.
+
+Fixture (optional JSON): {"accounts": {"<pubkey>": <lamports>},
+                          "tokens": {"<owner>": {"<mint>": <ui amount>}}}
+
+Usage (from backend/):
+    python scripts/solana_rpc_standin.py --port 8899 [--latency-ms 50] [--error-rate 0.05] [--max-rps 20] \\
+        [--drop-rate 0.05] [--fail-rate 0.01] [--finality-ms 800]
+    SOLANA_RPC_URL=http://localhost:8899 uvicorn server:app --port 8001
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+STATE = {'accounts': {}, 'tokens': {}, 'slot': 250_000_000, 'transactions': {}, 'signatures': {},
+         'blockhashes': {}, 'sent': {}}
+FAUCET = '9WzDXwBbmkg8ZTbNMqUxvQRAyrZzDsGYdLVL9zYtAWWM'
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+TOKEN_DECIMALS = 6
+FAULTS = {'latency_ms': 0.0, 'error_rate': 0.0, 'max_rps': 0, 'window': [0, 0.0],
+          'drop_rate': 0.0, 'fail_rate': 0.0, 'finality_ms': 800.0}
+# Block height trails the slot (skipped slots); a blockhash is valid for 150 blocks
+BLOCK_HEIGHT_OFFSET = 12_000_000
+BLOCKHASH_VALIDITY = 150
+PACKET_DATA_SIZE = 1232
+
+
+def base58(data: bytes) -> str:
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+    return '1' * (len(data) - len(data.lstrip(b'\0'))) + encoded
+
+
+def token_account(owner: str, mint: str) -> str:
+    return base58(hashlib.sha256(f"ata:{owner}:{mint}".encode()).digest())
+
+
+def default_lamports(pubkey: str) -> int:
+    """Stable pseudo-random balance so repeated syncs see the same chain state."""
+    return int(hashlib.sha256(pubkey.encode()).hexdigest()[:8], 16) % (50 * 1_000_000_000)
+
+
+def lamports_of(pubkey: str) -> int:
+    return STATE['accounts'].get(pubkey, default_lamports(pubkey))
+
+
+def token_amount(owner: str, mint: str) -> float:
+    owned = STATE['tokens'].setdefault(owner, {})
+    if mint not in owned:
+        owned[mint] = int(hashlib.sha256(f"{owner}:{mint}".encode()).hexdigest()[:6], 16) % 100000 / 100
+    return owned[mint]
+
+
+def ui_token_amount(amount: float) -> dict:
+    return {'amount': str(int(round(amount * 10 ** TOKEN_DECIMALS))), 'decimals': TOKEN_DECIMALS,
+            'uiAmount': amount, 'uiAmountString': str(amount)}
+
+
+def record_transfer(to: str, amount: float, mint: str = None) -> str:
+    """Apply a faucet -> wallet transfer and index it like a finalized transaction."""
+    STATE['slot'] += 1
+    signature = base58(random.getrandbits(512).to_bytes(64, 'big'))
+    if mint:
+        account = token_account(to, mint)
+        before = token_amount(to, mint)
+        STATE['tokens'][to][mint] = round(before + amount, TOKEN_DECIMALS)
+        keys = [FAUCET, account, to]
+        pre = post = [10 ** 12, 2039280, lamports_of(to)]
+        pre_tokens = [{'accountIndex': 1, 'mint': mint, 'owner': to, 'uiTokenAmount': ui_token_amount(before)}]
+        post_tokens = [{'accountIndex': 1, 'mint': mint, 'owner': to,
+                        'uiTokenAmount': ui_token_amount(STATE['tokens'][to][mint])}]
+        addresses = [FAUCET, account, to]
+    else:
+        lamports = int(round(amount * 1_000_000_000))
+        before = lamports_of(to)
+        STATE['accounts'][to] = before + lamports
+        keys, pre, post = [FAUCET, to], [10 ** 12, before], [10 ** 12 - lamports - 5000, before + lamports]
+        pre_tokens, post_tokens = [], []
+        addresses = [FAUCET, to]
+    STATE['transactions'][signature] = {
+        'slot': STATE['slot'],
+        'blockTime': int(time.time()),
+        'meta': {'err': None, 'fee': 5000, 'preBalances': pre, 'postBalances': post,
+                 'preTokenBalances': pre_tokens, 'postTokenBalances': post_tokens},
+        'transaction': {'signatures': [signature], 'message': {
+            'accountKeys': [{'pubkey': key, 'signer': key == FAUCET, 'writable': True} for key in keys],
+        }},
+    }
+    for address in addresses:
+        STATE['signatures'].setdefault(address, []).insert(0, {
+            'signature': signature, 'slot': STATE['slot'], 'err': None, 'memo': None,
+            'blockTime': int(time.time()), 'confirmationStatus': 'finalized',
+        })
+    return signature
+
+
+def signatures_for(address: str, options: dict) -> list:
+    """Newest first, honouring before/until/limit like the real node."""
+    entries = STATE['signatures'].get(address, [])
+    start = 0
+    if options.get('before'):
+        start = next((i + 1 for i, e in enumerate(entries) if e['signature'] == options['before']), len(entries))
+    page = []
+    for entry in entries[start:]:
+        if entry['signature'] == options.get('until') or len(page) >= options.get('limit', 1000):
+            break
+        page.append(entry)
+    return page
+
+
+def block_height() -> int:
+    return STATE['slot'] - BLOCK_HEIGHT_OFFSET
+
+
+def compact_u16(data: bytes, offset: int):
+    value, shift = 0, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def send_transaction(wire_b64: str) -> str:
+    """Validate a legacy transaction's size and blockhash, then land, fail or drop it."""
+    wire = base64.b64decode(wire_b64)
+    if len(wire) > PACKET_DATA_SIZE:
+        raise ValueError(f'transaction too large: {len(wire)} bytes')
+    signature_count, offset = compact_u16(wire, 0)
+    signature = base58(wire[offset:offset + 64])
+    offset += 64 * signature_count + 3
+    key_count, offset = compact_u16(wire, offset)
+    offset += 32 * key_count
+    blockhash = base58(wire[offset:offset + 32])
+    offset += 32
+    if signature in STATE['sent']:
+        return signature
+    if STATE['blockhashes'].get(blockhash, -1) < block_height():
+        raise PermissionError('Transaction simulation failed: Blockhash not found')
+    if random.random() < FAULTS['drop_rate']:
+        return signature  # accepted but never lands; the client sees it expire
+    err = None
+    if random.random() < FAULTS['fail_rate']:
+        instruction_count, _ = compact_u16(wire, offset)
+        err = {'InstructionError': [random.randrange(2, max(3, instruction_count)), {'Custom': 1}]}
+    STATE['sent'][signature] = {'slot': STATE['slot'], 'err': err, 'landed_at': time.monotonic()}
+    return signature
+
+
+def signature_status(signature: str):
+    sent = STATE['sent'].get(signature)
+    if sent is None:
+        return None
+    finalized = (time.monotonic() - sent['landed_at']) * 1000 >= FAULTS['finality_ms']
+    return {'slot': sent['slot'], 'confirmations': None if finalized else STATE['slot'] - sent['slot'],
+            'err': sent['err'], 'status': {'Err': sent['err']} if sent['err'] else {'Ok': None},
+            'confirmationStatus': 'finalized' if finalized else 'confirmed'}
+
+
+def account_info(lamports: int) -> dict:
+    return {'lamports': lamports, 'owner': '11111111111111111111111111111111', 'data': ['', 'base64'],
+            'executable': False, 'rentEpoch': 0, 'space': 0}
+
+
+def context(value) -> dict:
+    return {'context': {'slot': STATE['slot']}, 'value': value}
+
+
+def handle(method: str, params: list):
+    if method == 'getSlot':
+        return STATE['slot']
+    if method == 'getSignaturesForAddress':
+        return signatures_for(params[0], params[1] if len(params) > 1 else {})
+    if method == 'getTransaction':
+        return STATE['transactions'].get(params[0])
+    if method == 'getBalance':
+        return context(lamports_of(params[0]))
+    if method == 'getMultipleAccounts':
+        if len(params[0]) > 100:
+            raise ValueError('Too many inputs provided; max 100')
+        return context([account_info(lamports_of(pubkey)) for pubkey in params[0]])
+    if method == 'getTokenAccountsByOwner':
+        owner, mint = params[0], params[1].get('mint')
+        amount = token_amount(owner, mint)
+        return context([{
+            'pubkey': token_account(owner, mint),
+            'account': {
+                'lamports': 2039280,
+                'data': {'program': 'spl-token', 'parsed': {'type': 'account', 'info': {
+                    'mint': mint, 'owner': owner,
+                    'tokenAmount': ui_token_amount(amount),
+                }}},
+            },
+        }])
+    if method == 'getBlockHeight':
+        return block_height()
+    if method == 'getLatestBlockhash':
+        blockhash = base58(random.getrandbits(256).to_bytes(32, 'big'))
+        STATE['blockhashes'][blockhash] = block_height() + BLOCKHASH_VALIDITY
+        return context({'blockhash': blockhash, 'lastValidBlockHeight': STATE['blockhashes'][blockhash]})
+    if method == 'getRecentPrioritizationFees':
+        return [{'slot': STATE['slot'] - i, 'prioritizationFee': random.choice([0, 0, 1000, 5000, 20000])}
+                for i in range(150)]
+    if method == 'getTokenSupply':
+        return context({'amount': str(10 ** 15), 'decimals': TOKEN_DECIMALS, 'uiAmountString': str(10 ** 9)})
+    if method == 'sendTransaction':
+        return send_transaction(params[0])
+    if method == 'getSignatureStatuses':
+        if len(params[0]) > 256:
+            raise ValueError('Too many inputs provided; max 256')
+        return context([signature_status(signature) for signature in params[0]])
+    raise LookupError(method)
+
+
+def respond(request: dict) -> dict:
+    base = {'jsonrpc': '2.0', 'id': request.get('id')}
+    try:
+        return {**base, 'result': handle(request['method'], request.get('params', []))}
+    except LookupError:
+        return {**base, 'error': {'code': -32601, 'message': 'Method not found'}}
+    except PermissionError as e:
+        return {**base, 'error': {'code': -32002, 'message': str(e)}}
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        return {**base, 'error': {'code': -32602, 'message': f'Invalid params: {e}'}}
+
+
+async def rpc(request: Request):
+    now = time.monotonic()
+    window = FAULTS['window']
+    if now - window[1] >= 1:
+        window[:] = [0, now]
+    window[0] += 1
+    if FAULTS['max_rps'] and window[0] > FAULTS['max_rps']:
+        return JSONResponse({'error': 'Too many requests'}, status_code=429, headers={'Retry-After': '1'})
+    if FAULTS['latency_ms']:
+        await asyncio.sleep(FAULTS['latency_ms'] / 1000 * random.uniform(0.5, 1.5))
+    if random.random() < FAULTS['error_rate']:
+        return JSONResponse({'error': 'Internal error'}, status_code=503)
+
+    payload = await request.json()
+    STATE['slot'] += 1
+    if isinstance(payload, list):
+        return JSONResponse([respond(item) for item in payload])
+    return JSONResponse(respond(payload))
+
+
+async def transfer(request: Request):
+    body = await request.json()
+    signature = record_transfer(body['to'], float(body['amount']), body.get('mint'))
+    return JSONResponse({'signature': signature, 'slot': STATE['slot']})
+
+
+app = Starlette(routes=[Route('/', rpc, methods=['POST']), Route('/_transfer', transfer, methods=['POST'])])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--fixture')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--max-rps', type=int, default=0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--finality-ms', type=float, default=800.0)
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture) as f:
+            fixture = json.load(f)
+        STATE['accounts'].update(fixture.get('accounts', {}))
+        STATE['tokens'].update(fixture.get('tokens', {}))
+    FAULTS.update(latency_ms=args.latency_ms, error_rate=args.error_rate, max_rps=args.max_rps,
+                  drop_rate=args.drop_rate, fail_rate=args.fail_rate, finality_ms=args.finality_ms)
+    uvicorn.run(app, host='127.0.0.1', port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,66 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, WebSocket, WebSocketDisconnect, Request, Header, Query
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import time
+import asyncio
+import hashlib
+import hmac
+import json
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, validator
-from typing import List, Optional, Dict, Any
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
+from typing import TYPE_CHECKING, List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 import jwt
 import bcrypt
 import re
-import base64
-import httpx
+from contextlib import asynccontextmanager
+
+from cache import CacheRegistry, ChangeStreamInvalidator, LocalCache
+from activity import activity_page
+from archive import COLLECTION_SINK, ArchiveSettings, Archiver, find_history
+from availability import (
+    ACTIVE_BOOKING_STATUSES, DEFAULT_DURATION_MINUTES, MAX_AVAILABILITY_RANGE_DAYS, SlotReservations,
+    free_slots, local_now, parse_duration_minutes, parse_time_of_day, to_local, within_rules,
+)
+from database import Database
+from solana_rpc import BalanceSyncScheduler, SolanaRpcClient, is_valid_pubkey
+from deadline import CircuitBreaker, DeadlineMiddleware, RouteDeadline
+from events import ChangeStreamEventBackend, EventHub
+from idempotency import IdempotencyMiddleware, IdempotencyStore, mark_route_started
+from inventory import StockReservations, return_stock, take_stock
+from notifications import EmailChannel, NotificationDispatcher, PushChannel, SmsChannel
+from imports import (
+    IMPORT_INLINE_MAX_BYTES, IMPORT_MAX_UPLOAD_BYTES, ImportJobs, ImportRejected, ListingImporter, UploadTooLarge,
+    detect_format, iter_rows, spool_upload,
+)
+from ratelimit import (
+    CRITICAL, LOW, AdmissionController, LoopLagMonitor, MemoryBucketBackend,
+    MongoBucketBackend, RateLimit, RateLimitMiddleware, RoutePolicy,
+)
+from rollups import GRANULARITIES, HOUR, RollupRecorder, naive_utc, read_rollups
+from velocity import ALLOW, BLOCK, FLAG, HOLD, VelocityDecision, VelocityEngine, VelocityRule, VelocityStore
+
+if TYPE_CHECKING:
+    # Optional on-chain subsystems, imported where they are switched on (lifespan and withdrawal routes)
+    from deposits import DepositWatcher
+    from withdrawals import WithdrawalQueue
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'commuteshare')]
+# MongoDB connection (pool, timeouts and read routing configured via MONGO_* env vars).
+# Built in the lifespan handler below, not at import time.
+database: Optional[Database] = None
+client = None
+db = None
 
 # JWT Settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'commuteshare-secret-key-2025')
@@ -31,11 +69,26 @@ JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
 
 # Solana Configuration
 SOLANA_NETWORK = os.environ.get('SOLANA_NETWORK', 'devnet')  # devnet, testnet, mainnet-beta
-SOLANA_RPC_URL = {
+SOLANA_RPC_URL = os.environ.get('SOLANA_RPC_URL') or {
     'devnet': 'https://api.devnet.solana.com',
     'testnet': 'https://api.testnet.solana.com',
     'mainnet-beta': 'https://api.mainnet-beta.solana.com'
 }.get(SOLANA_NETWORK, 'https://api.devnet.solana.com')
+SOLANA_RPC_MAX_CONNECTIONS = int(os.environ.get('SOLANA_RPC_MAX_CONNECTIONS', '20'))
+SOLANA_RPC_REQUESTS_PER_SECOND = float(os.environ.get('SOLANA_RPC_REQUESTS_PER_SECOND', '4'))  # Public devnet allows ~40/10s
+SOLANA_BALANCE_SYNC_ENABLED = os.environ.get('SOLANA_BALANCE_SYNC_ENABLED', 'false').lower() == 'true'
+SOLANA_BALANCE_SYNC_INTERVAL_SECONDS = float(os.environ.get('SOLANA_BALANCE_SYNC_INTERVAL_SECONDS', '60'))
+# With the watcher on, SOL/USDT/COST deposits are credited from the chain, not from client claims
+SOLANA_DEPOSIT_WATCHER_ENABLED = os.environ.get('SOLANA_DEPOSIT_WATCHER_ENABLED', 'false').lower() == 'true'
+SOLANA_DEPOSIT_POLL_SECONDS = float(os.environ.get('SOLANA_DEPOSIT_POLL_SECONDS', '15'))
+# With the queue on, SOL/USDT/COST withdrawals are paid on-chain from the hot wallet
+# (SOLANA_HOT_WALLET_SECRET: solana-keygen JSON byte array or base58 secret key)
+SOLANA_WITHDRAWALS_ENABLED = os.environ.get('SOLANA_WITHDRAWALS_ENABLED', 'false').lower() == 'true'
+SOLANA_HOT_WALLET_SECRET = os.environ.get('SOLANA_HOT_WALLET_SECRET', '')
+SOLANA_WITHDRAWAL_INTERVAL_SECONDS = float(os.environ.get('SOLANA_WITHDRAWAL_INTERVAL_SECONDS', '5'))
+
+# Operator endpoints under /api/admin require this key in X-Admin-Key; unset disables them
+ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY', '')
 
 # COST Token Configuration (Update after deployment)
 COST_TOKEN_MINT = os.environ.get('COST_TOKEN_MINT', '')  # Will be set after token creation
@@ -77,14 +130,255 @@ CURRENCY_DATA = {
     'DEFAULT': {'code': 'USD', 'symbol': '$', 'name': 'US Dollar'},
 }
 
+# Exchange rates are cached in-process and refreshed after this many seconds
+RATES_CACHE_TTL_SECONDS = int(os.environ.get('RATES_CACHE_TTL_SECONDS', '60'))
+
+# Document caches, kept coherent across workers by change-stream invalidation.
+# Entries fall back to CACHE_FALLBACK_TTL_SECONDS whenever the stream is down.
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '300'))
+CACHE_FALLBACK_TTL_SECONDS = float(os.environ.get('CACHE_FALLBACK_TTL_SECONDS', '5'))
+caches = CacheRegistry()
+for _cache_name in ('users', 'products', 'services', 'restaurants', 'menus'):
+    caches.register(LocalCache(_cache_name, CACHE_TTL_SECONDS, CACHE_FALLBACK_TTL_SECONDS))
+
+# collection -> (cache name, field holding the cache key)
+CACHE_INVALIDATION_SOURCES = {
+    'users': ('users', 'id'),
+    'products': ('products', 'id'),
+    'services': ('services', 'id'),
+    'restaurants': ('restaurants', 'id'),
+    'menu_items': ('menus', 'restaurant_id'),
+}
+cache_invalidator: Optional[ChangeStreamInvalidator] = None
+
+# Order/booking status push channel (see /api/ws/events)
+event_hub = EventHub()
+event_backend: Optional[ChangeStreamEventBackend] = None
+WS_PING_INTERVAL_SECONDS = 20
+
+# Money-moving POSTs that honour the Idempotency-Key header
+IDEMPOTENT_PATHS = (
+    '/api/orders',
+    '/api/checkout',
+    '/api/food-orders',
+    '/api/services/book',
+    '/api/wallet/deposit',
+    '/api/wallet/withdraw',
+    '/api/wallet/swap',
+)
+idempotency_store: Optional[IdempotencyStore] = None
+slot_reservations: Optional[SlotReservations] = None
+# Booking slots are wall-clock times in this timezone (see availability.py)
+PLATFORM_TIMEZONE = ZoneInfo(os.environ.get('PLATFORM_TIMEZONE', 'Africa/Lagos'))
+# Marketplace stock holds while a buyer confirms; expired holds go back on sale
+stock_reservations: Optional[StockReservations] = None
+STOCK_RESERVATION_MINUTES = float(os.environ.get('STOCK_RESERVATION_MINUTES', '10'))
+MAX_CART_ITEMS = 50
+# Cleared on the first checkout against a standalone mongod (no multi-document transactions)
+_checkout_transactions = {"available": True}
+import_jobs: Optional[ImportJobs] = None
+
+# Hot/cold tiering of settled orders, bookings and transactions (ARCHIVE_* env vars).
+# History endpoints read the archive collections only when paging past the hot tier.
+archive_settings = ArchiveSettings()
+archiver: Optional[Archiver] = None
+
+# On-chain balance sync (see solana_rpc.py); built in lifespan
+solana_rpc: Optional[SolanaRpcClient] = None
+balance_sync: Optional[BalanceSyncScheduler] = None
+deposit_watcher: Optional["DepositWatcher"] = None
+withdrawal_queue: Optional["WithdrawalQueue"] = None
+# Hourly/daily gross bookings, discount, registration and active-buyer buckets fed by the write paths
+rollup_recorder: Optional[RollupRecorder] = None
+ROLLUP_FLUSH_SECONDS = float(os.environ.get('ROLLUP_FLUSH_SECONDS', '5'))
+HISTORY_INCLUDES_ARCHIVE = archive_settings.enabled and archive_settings.sink == COLLECTION_SINK
+
+# Rate limiting: first matching policy wins. RATE_LIMIT_BACKEND=mongo shares buckets across workers.
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_POLICIES = [
+    RoutePolicy('POST', r'^/api/auth/login$', RateLimit(10, 60), scope='ip', name='login'),
+    RoutePolicy('POST', r'^/api/auth/register$', RateLimit(5, 300), scope='ip', name='register'),
+    RoutePolicy('POST', r'^/api/(orders|food-orders|services/book|checkout)$', RateLimit(30, 60),
+                scope='user', priority=CRITICAL, name='checkout'),
+    RoutePolicy('POST', r'^/api/(products|menu-items)/import$', RateLimit(20, 3600), scope='user', name='imports'),
+    RoutePolicy('*', r'^/api/wallet/', RateLimit(60, 60), scope='user', priority=CRITICAL, name='wallet'),
+    RoutePolicy('GET', r'^/api/(products|services|restaurants|reviews)(/|$)', RateLimit(120, 60),
+                scope='both', priority=LOW, name='browse'),
+    RoutePolicy('GET', r'^/api/(health|ready)$', None, priority=CRITICAL, name='probes'),
+]
+DEFAULT_RATE_LIMIT_POLICY = RoutePolicy('*', r'', RateLimit(300, 60), scope='user', name='default')
+rate_limit_backend = MemoryBucketBackend()
+# Only honour X-Forwarded-For behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.environ.get('TRUST_FORWARDED_FOR', 'false').lower() == 'true'
+
+# Velocity rules on money-moving operations (amounts in USD). Per worker, like the memory
+# rate limiter; VELOCITY_PERSIST=true snapshots windows to Mongo so restarts keep them.
+VELOCITY_ENABLED = os.environ.get('VELOCITY_ENABLED', 'true').lower() == 'true'
+VELOCITY_PERSIST = os.environ.get('VELOCITY_PERSIST', 'false').lower() == 'true'
+VELOCITY_RULES = [
+    VelocityRule('swap-burst', ['swap'], 'user', 60, BLOCK, max_count=5),
+    VelocityRule('swap-volume', ['swap'], 'user', 3600, FLAG, max_amount=2000),
+    VelocityRule('withdraw-burst', ['withdraw'], 'user', 600, BLOCK, max_count=3),
+    VelocityRule('withdraw-volume', ['withdraw'], 'user', 86400, HOLD, max_amount=5000),
+    VelocityRule('checkout-burst', ['checkout'], 'user', 60, BLOCK, max_count=10),
+    VelocityRule('device-fanout', ['swap', 'withdraw'], 'device', 3600, HOLD, max_count=30),
+    VelocityRule('ip-volume', ['swap', 'withdraw', 'checkout'], 'ip', 3600, FLAG, max_amount=20000),
+]
+velocity_engine = VelocityEngine(VELOCITY_RULES)
+velocity_store: Optional[VelocityStore] = None
+
+# Notifications for new orders/bookings and status changes, coalesced per recipient per window.
+# Each channel is enabled by its provider URL (push: https://exp.host/--/api/v2/push/send).
+NOTIFY_WINDOW_SECONDS = float(os.environ.get('NOTIFY_WINDOW_SECONDS', '10'))
+NOTIFY_CHANNELS = [
+    (PushChannel, 'NOTIFY_PUSH'),
+    (SmsChannel, 'NOTIFY_SMS'),
+    (EmailChannel, 'NOTIFY_EMAIL'),
+]
+notification_dispatcher: Optional[NotificationDispatcher] = None
+loop_lag_monitor = LoopLagMonitor()
+admission_controller = AdmissionController(
+    loop_lag_monitor,
+    max_inflight=int(os.environ.get('SHED_MAX_INFLIGHT', '200')),
+    max_lag_ms=float(os.environ.get('SHED_MAX_LOOP_LAG_MS', '100')),
+)
+
+# Per-request database deadlines (ms), first match wins; None = unbounded.
+# Enforced with pymongo.timeout(), so they become maxTimeMS on reads and bound writes.
+REQUEST_DEADLINE_MS = int(os.environ.get('REQUEST_DEADLINE_MS', '3000'))
+ROUTE_DEADLINES = [
+    RouteDeadline('POST', r'^/api/(products|menu-items)/import$', None),
+    RouteDeadline('GET', r'^/api/(products|services|restaurants|reviews)(/|$)', 2000),
+    RouteDeadline('POST', r'^/api/(orders|food-orders|services/book|checkout)$', 8000),
+    RouteDeadline('*', r'^/api/wallet/', 8000),
+]
+database_breaker = CircuitBreaker(
+    failure_ratio=float(os.environ.get('DB_BREAKER_FAILURE_RATIO', '0.5')),
+    min_requests=int(os.environ.get('DB_BREAKER_MIN_REQUESTS', '20')),
+    window_seconds=float(os.environ.get('DB_BREAKER_WINDOW_SECONDS', '10')),
+    cooldown_seconds=float(os.environ.get('DB_BREAKER_COOLDOWN_SECONDS', '5')),
+)
+
 # Security
 security = HTTPBearer(auto_error=False)
 
+# Startup state, reported by /api/ready (readiness) separately from /api/health (liveness)
+startup_state = {"ready": False, "started_at": None, "startup_ms": None}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global database, client, db, cache_invalidator, event_backend, idempotency_store, rate_limit_backend
+    global slot_reservations, import_jobs, archiver, solana_rpc, balance_sync, deposit_watcher, withdrawal_queue
+    global rollup_recorder, velocity_store, stock_reservations, notification_dispatcher
+    started = time.perf_counter()
+    database = Database(os.environ['MONGO_URL'])
+    client = database.client
+    db = database.primary()
+    idempotency_store = IdempotencyStore(db.idempotency_keys)
+    slot_reservations = SlotReservations(db.provider_slots)
+    stock_reservations = StockReservations(db, hold_minutes=STOCK_RESERVATION_MINUTES)
+    notification_dispatcher = NotificationDispatcher(db, [
+        channel_class(
+            os.environ[f'{prefix}_URL'],
+            api_key=os.environ.get(f'{prefix}_API_KEY', ''),
+            concurrency=int(os.environ.get(f'{prefix}_CONCURRENCY', '5')),
+        )
+        for channel_class, prefix in NOTIFY_CHANNELS if os.environ.get(f'{prefix}_URL')
+    ], window_seconds=NOTIFY_WINDOW_SECONDS)
+    import_jobs = ImportJobs(db.import_jobs)
+    rollup_recorder = RollupRecorder(db.platform_rollups, flush_interval_seconds=ROLLUP_FLUSH_SECONDS)
+    if RATE_LIMIT_BACKEND == 'mongo':
+        rate_limit_backend = MongoBucketBackend(db.rate_limits)
+    
+    try:
+        await database.warm_up()
+        await database.ensure_indexes()
+    except Exception as e:
+        # Keep serving liveness; /api/ready stays 503 until Mongo is reachable
+        logger.error(f"Database warm-up failed: {e}")
+    await prime_caches()
+    cache_invalidator = ChangeStreamInvalidator(db, caches, CACHE_INVALIDATION_SOURCES)
+    cache_invalidator.start()
+    event_backend = ChangeStreamEventBackend(db.status_events, event_hub)
+    event_backend.start()
+    loop_lag_monitor.start()
+    rollup_recorder.start()
+    stock_reservations.start()
+    notification_dispatcher.start()
+    if VELOCITY_PERSIST:
+        velocity_store = VelocityStore(db.velocity_state, velocity_engine)
+        try:
+            logger.info(f"Restored velocity windows for {await velocity_store.load()} keys")
+        except Exception as e:
+            logger.error(f"Velocity state restore failed: {e}")
+        velocity_store.start()
+    if archive_settings.enabled:
+        archiver = Archiver(db, archive_settings)
+        archiver.start()
+    solana_rpc = SolanaRpcClient(
+        SOLANA_RPC_URL,
+        max_connections=SOLANA_RPC_MAX_CONNECTIONS,
+        requests_per_second=SOLANA_RPC_REQUESTS_PER_SECOND,
+    )
+    balance_sync = BalanceSyncScheduler(
+        db.users, solana_rpc, {'USDT': USDT_TOKEN_MINT, 'COST': COST_TOKEN_MINT},
+        interval_seconds=SOLANA_BALANCE_SYNC_INTERVAL_SECONDS,
+    )
+    if SOLANA_BALANCE_SYNC_ENABLED:
+        balance_sync.start()
+    if SOLANA_DEPOSIT_WATCHER_ENABLED:
+        from deposits import DepositWatcher
+        deposit_watcher = DepositWatcher(
+            db, client, solana_rpc, {'USDT': USDT_TOKEN_MINT, 'COST': COST_TOKEN_MINT},
+            interval_seconds=SOLANA_DEPOSIT_POLL_SECONDS,
+        )
+        deposit_watcher.start()
+    if SOLANA_WITHDRAWALS_ENABLED:
+        if SOLANA_HOT_WALLET_SECRET:
+            from solana_tx import Keypair
+            from withdrawals import WithdrawalQueue
+            withdrawal_queue = WithdrawalQueue(
+                db, client, solana_rpc, Keypair.from_secret(SOLANA_HOT_WALLET_SECRET),
+                {'USDT': USDT_TOKEN_MINT, 'COST': COST_TOKEN_MINT},
+                interval_seconds=SOLANA_WITHDRAWAL_INTERVAL_SECONDS,
+            )
+            withdrawal_queue.start()
+        else:
+            logger.error("SOLANA_WITHDRAWALS_ENABLED is set but SOLANA_HOT_WALLET_SECRET is not; queue not started")
+    
+    startup_state["started_at"] = datetime.utcnow()
+    startup_state["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    startup_state["ready"] = True
+    logger.info(f"Startup complete in {startup_state['startup_ms']}ms")
+    
+    yield
+    
+    startup_state["ready"] = False
+    await import_jobs.stop()
+    await rollup_recorder.stop()
+    await stock_reservations.stop()
+    await notification_dispatcher.stop()
+    if velocity_store is not None:
+        await velocity_store.stop()
+    if archiver is not None:
+        await archiver.stop()
+    await balance_sync.stop()
+    if deposit_watcher is not None:
+        await deposit_watcher.stop()
+    if withdrawal_queue is not None:
+        await withdrawal_queue.stop()
+    await solana_rpc.close()
+    await cache_invalidator.stop()
+    await event_backend.stop()
+    await loop_lag_monitor.stop()
+    database.close()
+
 # Create the main app
-app = FastAPI(title="CommuteShare API")
+app = FastAPI(title="CommuteShare API", lifespan=lifespan)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+# mark_route_started tells the idempotency middleware a request got as far as a route
+api_router = APIRouter(prefix="/api", dependencies=[Depends(mark_route_started)])
 
 # Configure logging
 logging.basicConfig(
@@ -154,6 +448,7 @@ class WalletTransaction(BaseModel):
     discount_applied: float = 0.0
     original_amount: float = 0.0
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class DepositRequest(BaseModel):
     amount: float
@@ -179,6 +474,19 @@ class WithdrawalRequest(BaseModel):
             raise ValueError('Amount must be positive')
         return v
 
+class NotificationSettings(BaseModel):
+    push_token: Optional[str] = None  # Expo push token from the app; "" unregisters
+    preferences: Optional[Dict[str, bool]] = None  # channel -> enabled, e.g. {"sms": false}
+    
+    @validator('preferences')
+    def validate_preferences(cls, v):
+        if v is not None and not set(v) <= {'push', 'sms', 'email'}:
+            raise ValueError('Channels are push, sms and email')
+        return v
+
+class WithdrawalReview(BaseModel):
+    reason: str = 'Rejected after review'
+
 class SwapRequest(BaseModel):
     from_currency: str  # fiat, SOL, USDT, COST
     to_currency: str
@@ -197,6 +505,24 @@ class CreateSolanaWallet(BaseModel):
 class ImportSolanaWallet(BaseModel):
     private_key: str  # Base58 encoded
 
+# Geo Models
+class GeoPoint(BaseModel):
+    """GeoJSON Point. Coordinates are [longitude, latitude], as MongoDB expects."""
+    type: str = "Point"
+    coordinates: List[float]
+    
+    @validator('type')
+    def validate_type(cls, v):
+        if v != 'Point':
+            raise ValueError('Only GeoJSON Point is supported')
+        return v
+    
+    @validator('coordinates')
+    def validate_coordinates(cls, v):
+        if len(v) != 2 or not (-180 <= v[0] <= 180) or not (-90 <= v[1] <= 90):
+            raise ValueError('Coordinates must be [longitude, latitude]')
+        return v
+
 # Product Models
 class ProductCreate(BaseModel):
     title: str
@@ -208,6 +534,7 @@ class ProductCreate(BaseModel):
     condition: str = "new"
     images: List[str] = []
     location: Optional[str] = None
+    geo_location: Optional[GeoPoint] = None
     quantity: int = 1
     accept_cost_token: bool = True  # Accept COST token payments
 
@@ -224,6 +551,7 @@ class Product(BaseModel):
     condition: str = "new"
     images: List[str] = []
     location: Optional[str] = None
+    geo_location: Optional[GeoPoint] = None
     quantity: int = 1
     is_available: bool = True
     views: int = 0
@@ -238,6 +566,52 @@ class OrderCreate(BaseModel):
     delivery_address: Optional[str] = None
     notes: Optional[str] = None
     payment_currency: str = 'fiat'  # fiat, SOL, USDT, COST
+    reservation_id: Optional[str] = None  # from POST /products/{id}/reserve
+    
+    @validator('quantity')
+    def validate_quantity(cls, v):
+        if v <= 0:
+            raise ValueError('Quantity must be positive')
+        return v
+
+class StockReservationCreate(BaseModel):
+    quantity: int = 1
+    
+    @validator('quantity')
+    def validate_quantity(cls, v):
+        if not 1 <= v <= 20:
+            raise ValueError('Quantity must be between 1 and 20')
+        return v
+
+class CartItem(BaseModel):
+    product_id: str
+    quantity: int = 1
+    
+    @validator('quantity')
+    def validate_quantity(cls, v):
+        if v <= 0:
+            raise ValueError('Quantity must be positive')
+        return v
+
+class CheckoutRequest(BaseModel):
+    items: List[CartItem]
+    delivery_address: Optional[str] = None
+    notes: Optional[str] = None
+    payment_currency: str = 'fiat'  # fiat, SOL, USDT, COST
+    
+    @validator('items')
+    def validate_items(cls, v):
+        if not 1 <= len(v) <= MAX_CART_ITEMS:
+            raise ValueError(f'A cart holds between 1 and {MAX_CART_ITEMS} items')
+        return v
+
+class OrderItem(BaseModel):
+    product_id: str
+    product_title: str
+    product_image: Optional[str] = None
+    quantity: int
+    unit_price: float
+    total_amount: float
 
 class Order(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -257,6 +631,9 @@ class Order(BaseModel):
     delivery_address: Optional[str] = None
     notes: Optional[str] = None
     status: str = "pending"
+    # Set for cart checkouts: one order per seller, with its lines in items
+    checkout_id: Optional[str] = None
+    items: List[OrderItem] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -268,8 +645,10 @@ class ServiceCreate(BaseModel):
     price_in_cost: Optional[float] = None
     service_type: str
     duration: Optional[str] = None
+    duration_minutes: Optional[int] = None  # Parsed from `duration` when not given
     images: List[str] = []
     location: Optional[str] = None
+    geo_location: Optional[GeoPoint] = None
     availability: Optional[str] = None
     accept_cost_token: bool = True
 
@@ -283,8 +662,10 @@ class Service(BaseModel):
     price_in_cost: Optional[float] = None
     service_type: str
     duration: Optional[str] = None
+    duration_minutes: Optional[int] = None
     images: List[str] = []
     location: Optional[str] = None
+    geo_location: Optional[GeoPoint] = None
     availability: Optional[str] = None
     rating: float = 0.0
     total_reviews: int = 0
@@ -296,8 +677,10 @@ class ServiceBookingCreate(BaseModel):
     service_id: str
     scheduled_date: str
     scheduled_time: Optional[str] = None
+    start_at: Optional[datetime] = None  # Structured slot start; overrides date/time strings
     notes: Optional[str] = None
     location: Optional[str] = None
+    geo_location: Optional[GeoPoint] = None
     payment_currency: str = 'fiat'
 
 class ServiceBooking(BaseModel):
@@ -310,8 +693,11 @@ class ServiceBooking(BaseModel):
     provider_name: str
     scheduled_date: str
     scheduled_time: Optional[str] = None
+    start_at: Optional[datetime] = None
+    end_at: Optional[datetime] = None
     notes: Optional[str] = None
     location: Optional[str] = None
+    geo_location: Optional[GeoPoint] = None
     amount: float
     discount_applied: float = 0.0
     final_amount: float = 0.0
@@ -319,12 +705,52 @@ class ServiceBooking(BaseModel):
     status: str = "pending"
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Batch status updates
+MAX_BATCH_STATUS_UPDATES = 200
+
+class StatusChange(BaseModel):
+    id: str
+    status: str
+
+class BatchStatusUpdate(BaseModel):
+    updates: List[StatusChange]
+    
+    @validator('updates')
+    def validate_updates(cls, v):
+        if not 1 <= len(v) <= MAX_BATCH_STATUS_UPDATES:
+            raise ValueError(f'Send between 1 and {MAX_BATCH_STATUS_UPDATES} updates')
+        if len({change.id for change in v}) != len(v):
+            raise ValueError('Each id may appear only once per batch')
+        return v
+
+class AvailabilityRule(BaseModel):
+    weekday: int  # 0 = Monday ... 6 = Sunday
+    start_time: str  # "09:00"
+    end_time: str  # "17:00"
+    
+    @validator('weekday')
+    def validate_weekday(cls, v):
+        if not 0 <= v <= 6:
+            raise ValueError('Weekday must be 0 (Monday) to 6 (Sunday)')
+        return v
+    
+    @validator('start_time', 'end_time')
+    def validate_time(cls, v):
+        parsed = parse_time_of_day(v)
+        if parsed is None:
+            raise ValueError('Time must look like 09:00 or 9:00 AM')
+        return parsed.strftime('%H:%M')
+
+class ProviderAvailability(BaseModel):
+    rules: List[AvailabilityRule] = []
+
 # Restaurant & Food Models
 class RestaurantCreate(BaseModel):
     name: str
     description: str
     cuisine_type: str
     address: str
+    geo_location: Optional[GeoPoint] = None
     phone: str
     opening_hours: Optional[str] = None
     image: Optional[str] = None
@@ -337,6 +763,7 @@ class Restaurant(BaseModel):
     description: str
     cuisine_type: str
     address: str
+    geo_location: Optional[GeoPoint] = None
     phone: str
     opening_hours: Optional[str] = None
     image: Optional[str] = None
@@ -428,21 +855,58 @@ def create_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_user_id(credentials: Optional[HTTPAuthorizationCredentials]) -> str:
     if not credentials:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        user = await db.users.find_one({"id": user_id})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        return payload.get("user_id")
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def user_id_from_headers(headers) -> Optional[str]:
+    """Best-effort user id from a Bearer token, without a database round trip."""
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_user_id(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    except HTTPException:
+        return None
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Always reads the user from the primary. Use for anything that checks or moves balances."""
+    user_id = decode_user_id(credentials)
+    user = await db.users.find_one({"id": user_id})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def get_current_user_cached(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Cached user lookup for routes that only need identity (id, name, currency), never balances."""
+    user_id = decode_user_id(credentials)
+    user = caches["users"].get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id})
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        caches["users"].set(user_id, user)
+    return user
+
+async def get_db_session():
+    """Causal session for money-moving routes so follow-up reads see the request's writes."""
+    async with database.causal_session() as session:
+        yield session
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """Operator endpoints: a shared key from ADMIN_API_KEY, compared in constant time."""
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
 def get_currency_for_country(country_code: str) -> Dict[str, str]:
     return CURRENCY_DATA.get(country_code.upper(), CURRENCY_DATA['DEFAULT'])
 
@@ -519,8 +983,82 @@ def calculate_discount(user: dict, payment_currency: str, amount: float) -> tupl
     
     return discount_percent, discount_amount, final_amount
 
+def discount_tier(user: dict, payment_currency: str) -> str:
+    """Which discount calculate_discount applied: the membership tier for COST, else the flat rate."""
+    if payment_currency == 'COST':
+        return get_membership_tier(user.get('cost_balance', 0.0))['tier']
+    return 'flat'
+
+async def publish_events(actor_id: str, events: List[Dict]):
+    """Status events for connected clients; every recipient but the actor also gets a notification"""
+    await event_hub.publish_many(events)
+    notification_dispatcher.submit_many(events, exclude=actor_id)
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR and 'x-forwarded-for' in request.headers:
+        return request.headers['x-forwarded-for'].split(',')[0].strip()
+    return request.client.host if request.client else 'unknown'
+
+async def velocity_attempts():
+    """Velocity decisions counted while handling a request, taken back out if the request fails."""
+    attempts: List[VelocityDecision] = []
+    try:
+        yield attempts
+    except BaseException:
+        for decision in attempts:
+            velocity_engine.rollback(decision)
+        raise
+
+async def check_velocity(operation: str, request: Request, user: dict, amount: float, currency: str,
+                         attempts: List[VelocityDecision], session=None) -> VelocityDecision:
+    """
+    Run the velocity rules for this attempt (amount converted to USD). Blocks raise 429;
+    flags and holds are recorded in velocity_flags. The attempt is counted right away and
+    added to `attempts` (from Depends(velocity_attempts)), which rolls it back if the route fails.
+    Returns the decision so callers can park held operations.
+    """
+    if not VELOCITY_ENABLED:
+        return VelocityDecision(ALLOW, [])
+    code = user.get('currency', {}).get('code', 'USD') if currency == 'FIAT' else currency
+    usd_amount = convert_with_rates(amount, code, 'USD', await get_exchange_rates())
+    device = request.headers.get('x-device-id')
+    ip = client_ip(request)
+    decision = velocity_engine.check(operation, usd_amount, user=user["id"], device=device, ip=ip)
+    attempts.append(decision)
+    if decision.outcome == BLOCK:
+        logger.warning(f"Velocity block on {operation} for user {user['id']}: {', '.join(decision.rules)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many transactions in a short period; try again later",
+            headers={"Retry-After": str(max(1, int(decision.retry_after + 0.5)))},
+        )
+    if decision.outcome in (FLAG, HOLD):
+        await db.velocity_flags.insert_one({
+            "id": str(uuid.uuid4()),
+            "user_id": user["id"],
+            "operation": operation,
+            "outcome": decision.outcome,
+            "rules": decision.rules,
+            "amount": amount,
+            "currency": currency,
+            "amount_usd": usd_amount,
+            "device_id": device,
+            "ip": ip,
+            "created_at": datetime.utcnow(),
+        }, session=session)
+    return decision
+
+_rates_cache = {"rates": None, "fetched_at": 0.0}
+
 async def get_exchange_rates():
-    """Get current exchange rates (mock for now, integrate real API later)"""
+    """Get current exchange rates, served from the in-process cache while fresh"""
+    if _rates_cache["rates"] is None or time.monotonic() - _rates_cache["fetched_at"] > RATES_CACHE_TTL_SECONDS:
+        _rates_cache["rates"] = await fetch_exchange_rates()
+        _rates_cache["fetched_at"] = time.monotonic()
+    return _rates_cache["rates"]
+
+async def fetch_exchange_rates():
+    """Fetch current exchange rates (mock for now, integrate real API later)"""
     # Mock exchange rates - in production, use CoinGecko, Binance, or similar API
     return {
         'SOL_USD': 180.0,
@@ -542,10 +1080,75 @@ async def get_exchange_rates():
         'USD_MXN': 17.2,
     }
 
-async def convert_currency(amount: float, from_currency: str, to_currency: str) -> float:
-    """Convert between currencies"""
+async def find_near(collection, query: dict, near_lng: Optional[float], near_lat: Optional[float],
+                    radius_km: Optional[float], skip: int, limit: int) -> List[dict]:
+    """
+    Distance-sorted page of documents matching `query` around a point, using the
+    collection's 2dsphere index on geo_location. Each result gets `distance_m`.
+    """
+    if near_lng is None or near_lat is None:
+        raise HTTPException(status_code=400, detail="near_lng and near_lat are required for location search")
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [near_lng, near_lat]},
+        "key": "geo_location",
+        "distanceField": "distance_m",
+        "spherical": True,
+        "query": query,
+    }
+    if radius_km is not None:
+        geo_near["maxDistance"] = radius_km * 1000
+    pipeline = [{"$geoNear": geo_near}, {"$skip": skip}, {"$limit": limit}]
+    return await collection.aggregate(pipeline).to_list(limit)
+
+_static_version = {"rates": None, "version": None}
+
+async def get_static_content_version() -> str:
+    """
+    Content version for the precomputed static payloads. Re-derived whenever the
+    rate snapshot is refreshed, from CURRENCY_DATA, MEMBERSHIP_TIERS and the rates.
+    """
     rates = await get_exchange_rates()
+    if rates is not _static_version["rates"]:
+        fingerprint = json.dumps([CURRENCY_DATA, MEMBERSHIP_TIERS, rates], sort_keys=True)
+        _static_version["version"] = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+        _static_version["rates"] = rates
+    return _static_version["version"]
+
+class StaticPayload:
+    """
+    A response body serialized once per content version and served with a strong
+    ETag and Cache-Control, answering 304 when If-None-Match matches.
+    """
     
+    def __init__(self, builder, max_age: int = 60):
+        self.builder = builder
+        self.max_age = max_age
+        self.version = None
+        self.body = b""
+        self.etag = ""
+    
+    async def refresh(self):
+        version = await get_static_content_version()
+        if version != self.version:
+            content = await self.builder()
+            self.body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+            self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+            self.version = version
+    
+    async def respond(self, request: Request) -> Response:
+        await self.refresh()
+        headers = {"ETag": self.etag, "Cache-Control": f"public, max-age={self.max_age}"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+async def convert_currency(amount: float, from_currency: str, to_currency: str) -> float:
+    """Convert between currencies"""
+    return convert_with_rates(amount, from_currency, to_currency, await get_exchange_rates())
+
+def convert_with_rates(amount: float, from_currency: str, to_currency: str, rates: dict) -> float:
+    """Convert using an already-fetched rates snapshot (batch callers fetch rates once)"""
     # First convert to USD
     if from_currency == 'USD':
         usd_amount = amount
@@ -612,6 +1215,7 @@ async def register(data: UserRegister):
     }
     
     await db.users.insert_one(user)
+    rollup_recorder.record_registration()
     
     # Record welcome bonus transaction
     welcome_transaction = WalletTransaction(
@@ -710,12 +1314,16 @@ async def update_country(country_code: str, user: dict = Depends(get_current_use
         {"id": user["id"]},
         {"$set": {"country_code": country_code, "currency": currency}}
     )
+    caches["users"].invalidate(user["id"])
     return {"message": "Country updated", "currency": currency}
 
 # ==================== WALLET ROUTES ====================
 
 @api_router.get("/wallet/balance")
 async def get_wallet_balance(user: dict = Depends(get_current_user)):
+    return await build_wallet_balance(user)
+
+async def build_wallet_balance(user: dict) -> Dict[str, Any]:
     rates = await get_exchange_rates()
     currency = user.get('currency', get_currency_for_country('NG'))
     
@@ -744,8 +1352,13 @@ async def get_wallet_balance(user: dict = Depends(get_current_user)):
     }
 
 @api_router.post("/wallet/deposit")
-async def deposit_funds(data: DepositRequest, user: dict = Depends(get_current_user)):
+async def deposit_funds(data: DepositRequest, user: dict = Depends(get_current_user), session=Depends(get_db_session)):
     currency = data.currency.upper()
+    if SOLANA_DEPOSIT_WATCHER_ENABLED and currency in ('SOL', 'USDT', 'COST'):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Send {currency} to your Solana wallet address; it is credited once the transfer is finalized"
+        )
     balance_field = {
         'FIAT': 'wallet_balance',
         'SOL': 'sol_balance',
@@ -758,7 +1371,8 @@ async def deposit_funds(data: DepositRequest, user: dict = Depends(get_current_u
     
     await db.users.update_one(
         {"id": user["id"]},
-        {"$set": {balance_field: new_balance}}
+        {"$set": {balance_field: new_balance}},
+        session=session
     )
     
     transaction = WalletTransaction(
@@ -769,7 +1383,7 @@ async def deposit_funds(data: DepositRequest, user: dict = Depends(get_current_u
         description=f"Deposit of {data.amount} {currency}",
         reference=f"DEP-{uuid.uuid4().hex[:8].upper()}"
     )
-    await db.transactions.insert_one(transaction.dict())
+    await db.transactions.insert_one(transaction.dict(), session=session)
     
     return {
         "message": f"Deposit successful (Mock)",
@@ -779,7 +1393,8 @@ async def deposit_funds(data: DepositRequest, user: dict = Depends(get_current_u
     }
 
 @api_router.post("/wallet/withdraw")
-async def withdraw_funds(data: WithdrawalRequest, user: dict = Depends(get_current_user)):
+async def withdraw_funds(data: WithdrawalRequest, request: Request, user: dict = Depends(get_current_user),
+                         session=Depends(get_db_session), attempts=Depends(velocity_attempts)):
     currency = data.currency.upper()
     balance_field = {
         'FIAT': 'wallet_balance',
@@ -808,11 +1423,41 @@ async def withdraw_funds(data: WithdrawalRequest, user: dict = Depends(get_curre
     if currency in ['SOL', 'USDT', 'COST'] and not data.solana_address:
         raise HTTPException(status_code=400, detail="Solana address required for crypto withdrawal")
     
+    if SOLANA_WITHDRAWALS_ENABLED and currency in ['SOL', 'USDT', 'COST']:
+        from withdrawals import MIN_WITHDRAWAL, InsufficientFunds, enqueue_withdrawal
+        if not is_valid_pubkey(data.solana_address):
+            raise HTTPException(status_code=400, detail="Invalid Solana address")
+        if data.amount < MIN_WITHDRAWAL[currency]:
+            raise HTTPException(status_code=400, detail=f"Minimum withdrawal is {MIN_WITHDRAWAL[currency]} {currency}")
+        # A payout to a watched deposit address would be credited straight back by the deposit watcher
+        if await db.deposit_addresses.find_one({"address": data.solana_address}, {"_id": 1}, session=session):
+            raise HTTPException(status_code=400, detail="Withdrawals to a CommuteShare deposit address are not allowed")
+        velocity = await check_velocity('withdraw', request, user, data.amount, currency, attempts, session=session)
+        held = velocity.outcome == HOLD
+        try:
+            withdrawal = await enqueue_withdrawal(
+                db, user["id"], currency, data.amount, data.solana_address, session=session, held=held
+            )
+        except InsufficientFunds:
+            raise HTTPException(status_code=400, detail=f"Insufficient {currency} balance")
+        return {
+            "message": ("Withdrawal is under review; funds are reserved until it is released" if held
+                        else "Withdrawal queued; funds are reserved until it confirms on-chain"),
+            "new_balance": withdrawal["new_balance"],
+            "currency": currency,
+            "reference": withdrawal["reference"],
+            "withdrawal_id": withdrawal["id"],
+            "status": withdrawal["status"],
+        }
+    
+    velocity = await check_velocity('withdraw', request, user, data.amount, currency, attempts, session=session)
+    held = velocity.outcome == HOLD
     new_balance = current_balance - data.amount
     
     await db.users.update_one(
         {"id": user["id"]},
-        {"$set": {balance_field: new_balance}}
+        {"$set": {balance_field: new_balance}},
+        session=session
     )
     
     transaction = WalletTransaction(
@@ -820,20 +1465,25 @@ async def withdraw_funds(data: WithdrawalRequest, user: dict = Depends(get_curre
         amount=data.amount,
         currency=currency,
         transaction_type="withdrawal",
+        status="pending_review" if held else "completed",
         description=f"Withdrawal of {data.amount} {currency}",
         reference=f"WTH-{uuid.uuid4().hex[:8].upper()}"
     )
-    await db.transactions.insert_one(transaction.dict())
+    await db.transactions.insert_one(transaction.dict(), session=session)
     
     return {
-        "message": f"Withdrawal request submitted (Mock)",
+        "message": ("Withdrawal is under review; funds are reserved until it is released" if held
+                    else f"Withdrawal request submitted (Mock)"),
         "new_balance": new_balance,
         "currency": currency,
-        "reference": transaction.reference
+        "reference": transaction.reference,
+        "transaction_id": transaction.id,
+        "status": transaction.status,
     }
 
 @api_router.post("/wallet/swap")
-async def swap_currency(data: SwapRequest, user: dict = Depends(get_current_user)):
+async def swap_currency(data: SwapRequest, request: Request, user: dict = Depends(get_current_user),
+                        session=Depends(get_db_session), attempts=Depends(velocity_attempts)):
     """Swap between currencies"""
     from_currency = data.from_currency.upper()
     to_currency = data.to_currency.upper()
@@ -857,6 +1507,10 @@ async def swap_currency(data: SwapRequest, user: dict = Depends(get_current_user
     if data.amount > from_balance:
         raise HTTPException(status_code=400, detail=f"Insufficient {from_currency} balance")
     
+    velocity = await check_velocity('swap', request, user, data.amount, from_currency, attempts, session=session)
+    if velocity.outcome == HOLD:
+        raise HTTPException(status_code=403, detail="This swap requires review; please contact support")
+    
     # Get user's fiat currency for conversion
     user_currency = user.get('currency', {}).get('code', 'USD')
     if from_currency == 'FIAT':
@@ -881,7 +1535,8 @@ async def swap_currency(data: SwapRequest, user: dict = Depends(get_current_user
         {"$set": {
             from_field: new_from_balance,
             to_field: new_to_balance
-        }}
+        }},
+        session=session
     )
     
     transaction = WalletTransaction(
@@ -892,7 +1547,7 @@ async def swap_currency(data: SwapRequest, user: dict = Depends(get_current_user
         description=f"Swapped {data.amount} {data.from_currency} to {final_amount:.6f} {data.to_currency}",
         reference=f"SWP-{uuid.uuid4().hex[:8].upper()}"
     )
-    await db.transactions.insert_one(transaction.dict())
+    await db.transactions.insert_one(transaction.dict(), session=session)
     
     return {
         "message": "Swap successful",
@@ -905,20 +1560,22 @@ async def swap_currency(data: SwapRequest, user: dict = Depends(get_current_user
     }
 
 @api_router.get("/wallet/transactions")
-async def get_transactions(user: dict = Depends(get_current_user)):
-    transactions = await db.transactions.find(
-        {"user_id": user["id"]}
-    ).sort("created_at", -1).to_list(100)
+async def get_transactions(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), user: dict = Depends(get_current_user_cached)):
+    transactions = await find_history(
+        db, "transactions", {"user_id": user["id"]}, skip, min(limit, 100), HISTORY_INCLUDES_ARCHIVE
+    )
     return transactions
 
 @api_router.get("/wallet/exchange-rates")
-async def get_rates():
-    rates = await get_exchange_rates()
-    return rates
+async def get_rates(request: Request):
+    return await rates_payload.respond(request)
 
 @api_router.get("/wallet/discount-info")
 async def get_discount_info(user: dict = Depends(get_current_user)):
     """Get discount information based on membership tier"""
+    return build_discount_info(user)
+
+def build_discount_info(user: dict) -> Dict[str, Any]:
     cost_balance = user.get('cost_balance', 0.0)
     membership = get_membership_tier(cost_balance)
     
@@ -940,6 +1597,23 @@ async def get_discount_info(user: dict = Depends(get_current_user)):
         }
     }
 
+@api_router.get("/wallet/overview")
+async def get_wallet_overview(transactions_limit: int = 20, user: dict = Depends(get_current_user)):
+    """Balance, discount info and recent transactions for the wallet tab in one request"""
+    # to_list(0) would return the whole history
+    limit = max(1, min(transactions_limit, 100))
+    balance, transactions = await asyncio.gather(
+        build_wallet_balance(user),
+        db.transactions.find(
+            {"user_id": user["id"]}, {"_id": 0}
+        ).sort("created_at", -1).limit(limit).to_list(limit),
+    )
+    return {
+        "balance": balance,
+        "discount_info": build_discount_info(user),
+        "transactions": transactions,
+    }
+
 # ==================== SOLANA WALLET ROUTES ====================
 
 @api_router.post("/wallet/solana/create")
@@ -965,8 +1639,14 @@ async def create_solana_wallet(user: dict = Depends(get_current_user)):
     }
 
 @api_router.get("/wallet/solana/info")
-async def get_solana_wallet_info(user: dict = Depends(get_current_user)):
-    """Get Solana wallet information"""
+async def get_solana_wallet_info(refresh: bool = False, user: dict = Depends(get_current_user)):
+    """Get Solana wallet information; ?refresh=true re-reads on-chain balances before answering"""
+    if refresh and is_valid_pubkey(user.get("solana_wallet")):
+        try:
+            await balance_sync.sync_users([user])
+            user = await db.users.find_one({"id": user["id"]})
+        except Exception as e:
+            logger.warning(f"On-chain balance refresh failed for {user['id']}: {e}")
     return {
         "wallet_address": user.get("solana_wallet"),
         "network": SOLANA_NETWORK,
@@ -977,14 +1657,141 @@ async def get_solana_wallet_info(user: dict = Depends(get_current_user)):
             "SOL": user.get("sol_balance", 0.0),
             "USDT": user.get("usdt_balance", 0.0),
             "COST": user.get("cost_balance", 0.0),
-        }
+        },
+        # Chain balances of the wallet address, synced in the background; None until first sync
+        "onchain_balances": user.get("onchain_balances"),
+    }
+
+@api_router.get("/wallet/solana/deposits")
+async def get_chain_deposits(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), user: dict = Depends(get_current_user_cached)):
+    """On-chain deposits detected for the user's wallet, newest first"""
+    deposits = await db.chain_deposits.find(
+        {"user_id": user["id"]}, {"_id": 0}
+    ).sort("slot", -1).skip(skip).limit(min(limit, 100)).to_list(None)
+    return {
+        "wallet_address": user.get("solana_wallet"),
+        "watching": SOLANA_DEPOSIT_WATCHER_ENABLED,
+        "deposits": deposits,
     }
 
+@api_router.get("/wallet/withdrawals")
+async def get_crypto_withdrawals(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), user: dict = Depends(get_current_user_cached)):
+    """On-chain withdrawals with their queue status and transaction signature, newest first"""
+    withdrawals = await db.crypto_withdrawals.find(
+        {"user_id": user["id"]}, {"_id": 0, "wire_transaction": 0}
+    ).sort("created_at", -1).skip(skip).limit(min(limit, 100)).to_list(None)
+    return {"withdrawals": withdrawals}
+
+@api_router.get("/admin/withdrawals/metrics", dependencies=[Depends(require_admin)])
+async def get_withdrawal_metrics():
+    """Withdrawal queue depth, packing density, throughput and queue-to-confirmation latency"""
+    if withdrawal_queue is None:
+        return {"enabled": False}
+    return {"enabled": True, **await withdrawal_queue.stats()}
+
+async def review_ledger_withdrawal(transaction_id: str, approve: bool, reason: Optional[str] = None) -> bool:
+    """
+    Settle a held off-chain withdrawal (its funds were debited when it was requested):
+    complete it, or fail it and refund. The guarded status change makes this happen once.
+    """
+    fields = {"status": "completed" if approve else "failed", "updated_at": datetime.utcnow()}
+    if reason:
+        fields["review_reason"] = reason
+    transaction = await db.transactions.find_one_and_update(
+        {"id": transaction_id, "transaction_type": "withdrawal", "status": "pending_review"},
+        {"$set": fields},
+        projection={"_id": 0},
+    )
+    if transaction is None:
+        return False
+    if not approve:
+        balance_field = {
+            'FIAT': 'wallet_balance',
+            'SOL': 'sol_balance',
+            'USDT': 'usdt_balance',
+            'COST': 'cost_balance',
+        }.get(transaction["currency"], 'wallet_balance')
+        await db.users.update_one({"id": transaction["user_id"]}, {"$inc": {balance_field: transaction["amount"]}})
+        refund = WalletTransaction(
+            user_id=transaction["user_id"],
+            amount=transaction["amount"],
+            currency=transaction["currency"],
+            transaction_type="refund",
+            description=f"Refund of rejected withdrawal: {reason}",
+            reference=transaction.get("reference"),
+        )
+        await db.transactions.insert_one(refund.dict())
+    return True
+
+@api_router.post("/admin/withdrawals/{withdrawal_id}/release", dependencies=[Depends(require_admin)])
+async def release_withdrawal(withdrawal_id: str):
+    """Pay out a withdrawal held by a velocity rule: a crypto withdrawal id, or a ledger transaction id"""
+    from withdrawals import release_held
+    if not await release_held(db, withdrawal_id) and not await review_ledger_withdrawal(withdrawal_id, True):
+        raise HTTPException(status_code=404, detail="No held withdrawal with that id")
+    return {"message": "Withdrawal released", "withdrawal_id": withdrawal_id}
+
+@api_router.post("/admin/withdrawals/{withdrawal_id}/reject", dependencies=[Depends(require_admin)])
+async def reject_withdrawal(withdrawal_id: str, data: WithdrawalReview):
+    """Fail a held withdrawal and refund its reserved funds (crypto ones via the queue's refund pass)"""
+    from withdrawals import reject_held
+    if (not await reject_held(db, withdrawal_id, data.reason)
+            and not await review_ledger_withdrawal(withdrawal_id, False, data.reason)):
+        raise HTTPException(status_code=404, detail="No held withdrawal with that id")
+    return {"message": "Withdrawal rejected", "withdrawal_id": withdrawal_id}
+
+@api_router.get("/admin/velocity/flags", dependencies=[Depends(require_admin)])
+async def get_velocity_flags(user_id: Optional[str] = None, skip: int = Query(0, ge=0),
+                             limit: int = Query(50, ge=1, le=100)):
+    """Flagged and held attempts, newest first, plus this worker's decision counts"""
+    query = {"user_id": user_id} if user_id else {}
+    flags = await db.velocity_flags.find(query, {"_id": 0}).sort("created_at", -1) \
+        .skip(skip).limit(min(limit, 100)).to_list(None)
+    return {"enabled": VELOCITY_ENABLED, "decisions": velocity_engine.stats, "flags": flags}
+
+@api_router.get("/admin/rollups", dependencies=[Depends(require_admin)])
+async def get_platform_rollups(granularity: str = HOUR, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """
+    Gross bookings by vertical and currency (cancellations and refunds are not
+    subtracted), discounts by tier, registrations and active buyers per bucket.
+    Reads only rollup documents; defaults to the last 24 hours / 30 days.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    # Buckets are naive UTC; a start/end with an offset would not compare with them
+    start = naive_utc(start) if start else None
+    end = naive_utc(end) if end else datetime.utcnow()
+    start = start or end - (timedelta(hours=24) if granularity == HOUR else timedelta(days=30))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if granularity == HOUR and end - start > timedelta(days=31):
+        raise HTTPException(status_code=400, detail="Hourly ranges are limited to 31 days; use granularity=day")
+    return await read_rollups(db.platform_rollups, granularity, start, end)
+
 # ==================== TOKEN INFO ROUTES ====================
 
 @api_router.get("/token/info")
-async def get_token_info():
+async def get_token_info(request: Request):
     """Get COST token information"""
+    return await token_info_payload.respond(request)
+
+def build_tier_table() -> List[Dict[str, Any]]:
+    """Membership tiers in ascending order with the balance range each one covers."""
+    ordered = sorted(MEMBERSHIP_TIERS.items(), key=lambda item: item[1]['min_balance'])
+    table = []
+    for index, (tier, info) in enumerate(ordered):
+        next_min = ordered[index + 1][1]['min_balance'] if index + 1 < len(ordered) else None
+        table.append({
+            "tier": tier,
+            "name": tier.capitalize(),
+            "min_balance": info['min_balance'],
+            "max_balance": next_min - 1 if next_min is not None else None,
+            "discount": info['discount'],
+            "color": info['color'],
+        })
+    return table
+
+async def build_token_info():
     rates = await get_exchange_rates()
     return {
         "name": "CommuteShare Token",
@@ -1002,13 +1809,7 @@ async def get_token_info():
             "Governance voting (coming soon)",
             "Staking rewards (coming soon)"
         ],
-        "membership_tiers": [
-            {"tier": "basic", "name": "Basic", "min_balance": 0, "max_balance": 14999, "discount": 10, "color": "#808080"},
-            {"tier": "bronze", "name": "Bronze", "min_balance": 15000, "max_balance": 29999, "discount": 20, "color": "#CD7F32"},
-            {"tier": "silver", "name": "Silver", "min_balance": 30000, "max_balance": 49999, "discount": 30, "color": "#C0C0C0"},
-            {"tier": "gold", "name": "Gold", "min_balance": 50000, "max_balance": 99999, "discount": 40, "color": "#FFD700"},
-            {"tier": "platinum", "name": "Platinum", "min_balance": 100000, "max_balance": None, "discount": 50, "color": "#E5E4E2"},
-        ],
+        "membership_tiers": build_tier_table(),
         "total_supply": "1,000,000,000 COST",
         "circulating_supply": "100,000,000 COST (testnet)"
     }
@@ -1016,7 +1817,7 @@ async def get_token_info():
 # ==================== MARKETPLACE ROUTES ====================
 
 @api_router.post("/products", response_model=Product)
-async def create_product(data: ProductCreate, user: dict = Depends(get_current_user)):
+async def create_product(data: ProductCreate, user: dict = Depends(get_current_user_cached)):
     # Calculate COST price if not provided (based on exchange rate)
     price_in_cost = data.price_in_cost
     if not price_in_cost:
@@ -1038,7 +1839,11 @@ async def get_products(
     search: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    limit: int = 50
+    near_lng: Optional[float] = None,
+    near_lat: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100)
 ):
     query = {"is_available": True}
     
@@ -1057,14 +1862,20 @@ async def get_products(
             {"description": {"$regex": search, "$options": "i"}}
         ]
     
-    products = await db.products.find(query).sort("created_at", -1).to_list(limit)
+    collection = database.for_route("get_products").products
+    if near_lng is not None or near_lat is not None or radius_km is not None:
+        return await find_near(collection, query, near_lng, near_lat, radius_km, skip, limit)
+    products = await collection.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     return products
 
 @api_router.get("/products/{product_id}")
 async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
+    product = caches["products"].get(product_id)
+    if product is None:
+        product = await db.products.find_one({"id": product_id})
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        caches["products"].set(product_id, product)
     
     await db.products.update_one(
         {"id": product_id},
@@ -1074,7 +1885,7 @@ async def get_product(product_id: str):
     return product
 
 @api_router.get("/my-products")
-async def get_my_products(user: dict = Depends(get_current_user)):
+async def get_my_products(user: dict = Depends(get_current_user_cached)):
     products = await db.products.find(
         {"seller_id": user["id"]}
     ).sort("created_at", -1).to_list(100)
@@ -1084,7 +1895,7 @@ async def get_my_products(user: dict = Depends(get_current_user)):
 async def update_product(
     product_id: str,
     data: ProductCreate,
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_current_user_cached)
 ):
     product = await db.products.find_one({"id": product_id, "seller_id": user["id"]})
     if not product:
@@ -1097,24 +1908,29 @@ async def update_product(
         {"id": product_id},
         {"$set": update_data}
     )
+    caches["products"].invalidate(product_id)
     return {"message": "Product updated"}
 
 @api_router.delete("/products/{product_id}")
-async def delete_product(product_id: str, user: dict = Depends(get_current_user)):
+async def delete_product(product_id: str, user: dict = Depends(get_current_user_cached)):
     result = await db.products.delete_one({"id": product_id, "seller_id": user["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    caches["products"].invalidate(product_id)
     return {"message": "Product deleted"}
 
 # ==================== ORDERS ROUTES ====================
 
 @api_router.post("/orders", response_model=Order)
-async def create_order(data: OrderCreate, user: dict = Depends(get_current_user)):
-    product = await db.products.find_one({"id": data.product_id, "is_available": True})
+async def create_order(data: OrderCreate, request: Request, user: dict = Depends(get_current_user),
+                       session=Depends(get_db_session), attempts=Depends(velocity_attempts)):
+    # A reserved product may have gone unavailable because the reservation took its last units
+    product_query = {"id": data.product_id} if data.reservation_id else {"id": data.product_id, "is_available": True}
+    product = await db.products.find_one(product_query, session=session)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found or unavailable")
     
-    if product["quantity"] < data.quantity:
+    if not data.reservation_id and product["quantity"] < data.quantity:
         raise HTTPException(status_code=400, detail="Insufficient stock")
     
     if product["seller_id"] == user["id"]:
@@ -1147,11 +1963,36 @@ async def create_order(data: OrderCreate, user: dict = Depends(get_current_user)
     if user_balance < final_amount:
         raise HTTPException(status_code=400, detail=f"Insufficient {payment_currency} balance")
     
-    # Deduct from buyer wallet
-    await db.users.update_one(
-        {"id": user["id"]},
-        {"$inc": {balance_field: -final_amount}}
-    )
+    velocity = await check_velocity('checkout', request, user, final_amount, payment_currency, attempts, session=session)
+    if velocity.outcome == HOLD:
+        raise HTTPException(status_code=403, detail="This purchase requires review; please contact support")
+    
+    # Take the stock before payment: a reservation already holds it, otherwise a guarded $inc
+    if data.reservation_id:
+        reservation = await stock_reservations.consume(data.reservation_id, user["id"], session=session)
+        if not reservation or reservation["product_id"] != product["id"] or reservation["quantity"] != data.quantity:
+            if reservation:
+                await stock_reservations.unconsume(data.reservation_id, session=session)
+            raise HTTPException(status_code=409, detail="Reservation not found, expired or does not match this order")
+    elif await take_stock(db.products, product["id"], data.quantity, session=session) is None:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+    
+    # Guarded on the balance, not the one read at auth time: concurrent orders can't overdraw
+    try:
+        buyer = await db.users.find_one_and_update(
+            {"id": user["id"], balance_field: {"$gte": final_amount}},
+            {"$inc": {balance_field: -final_amount}},
+            projection={"_id": 0, balance_field: 1},
+            session=session
+        )
+        if buyer is None:
+            raise HTTPException(status_code=400, detail=f"Insufficient {payment_currency} balance")
+    except Exception:
+        if data.reservation_id:
+            await stock_reservations.unconsume(data.reservation_id, session=session)
+        else:
+            await return_stock(db.products, product["id"], data.quantity, session=session)
+        raise
     
     # Create order
     order = Order(
@@ -1172,17 +2013,7 @@ async def create_order(data: OrderCreate, user: dict = Depends(get_current_user)
         notes=data.notes
     )
     
-    await db.orders.insert_one(order.dict())
-    
-    # Update product quantity
-    new_qty = product["quantity"] - data.quantity
-    await db.products.update_one(
-        {"id": product["id"]},
-        {"$set": {
-            "quantity": new_qty,
-            "is_available": new_qty > 0
-        }}
-    )
+    await db.orders.insert_one(order.dict(), session=session)
     
     # Record transaction
     transaction = WalletTransaction(
@@ -1195,31 +2026,258 @@ async def create_order(data: OrderCreate, user: dict = Depends(get_current_user)
         original_amount=total_amount,
         reference=f"ORD-{order.id[:8].upper()}"
     )
-    await db.transactions.insert_one(transaction.dict())
+    await db.transactions.insert_one(transaction.dict(), session=session)
+    rollup_recorder.record_sale(
+        "marketplace", payment_currency, total_amount, final_amount, discount_amount,
+        discount_tier(user, payment_currency), user["id"]
+    )
+    
+    await publish_events(user["id"], [event_hub.build_event(
+        "order.created", "order", order.id, order.status, [order.buyer_id, order.seller_id]
+    )])
     
     return order
 
+async def place_checkout(user_id: str, balance_field: str, final_amount: float, quantities: Dict[str, int],
+                         orders: List[Order], transaction: WalletTransaction, session) -> float:
+    """
+    Debit the buyer, take the stock and write the orders and ledger entry; all or nothing.
+    Inside a transaction when the deployment supports them, else with compensating writes.
+    Returns the buyer's new balance.
+    """
+    async def debit(write_session):
+        buyer = await db.users.find_one_and_update(
+            {"id": user_id, balance_field: {"$gte": final_amount}},
+            {"$inc": {balance_field: -final_amount}},
+            projection={"_id": 0, balance_field: 1},
+            return_document=ReturnDocument.AFTER,
+            session=write_session
+        )
+        if buyer is None:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
+        return buyer[balance_field]
+    
+    async def record(write_session):
+        await db.orders.insert_many([order.dict() for order in orders], session=write_session)
+        await db.transactions.insert_one(transaction.dict(), session=write_session)
+    
+    async def in_transaction(txn_session):
+        new_balance = await debit(txn_session)
+        now = datetime.utcnow()
+        result = await db.products.bulk_write([
+            UpdateOne(
+                {"id": product_id, "is_available": True, "quantity": {"$gte": quantity}},
+                {"$inc": {"quantity": -quantity}, "$set": {"updated_at": now}}
+            )
+            for product_id, quantity in quantities.items()
+        ], ordered=False, session=txn_session)
+        if result.matched_count != len(quantities):
+            raise HTTPException(status_code=409, detail="Some items sold out during checkout; please review your cart")
+        await db.products.update_many(
+            {"id": {"$in": list(quantities)}, "quantity": {"$lte": 0}},
+            {"$set": {"is_available": False, "sold_out": True}},
+            session=txn_session
+        )
+        await record(txn_session)
+        return new_balance
+    
+    if _checkout_transactions["available"]:
+        try:
+            return await session.with_transaction(in_transaction)
+        except OperationFailure as e:
+            if e.code != 20:  # IllegalOperation: standalone server
+                raise
+            logger.warning("Transactions unavailable; checking out with compensating writes")
+            _checkout_transactions["available"] = False
+    
+    taken = []
+    try:
+        for product_id, quantity in quantities.items():
+            if await take_stock(db.products, product_id, quantity, session=session) is None:
+                raise HTTPException(status_code=409, detail="Some items sold out during checkout; please review your cart")
+            taken.append((product_id, quantity))
+        new_balance = await debit(session)
+    except Exception:
+        for product_id, quantity in taken:
+            await return_stock(db.products, product_id, quantity, session=session)
+        raise
+    try:
+        await record(session)
+    except Exception:
+        # Undo everything: no order rows, buyer refunded, stock back
+        await db.orders.delete_many({"id": {"$in": [order.id for order in orders]}}, session=session)
+        await db.users.update_one({"id": user_id}, {"$inc": {balance_field: final_amount}}, session=session)
+        for product_id, quantity in taken:
+            await return_stock(db.products, product_id, quantity, session=session)
+        raise
+    return new_balance
+
+@api_router.post("/checkout")
+async def checkout_cart(data: CheckoutRequest, request: Request, user: dict = Depends(get_current_user),
+                        session=Depends(get_db_session), attempts=Depends(velocity_attempts)):
+    """Buy a whole cart in one request: one discount, one wallet debit, one order per seller"""
+    quantities: Dict[str, int] = {}
+    for item in data.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    
+    products = await db.products.find(
+        {"id": {"$in": list(quantities)}, "is_available": True}, {"_id": 0}, session=session
+    ).to_list(None)
+    products_by_id = {product["id"]: product for product in products}
+    missing = [product_id for product_id in quantities if product_id not in products_by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Products not found or unavailable: {', '.join(missing)}")
+    
+    payment_currency = data.payment_currency.upper()
+    lines_by_seller: Dict[str, List[OrderItem]] = {}
+    for product_id, quantity in quantities.items():
+        product = products_by_id[product_id]
+        if product["seller_id"] == user["id"]:
+            raise HTTPException(status_code=400, detail="Cannot buy your own product")
+        if product["quantity"] < quantity:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product['title']}")
+        if payment_currency == 'COST' and product.get('price_in_cost'):
+            unit_price = product['price_in_cost']
+        else:
+            unit_price = product["price"]
+        lines_by_seller.setdefault(product["seller_id"], []).append(OrderItem(
+            product_id=product_id,
+            product_title=product["title"],
+            product_image=product["images"][0] if product.get("images") else None,
+            quantity=quantity,
+            unit_price=unit_price,
+            total_amount=unit_price * quantity,
+        ))
+    
+    # Price and discount the cart once, then split the discount across sellers by subtotal
+    total_amount = sum(line.total_amount for lines in lines_by_seller.values() for line in lines)
+    discount_percent, discount_amount, final_amount = calculate_discount(
+        user, payment_currency, total_amount
+    )
+    
+    balance_field = {
+        'FIAT': 'wallet_balance',
+        'SOL': 'sol_balance',
+        'USDT': 'usdt_balance',
+        'COST': 'cost_balance',
+    }.get(payment_currency, 'wallet_balance')
+    
+    if user.get(balance_field, 0.0) < final_amount:
+        raise HTTPException(status_code=400, detail=f"Insufficient {payment_currency} balance")
+    
+    velocity = await check_velocity('checkout', request, user, final_amount, payment_currency, attempts, session=session)
+    if velocity.outcome == HOLD:
+        raise HTTPException(status_code=403, detail="This purchase requires review; please contact support")
+    
+    checkout_id = str(uuid.uuid4())
+    orders = []
+    discount_left = discount_amount
+    for index, (seller_id, lines) in enumerate(lines_by_seller.items()):
+        subtotal = sum(line.total_amount for line in lines)
+        if index == len(lines_by_seller) - 1:
+            seller_discount = discount_left  # remainder, so the orders add up to the debit exactly
+        else:
+            seller_discount = discount_amount * subtotal / total_amount if total_amount else 0.0
+        discount_left -= seller_discount
+        units = sum(line.quantity for line in lines)
+        first = products_by_id[lines[0].product_id]
+        orders.append(Order(
+            buyer_id=user["id"],
+            buyer_name=user["full_name"],
+            seller_id=seller_id,
+            seller_name=first["seller_name"],
+            product_id=first["id"],
+            product_title=first["title"] if len(lines) == 1 else f"{first['title']} + {len(lines) - 1} more",
+            product_image=lines[0].product_image,
+            quantity=units,
+            unit_price=lines[0].unit_price if len(lines) == 1 else subtotal / units,
+            total_amount=subtotal,
+            discount_applied=seller_discount,
+            final_amount=subtotal - seller_discount,
+            payment_currency=payment_currency,
+            delivery_address=data.delivery_address,
+            notes=data.notes,
+            checkout_id=checkout_id,
+            items=lines,
+        ))
+    
+    transaction = WalletTransaction(
+        user_id=user["id"],
+        amount=final_amount,
+        currency=payment_currency,
+        transaction_type="purchase",
+        description=f"Checkout: {sum(quantities.values())} items from {len(orders)} sellers",
+        discount_applied=discount_amount,
+        original_amount=total_amount,
+        reference=f"CHK-{checkout_id[:8].upper()}"
+    )
+    new_balance = await place_checkout(
+        user["id"], balance_field, final_amount, quantities, orders, transaction, session
+    )
+    rollup_recorder.record_sale(
+        "marketplace", payment_currency, total_amount, final_amount, discount_amount,
+        discount_tier(user, payment_currency), user["id"]
+    )
+    
+    await publish_events(user["id"], [
+        event_hub.build_event("order.created", "order", order.id, order.status, [order.buyer_id, order.seller_id])
+        for order in orders
+    ])
+    
+    return {
+        "checkout_id": checkout_id,
+        "reference": transaction.reference,
+        "orders": orders,
+        "total_amount": total_amount,
+        "discount_percent": discount_percent,
+        "discount_applied": discount_amount,
+        "final_amount": final_amount,
+        "new_balance": new_balance,
+    }
+
+@api_router.post("/products/{product_id}/reserve")
+async def reserve_product(product_id: str, data: StockReservationCreate, user: dict = Depends(get_current_user_cached)):
+    """Hold units while the buyer confirms; pass reservation_id to POST /orders before expires_at"""
+    product = await db.products.find_one({"id": product_id}, {"_id": 0, "seller_id": 1})
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if product["seller_id"] == user["id"]:
+        raise HTTPException(status_code=400, detail="Cannot reserve your own product")
+    if await stock_reservations.active_count(user["id"]) >= stock_reservations.max_active_per_user:
+        raise HTTPException(status_code=429, detail="Too many active reservations")
+    reservation = await stock_reservations.reserve(product_id, user["id"], data.quantity)
+    if reservation is None:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+    return reservation
+
+@api_router.delete("/reservations/{reservation_id}")
+async def release_reservation(reservation_id: str, user: dict = Depends(get_current_user_cached)):
+    if not await stock_reservations.release(reservation_id, user["id"]):
+        raise HTTPException(status_code=404, detail="Reservation not found or no longer held")
+    return {"message": "Reservation released"}
+
 @api_router.get("/orders")
-async def get_my_orders(user: dict = Depends(get_current_user)):
-    orders = await db.orders.find(
-        {"buyer_id": user["id"]}
-    ).sort("created_at", -1).to_list(100)
+async def get_my_orders(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), user: dict = Depends(get_current_user_cached)):
+    orders = await find_history(
+        db, "orders", {"buyer_id": user["id"]}, skip, min(limit, 100), HISTORY_INCLUDES_ARCHIVE
+    )
     return orders
 
 @api_router.get("/orders/sales")
-async def get_my_sales(user: dict = Depends(get_current_user)):
-    orders = await db.orders.find(
-        {"seller_id": user["id"]}
-    ).sort("created_at", -1).to_list(100)
+async def get_my_sales(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), user: dict = Depends(get_current_user_cached)):
+    orders = await find_history(
+        db, "orders", {"seller_id": user["id"]}, skip, min(limit, 100), HISTORY_INCLUDES_ARCHIVE
+    )
     return orders
 
 @api_router.put("/orders/{order_id}/status")
 async def update_order_status(
     order_id: str,
     status: str,
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_current_user),
+    session=Depends(get_db_session)
 ):
-    order = await db.orders.find_one({"id": order_id})
+    order = await db.orders.find_one({"id": order_id}, session=session)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -1242,26 +2300,33 @@ async def update_order_status(
         
         await db.users.update_one(
             {"id": order["seller_id"]},
-            {"$inc": {balance_field: order["final_amount"]}}
+            {"$inc": {balance_field: order["final_amount"]}},
+            session=session
         )
         
         # Add loyalty points
         await db.users.update_one(
             {"id": order["buyer_id"]},
-            {"$inc": {"loyalty_points": int(order["final_amount"] / 100)}}
+            {"$inc": {"loyalty_points": int(order["final_amount"] / 100)}},
+            session=session
         )
     
     await db.orders.update_one(
         {"id": order_id},
-        {"$set": {"status": status, "updated_at": datetime.utcnow()}}
+        {"$set": {"status": status, "updated_at": datetime.utcnow()}},
+        session=session
     )
     
+    await publish_events(user["id"], [event_hub.build_event(
+        "order.status", "order", order_id, status, [order["buyer_id"], order["seller_id"]]
+    )])
+    
     return {"message": f"Order status updated to {status}"}
 
 # ==================== SERVICES ROUTES ====================
 
 @api_router.post("/services", response_model=Service)
-async def create_service(data: ServiceCreate, user: dict = Depends(get_current_user)):
+async def create_service(data: ServiceCreate, user: dict = Depends(get_current_user_cached)):
     price_in_cost = data.price_in_cost
     if not price_in_cost:
         user_currency = user.get('currency', {}).get('code', 'NGN')
@@ -1271,7 +2336,8 @@ async def create_service(data: ServiceCreate, user: dict = Depends(get_current_u
         provider_id=user["id"],
         provider_name=user["full_name"],
         price_in_cost=price_in_cost,
-        **data.dict(exclude={'price_in_cost'})
+        duration_minutes=data.duration_minutes or parse_duration_minutes(data.duration),
+        **data.dict(exclude={'price_in_cost', 'duration_minutes'})
     )
     await db.services.insert_one(service.dict())
     return service
@@ -1280,7 +2346,11 @@ async def create_service(data: ServiceCreate, user: dict = Depends(get_current_u
 async def get_services(
     service_type: Optional[str] = None,
     search: Optional[str] = None,
-    limit: int = 50
+    near_lng: Optional[float] = None,
+    near_lat: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100)
 ):
     query = {"is_available": True}
     
@@ -1292,26 +2362,130 @@ async def get_services(
             {"description": {"$regex": search, "$options": "i"}}
         ]
     
-    services = await db.services.find(query).sort("created_at", -1).to_list(limit)
+    collection = database.for_route("get_services").services
+    if near_lng is not None or near_lat is not None or radius_km is not None:
+        return await find_near(collection, query, near_lng, near_lat, radius_km, skip, limit)
+    services = await collection.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     return services
 
 @api_router.get("/services/{service_id}")
 async def get_service(service_id: str):
-    service = await db.services.find_one({"id": service_id})
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
+    service = caches["services"].get(service_id)
+    if service is None:
+        service = await db.services.find_one({"id": service_id})
+        if not service:
+            raise HTTPException(status_code=404, detail="Service not found")
+        caches["services"].set(service_id, service)
     return service
 
 @api_router.get("/my-services")
-async def get_my_services(user: dict = Depends(get_current_user)):
+async def get_my_services(user: dict = Depends(get_current_user_cached)):
     services = await db.services.find(
         {"provider_id": user["id"]}
     ).sort("created_at", -1).to_list(100)
     return services
 
+def service_duration_minutes(service: dict) -> int:
+    return service.get("duration_minutes") or parse_duration_minutes(service.get("duration")) or DEFAULT_DURATION_MINUTES
+
+def booking_window(data: ServiceBookingCreate, service: dict):
+    """
+    Structured [start, end) for a booking. Free-text dates/times that don't parse
+    (e.g. "Morning") keep working as unscheduled bookings: (None, None).
+    """
+    start_at = data.start_at
+    if start_at is None and data.scheduled_time:
+        time_of_day = parse_time_of_day(data.scheduled_time)
+        try:
+            day = datetime.strptime(data.scheduled_date, "%Y-%m-%d").date()
+        except ValueError:
+            day = None
+        if day is not None and time_of_day is not None:
+            start_at = datetime.combine(day, time_of_day)
+    if start_at is None:
+        return None, None
+    start_at = to_local(start_at, PLATFORM_TIMEZONE).replace(second=0, microsecond=0)
+    return start_at, start_at + timedelta(minutes=service_duration_minutes(service))
+
+async def reserve_provider_slot(provider_id: str, booking_id: str, start_at: datetime, end_at: datetime, session=None):
+    availability = await db.provider_availability.find_one({"provider_id": provider_id}, session=session)
+    if not within_rules((availability or {}).get("rules", []), start_at, end_at):
+        raise HTTPException(status_code=400, detail="Provider is not available at that time")
+    
+    # Fast, index-backed overlap check for a friendly error...
+    conflict = await db.service_bookings.find_one({
+        "provider_id": provider_id,
+        "status": {"$in": ACTIVE_BOOKING_STATUSES},
+        "start_at": {"$lt": end_at},
+        "end_at": {"$gt": start_at},
+    }, {"_id": 1}, session=session)
+    # ...and the unique slot claims make the reservation itself atomic
+    if conflict or not await slot_reservations.reserve(provider_id, booking_id, start_at, end_at, session=session):
+        raise HTTPException(status_code=409, detail="This time slot is already booked")
+
+@api_router.get("/my-availability", response_model=ProviderAvailability)
+async def get_my_availability(user: dict = Depends(get_current_user_cached)):
+    availability = await db.provider_availability.find_one({"provider_id": user["id"]})
+    return ProviderAvailability(rules=(availability or {}).get("rules", []))
+
+@api_router.put("/my-availability", response_model=ProviderAvailability)
+async def set_my_availability(data: ProviderAvailability, user: dict = Depends(get_current_user_cached)):
+    """Weekly availability windows applied to all of the provider's services"""
+    await db.provider_availability.update_one(
+        {"provider_id": user["id"]},
+        {"$set": {"rules": [rule.dict() for rule in data.rules], "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return data
+
+@api_router.get("/services/{service_id}/availability")
+async def get_service_availability(service_id: str, from_date: str, to_date: Optional[str] = None):
+    """Free slots for a service between two dates (inclusive), computed from one indexed bookings query"""
+    service = await get_service(service_id)
+    try:
+        start_day = datetime.strptime(from_date, "%Y-%m-%d").date()
+        end_day = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else start_day
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if end_day < start_day or (end_day - start_day).days >= MAX_AVAILABILITY_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must span 1-{MAX_AVAILABILITY_RANGE_DAYS} days")
+    
+    range_start = datetime.combine(start_day, datetime.min.time())
+    range_end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    availability, bookings = await asyncio.gather(
+        db.provider_availability.find_one({"provider_id": service["provider_id"]}),
+        db.service_bookings.find(
+            {
+                "provider_id": service["provider_id"],
+                "status": {"$in": ACTIVE_BOOKING_STATUSES},
+                "start_at": {"$lt": range_end},
+                "end_at": {"$gt": range_start},
+            },
+            {"_id": 0, "start_at": 1, "end_at": 1}
+        ).sort("start_at", 1).to_list(None),
+    )
+    rules = (availability or {}).get("rules", [])
+    duration = service_duration_minutes(service)
+    slots = free_slots(
+        rules,
+        [(b["start_at"], b["end_at"]) for b in bookings],
+        start_day,
+        end_day,
+        duration,
+        not_before=local_now(PLATFORM_TIMEZONE),
+    )
+    return {
+        "service_id": service_id,
+        "provider_id": service["provider_id"],
+        "duration_minutes": duration,
+        "has_schedule": bool(rules),
+        "slots": slots,
+    }
+
 @api_router.post("/services/book", response_model=ServiceBooking)
-async def book_service(data: ServiceBookingCreate, user: dict = Depends(get_current_user)):
-    service = await db.services.find_one({"id": data.service_id, "is_available": True})
+async def book_service(data: ServiceBookingCreate, request: Request, user: dict = Depends(get_current_user),
+                       session=Depends(get_db_session), attempts=Depends(velocity_attempts)):
+    service = await db.services.find_one({"id": data.service_id, "is_available": True}, session=session)
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
     
@@ -1343,13 +2517,29 @@ async def book_service(data: ServiceBookingCreate, user: dict = Depends(get_curr
     if user_balance < final_amount:
         raise HTTPException(status_code=400, detail=f"Insufficient {payment_currency} balance")
     
+    velocity = await check_velocity('checkout', request, user, final_amount, payment_currency, attempts, session=session)
+    if velocity.outcome == HOLD:
+        raise HTTPException(status_code=403, detail="This purchase requires review; please contact support")
+    
+    # Reserve the provider's time before taking payment
+    booking_id = str(uuid.uuid4())
+    start_at, end_at = booking_window(data, service)
+    if start_at is not None:
+        await reserve_provider_slot(service["provider_id"], booking_id, start_at, end_at, session)
+    
     # Deduct from wallet (escrow)
-    await db.users.update_one(
-        {"id": user["id"]},
-        {"$inc": {balance_field: -final_amount}}
-    )
+    try:
+        await db.users.update_one(
+            {"id": user["id"]},
+            {"$inc": {balance_field: -final_amount}},
+            session=session
+        )
+    except Exception:
+        await slot_reservations.release(booking_id, session=session)
+        raise
     
     booking = ServiceBooking(
+        id=booking_id,
         service_id=service["id"],
         service_title=service["title"],
         client_id=user["id"],
@@ -1358,15 +2548,18 @@ async def book_service(data: ServiceBookingCreate, user: dict = Depends(get_curr
         provider_name=service["provider_name"],
         scheduled_date=data.scheduled_date,
         scheduled_time=data.scheduled_time,
+        start_at=start_at,
+        end_at=end_at,
         notes=data.notes,
         location=data.location,
+        geo_location=data.geo_location,
         amount=amount,
         discount_applied=discount_amount,
         final_amount=final_amount,
         payment_currency=payment_currency
     )
     
-    await db.service_bookings.insert_one(booking.dict())
+    await db.service_bookings.insert_one(booking.dict(), session=session)
     
     transaction = WalletTransaction(
         user_id=user["id"],
@@ -1378,24 +2571,34 @@ async def book_service(data: ServiceBookingCreate, user: dict = Depends(get_curr
         original_amount=amount,
         reference=f"SVC-{booking.id[:8].upper()}"
     )
-    await db.transactions.insert_one(transaction.dict())
+    await db.transactions.insert_one(transaction.dict(), session=session)
+    rollup_recorder.record_sale(
+        "services", payment_currency, amount, final_amount, discount_amount,
+        discount_tier(user, payment_currency), user["id"]
+    )
+    
+    await publish_events(user["id"], [event_hub.build_event(
+        "booking.created", "booking", booking.id, booking.status, [booking.client_id, booking.provider_id]
+    )])
     
     return booking
 
 @api_router.get("/bookings")
-async def get_my_bookings(user: dict = Depends(get_current_user)):
-    bookings = await db.service_bookings.find(
-        {"$or": [{"client_id": user["id"]}, {"provider_id": user["id"]}]}
-    ).sort("created_at", -1).to_list(100)
+async def get_my_bookings(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), user: dict = Depends(get_current_user_cached)):
+    bookings = await find_history(
+        db, "service_bookings", {"$or": [{"client_id": user["id"]}, {"provider_id": user["id"]}]},
+        skip, min(limit, 100), HISTORY_INCLUDES_ARCHIVE
+    )
     return bookings
 
 @api_router.put("/bookings/{booking_id}/status")
 async def update_booking_status(
     booking_id: str,
     status: str,
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_current_user),
+    session=Depends(get_db_session)
 ):
-    booking = await db.service_bookings.find_one({"id": booking_id})
+    booking = await db.service_bookings.find_one({"id": booking_id}, session=session)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
@@ -1413,24 +2616,34 @@ async def update_booking_status(
         
         await db.users.update_one(
             {"id": booking["provider_id"]},
-            {"$inc": {balance_field: booking["final_amount"]}}
+            {"$inc": {balance_field: booking["final_amount"]}},
+            session=session
         )
         await db.users.update_one(
             {"id": booking["client_id"]},
-            {"$inc": {"loyalty_points": int(booking["final_amount"] / 100)}}
+            {"$inc": {"loyalty_points": int(booking["final_amount"] / 100)}},
+            session=session
         )
     
     await db.service_bookings.update_one(
         {"id": booking_id},
-        {"$set": {"status": status}}
+        {"$set": {"status": status}},
+        session=session
     )
+    if status not in ACTIVE_BOOKING_STATUSES:
+        # Free the provider's calendar once the booking no longer holds the time
+        await slot_reservations.release(booking_id, session=session)
+    
+    await publish_events(user["id"], [event_hub.build_event(
+        "booking.status", "booking", booking_id, status, [booking["client_id"], booking["provider_id"]]
+    )])
     
     return {"message": f"Booking status updated to {status}"}
 
 # ==================== RESTAURANT & FOOD ROUTES ====================
 
 @api_router.post("/restaurants", response_model=Restaurant)
-async def create_restaurant(data: RestaurantCreate, user: dict = Depends(get_current_user)):
+async def create_restaurant(data: RestaurantCreate, user: dict = Depends(get_current_user_cached)):
     restaurant = Restaurant(
         owner_id=user["id"],
         **data.dict()
@@ -1441,7 +2654,12 @@ async def create_restaurant(data: RestaurantCreate, user: dict = Depends(get_cur
 @api_router.get("/restaurants")
 async def get_restaurants(
     cuisine: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    near_lng: Optional[float] = None,
+    near_lat: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100)
 ):
     query = {"is_open": True}
     
@@ -1453,18 +2671,24 @@ async def get_restaurants(
             {"description": {"$regex": search, "$options": "i"}}
         ]
     
-    restaurants = await db.restaurants.find(query).sort("rating", -1).to_list(50)
+    collection = database.for_route("get_restaurants").restaurants
+    if near_lng is not None or near_lat is not None or radius_km is not None:
+        return await find_near(collection, query, near_lng, near_lat, radius_km, skip, limit)
+    restaurants = await collection.find(query).sort("rating", -1).skip(skip).limit(limit).to_list(limit)
     return restaurants
 
 @api_router.get("/restaurants/{restaurant_id}")
 async def get_restaurant(restaurant_id: str):
-    restaurant = await db.restaurants.find_one({"id": restaurant_id})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
+    restaurant = caches["restaurants"].get(restaurant_id)
+    if restaurant is None:
+        restaurant = await db.restaurants.find_one({"id": restaurant_id})
+        if not restaurant:
+            raise HTTPException(status_code=404, detail="Restaurant not found")
+        caches["restaurants"].set(restaurant_id, restaurant)
     return restaurant
 
 @api_router.post("/menu-items", response_model=MenuItem)
-async def create_menu_item(data: MenuItemCreate, user: dict = Depends(get_current_user)):
+async def create_menu_item(data: MenuItemCreate, user: dict = Depends(get_current_user_cached)):
     restaurant = await db.restaurants.find_one({
         "id": data.restaurant_id,
         "owner_id": user["id"]
@@ -1479,18 +2703,23 @@ async def create_menu_item(data: MenuItemCreate, user: dict = Depends(get_curren
     
     menu_item = MenuItem(price_in_cost=price_in_cost, **data.dict(exclude={'price_in_cost'}))
     await db.menu_items.insert_one(menu_item.dict())
+    caches["menus"].invalidate(menu_item.restaurant_id)
     return menu_item
 
 @api_router.get("/restaurants/{restaurant_id}/menu")
 async def get_menu(restaurant_id: str):
-    items = await db.menu_items.find(
-        {"restaurant_id": restaurant_id, "is_available": True}
-    ).to_list(100)
+    items = caches["menus"].get(restaurant_id)
+    if items is None:
+        items = await database.for_route("get_menu").menu_items.find(
+            {"restaurant_id": restaurant_id, "is_available": True}
+        ).to_list(100)
+        caches["menus"].set(restaurant_id, items)
     return items
 
 @api_router.post("/food-orders", response_model=FoodOrder)
-async def create_food_order(data: FoodOrderCreate, user: dict = Depends(get_current_user)):
-    restaurant = await db.restaurants.find_one({"id": data.restaurant_id})
+async def create_food_order(data: FoodOrderCreate, request: Request, user: dict = Depends(get_current_user),
+                            session=Depends(get_db_session), attempts=Depends(velocity_attempts)):
+    restaurant = await db.restaurants.find_one({"id": data.restaurant_id}, session=session)
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
     
@@ -1499,7 +2728,7 @@ async def create_food_order(data: FoodOrderCreate, user: dict = Depends(get_curr
     order_items = []
     
     for item in data.items:
-        menu_item = await db.menu_items.find_one({"id": item["menu_item_id"]})
+        menu_item = await db.menu_items.find_one({"id": item["menu_item_id"]}, session=session)
         if menu_item:
             if payment_currency == 'COST' and menu_item.get('price_in_cost'):
                 item_price = menu_item['price_in_cost']
@@ -1539,9 +2768,14 @@ async def create_food_order(data: FoodOrderCreate, user: dict = Depends(get_curr
     if user_balance < final_amount:
         raise HTTPException(status_code=400, detail=f"Insufficient {payment_currency} balance")
     
+    velocity = await check_velocity('checkout', request, user, final_amount, payment_currency, attempts, session=session)
+    if velocity.outcome == HOLD:
+        raise HTTPException(status_code=403, detail="This purchase requires review; please contact support")
+    
     await db.users.update_one(
         {"id": user["id"]},
-        {"$inc": {balance_field: -final_amount}}
+        {"$inc": {balance_field: -final_amount}},
+        session=session
     )
     
     order = FoodOrder(
@@ -1560,7 +2794,7 @@ async def create_food_order(data: FoodOrderCreate, user: dict = Depends(get_curr
         notes=data.notes
     )
     
-    await db.food_orders.insert_one(order.dict())
+    await db.food_orders.insert_one(order.dict(), session=session)
     
     transaction = WalletTransaction(
         user_id=user["id"],
@@ -1572,28 +2806,37 @@ async def create_food_order(data: FoodOrderCreate, user: dict = Depends(get_curr
         original_amount=total_amount,
         reference=f"FOOD-{order.id[:8].upper()}"
     )
-    await db.transactions.insert_one(transaction.dict())
+    await db.transactions.insert_one(transaction.dict(), session=session)
+    rollup_recorder.record_sale(
+        "food", payment_currency, total_amount, final_amount, discount_amount,
+        discount_tier(user, payment_currency), user["id"]
+    )
+    
+    await publish_events(user["id"], [event_hub.build_event(
+        "food_order.created", "food_order", order.id, order.status, [order.customer_id, restaurant["owner_id"]]
+    )])
     
     return order
 
 @api_router.get("/food-orders")
-async def get_my_food_orders(user: dict = Depends(get_current_user)):
-    orders = await db.food_orders.find(
-        {"customer_id": user["id"]}
-    ).sort("created_at", -1).to_list(100)
+async def get_my_food_orders(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), user: dict = Depends(get_current_user_cached)):
+    orders = await find_history(
+        db, "food_orders", {"customer_id": user["id"]}, skip, min(limit, 100), HISTORY_INCLUDES_ARCHIVE
+    )
     return orders
 
 @api_router.put("/food-orders/{order_id}/status")
 async def update_food_order_status(
     order_id: str,
     status: str,
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_current_user),
+    session=Depends(get_db_session)
 ):
-    order = await db.food_orders.find_one({"id": order_id})
+    order = await db.food_orders.find_one({"id": order_id}, session=session)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    restaurant = await db.restaurants.find_one({"id": order["restaurant_id"]})
+    restaurant = await db.restaurants.find_one({"id": order["restaurant_id"]}, session=session)
     
     if restaurant["owner_id"] != user["id"] and order["customer_id"] != user["id"]:
         raise HTTPException(status_code=403, detail="Not authorized")
@@ -1609,24 +2852,359 @@ async def update_food_order_status(
         
         await db.users.update_one(
             {"id": restaurant["owner_id"]},
-            {"$inc": {balance_field: order["subtotal"]}}
+            {"$inc": {balance_field: order["subtotal"]}},
+            session=session
         )
         await db.users.update_one(
             {"id": order["customer_id"]},
-            {"$inc": {"loyalty_points": int(order["final_amount"] / 100)}}
+            {"$inc": {"loyalty_points": int(order["final_amount"] / 100)}},
+            session=session
         )
     
     await db.food_orders.update_one(
         {"id": order_id},
-        {"$set": {"status": status}}
+        {"$set": {"status": status}},
+        session=session
     )
     
+    await publish_events(user["id"], [event_hub.build_event(
+        "food_order.status", "food_order", order_id, status, [order["customer_id"], restaurant["owner_id"]]
+    )])
+    
     return {"message": f"Order status updated to {status}"}
 
+# ==================== BATCH STATUS ROUTES ====================
+
+# How each kind authorizes (payee/payer may update) and settles on its terminal status
+BATCH_STATUS_KINDS = {
+    "order": {
+        "collection": "orders",
+        "statuses": ["confirmed", "in_transit", "delivered", "cancelled"],
+        "settle_on": "delivered",
+        "payee": "seller_id",
+        "payer": "buyer_id",
+        "settle_amount": "final_amount",
+        "touch_updated_at": True,
+    },
+    "booking": {
+        "collection": "service_bookings",
+        "statuses": ["confirmed", "in_progress", "completed", "cancelled"],
+        "settle_on": "completed",
+        "payee": "provider_id",
+        "payer": "client_id",
+        "settle_amount": "final_amount",
+        "touch_updated_at": False,
+    },
+    "food_order": {
+        "collection": "food_orders",
+        "statuses": ["confirmed", "preparing", "ready", "in_transit", "delivered", "cancelled"],
+        "settle_on": "delivered",
+        "payee": "owner_id",  # Filled in from the order's restaurant
+        "payer": "customer_id",
+        "settle_amount": "subtotal",
+        "touch_updated_at": False,
+    },
+}
+
+async def apply_batch_status(kind: str, data: BatchStatusUpdate, user: dict, session=None) -> dict:
+    """
+    Authorize every id with one query, apply the changes with one bulk_write and
+    settle with one $inc per credited user. Each status update is guarded on the
+    status we read and tagged with this batch's id, so an item changed concurrently
+    is reported as a conflict instead of being settled twice.
+    """
+    spec = BATCH_STATUS_KINDS[kind]
+    collection = db[spec["collection"]]
+    docs = await collection.find(
+        {"id": {"$in": [change.id for change in data.updates]}}, {"_id": 0}, session=session
+    ).to_list(None)
+    if kind == "food_order" and docs:
+        restaurants = await db.restaurants.find(
+            {"id": {"$in": list({doc["restaurant_id"] for doc in docs})}},
+            {"_id": 0, "id": 1, "owner_id": 1},
+            session=session
+        ).to_list(None)
+        owners = {restaurant["id"]: restaurant["owner_id"] for restaurant in restaurants}
+        for doc in docs:
+            doc["owner_id"] = owners.get(doc["restaurant_id"])
+    by_id = {doc["id"]: doc for doc in docs}
+    
+    results = {}
+    planned = []
+    operations = []
+    now = datetime.utcnow()
+    batch_id = str(uuid.uuid4())
+    for change in data.updates:
+        doc = by_id.get(change.id)
+        if doc is None:
+            results[change.id] = {"id": change.id, "ok": False, "error": "not_found"}
+        elif user["id"] not in (doc[spec["payee"]], doc[spec["payer"]]):
+            results[change.id] = {"id": change.id, "ok": False, "error": "not_authorized"}
+        elif change.status not in spec["statuses"]:
+            results[change.id] = {"id": change.id, "ok": False, "error": "invalid_status"}
+        else:
+            fields = {"status": change.status, "status_batch_id": batch_id}
+            if spec["touch_updated_at"]:
+                fields["updated_at"] = now
+            operations.append(UpdateOne({"id": change.id, "status": doc["status"]}, {"$set": fields}))
+            planned.append((change, doc))
+    
+    applied = set()
+    if operations:
+        result = await collection.bulk_write(operations, ordered=False, session=session)
+        if result.matched_count == len(operations):
+            applied = {change.id for change, _ in planned}
+        else:
+            # Some guards missed: only the items tagged with this batch were written by it. Matching
+            # on status would also count items another request had already moved to the same status.
+            current = await collection.find(
+                {"id": {"$in": [change.id for change, _ in planned]}, "status_batch_id": batch_id},
+                {"_id": 0, "id": 1},
+                session=session
+            ).to_list(None)
+            applied = {doc["id"] for doc in current}
+    
+    credits: Dict[str, Dict[str, float]] = {}
+    for change, doc in planned:
+        if change.id not in applied:
+            results[change.id] = {"id": change.id, "ok": False, "error": "conflict"}
+            continue
+        results[change.id] = {"id": change.id, "ok": True, "status": change.status}
+        if change.status == spec["settle_on"] and doc["status"] != spec["settle_on"]:
+            balance_field = {
+                'FIAT': 'wallet_balance',
+                'SOL': 'sol_balance',
+                'USDT': 'usdt_balance',
+                'COST': 'cost_balance',
+            }.get(doc.get("payment_currency", "FIAT"), 'wallet_balance')
+            payee_inc = credits.setdefault(doc[spec["payee"]], {})
+            payee_inc[balance_field] = payee_inc.get(balance_field, 0) + doc[spec["settle_amount"]]
+            payer_inc = credits.setdefault(doc[spec["payer"]], {})
+            payer_inc["loyalty_points"] = payer_inc.get("loyalty_points", 0) + int(doc["final_amount"] / 100)
+    
+    if credits:
+        await db.users.bulk_write(
+            [UpdateOne({"id": user_id}, {"$inc": inc}) for user_id, inc in credits.items()],
+            ordered=False,
+            session=session
+        )
+    if kind == "booking":
+        released = [change.id for change, _ in planned if change.id in applied and change.status not in ACTIVE_BOOKING_STATUSES]
+        if released:
+            await slot_reservations.release_many(released, session=session)
+    
+    await publish_events(user["id"], [
+        event_hub.build_event(f"{kind}.status", kind, change.id, change.status, [doc[spec["payer"]], doc[spec["payee"]]])
+        for change, doc in planned if change.id in applied
+    ])
+    
+    return {
+        "updated": len(applied),
+        "results": [results[change.id] for change in data.updates],
+    }
+
+@api_router.put("/orders/status/batch")
+async def batch_update_order_status(data: BatchStatusUpdate, user: dict = Depends(get_current_user), session=Depends(get_db_session)):
+    return await apply_batch_status("order", data, user, session)
+
+@api_router.put("/bookings/status/batch")
+async def batch_update_booking_status(data: BatchStatusUpdate, user: dict = Depends(get_current_user), session=Depends(get_db_session)):
+    return await apply_batch_status("booking", data, user, session)
+
+@api_router.put("/food-orders/status/batch")
+async def batch_update_food_order_status(data: BatchStatusUpdate, user: dict = Depends(get_current_user), session=Depends(get_db_session)):
+    return await apply_batch_status("food_order", data, user, session)
+
+# ==================== BULK IMPORT ROUTES ====================
+
+async def run_listing_import(request: Request, user: dict, kind: str, importer: ListingImporter,
+                             format: Optional[str], background: bool, on_complete=None):
+    """
+    Small uploads are imported inline, straight off the request stream.
+    Large ones (or ?background=true) are spooled and imported as a job; poll GET /imports/{job_id}.
+    """
+    try:
+        fmt = detect_format(request.headers.get("content-type"), format)
+    except ImportRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Chunked uploads have no declared length, so they are always spooled (and capped there)
+    content_length = request.headers.get("content-length")
+    if content_length is not None and int(content_length) > IMPORT_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {IMPORT_MAX_UPLOAD_BYTES} bytes")
+    if not background and content_length is not None and int(content_length) <= IMPORT_INLINE_MAX_BYTES:
+        report = await importer.run(iter_rows(request.stream(), fmt))
+        if on_complete:
+            on_complete()
+        return report.dict()
+    
+    try:
+        spool, size = await spool_upload(request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    job = await import_jobs.create(user["id"], kind, fmt, size)
+    import_jobs.start(job["id"], importer, spool, fmt, on_complete)
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job["id"], "status": job["status"], "poll": f"/api/imports/{job['id']}"}
+    )
+
+@api_router.post("/products/import")
+async def import_products(
+    request: Request,
+    format: Optional[str] = None,
+    background: bool = False,
+    user: dict = Depends(get_current_user_cached)
+):
+    """Bulk-create products from a CSV (header row) or NDJSON body"""
+    rates = await get_exchange_rates()  # One rate snapshot for the whole upload
+    user_currency = user.get('currency', {}).get('code', 'NGN')
+    
+    def build_product(data: ProductCreate) -> dict:
+        price_in_cost = data.price_in_cost or convert_with_rates(data.price, user_currency, 'COST', rates)
+        return Product(
+            seller_id=user["id"],
+            seller_name=user["full_name"],
+            price_in_cost=price_in_cost,
+            **data.dict(exclude={'price_in_cost'})
+        ).dict()
+    
+    importer = ListingImporter(db.products, ProductCreate, build_product)
+    return await run_listing_import(request, user, "products", importer, format, background)
+
+@api_router.post("/menu-items/import")
+async def import_menu_items(
+    request: Request,
+    format: Optional[str] = None,
+    background: bool = False,
+    restaurant_id: Optional[str] = None,
+    user: dict = Depends(get_current_user_cached)
+):
+    """Bulk-create menu items; rows may omit restaurant_id when it is given as a query parameter"""
+    owned = await db.restaurants.find({"owner_id": user["id"]}, {"_id": 0, "id": 1}).to_list(None)
+    owned_ids = {restaurant["id"] for restaurant in owned}
+    if restaurant_id and restaurant_id not in owned_ids:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    rates = await get_exchange_rates()
+    user_currency = user.get('currency', {}).get('code', 'NGN')
+    touched = set()
+    
+    def build_menu_item(data: MenuItemCreate) -> dict:
+        if data.restaurant_id not in owned_ids:
+            raise ValueError(f"Not authorized for restaurant {data.restaurant_id}")
+        touched.add(data.restaurant_id)
+        price_in_cost = data.price_in_cost or convert_with_rates(data.price, user_currency, 'COST', rates)
+        return MenuItem(price_in_cost=price_in_cost, **data.dict(exclude={'price_in_cost'})).dict()
+    
+    def invalidate_menus():
+        for touched_id in touched:
+            caches["menus"].invalidate(touched_id)
+    
+    defaults = {"restaurant_id": restaurant_id} if restaurant_id else None
+    importer = ListingImporter(db.menu_items, MenuItemCreate, build_menu_item, defaults=defaults)
+    return await run_listing_import(request, user, "menu_items", importer, format, background, invalidate_menus)
+
+@api_router.get("/imports/{job_id}")
+async def get_import_job(job_id: str, user: dict = Depends(get_current_user_cached)):
+    job = await import_jobs.get(job_id, user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+# ==================== STATUS EVENTS ====================
+
+@api_router.websocket("/ws/events")
+async def status_events(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Push channel for order, booking and food order status changes.
+    Authenticates with the same JWT, passed as ?token= (browsers and React Native
+    can't set headers on a WebSocket) or as a Bearer Authorization header.
+    """
+    if token is not None:
+        try:
+            user_id = decode_user_id(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+        except HTTPException:
+            user_id = None
+    else:
+        user_id = user_id_from_headers(websocket.headers)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    queue = event_hub.subscribe(user_id)
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=WS_PING_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                event = {"type": "ping"}
+            await websocket.send_json(event)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        event_hub.unsubscribe(user_id, queue)
+
+# ==================== ACTIVITY ====================
+
+@api_router.get("/activity")
+async def get_activity(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    types: Optional[str] = None,
+    user: dict = Depends(get_current_user_cached)
+):
+    """Orders, sales, bookings, food orders and wallet transactions as one newest-first timeline.
+    Pass next_cursor back as ?cursor= for the next page; ?types= takes a comma-separated list."""
+    kinds = [kind.strip() for kind in types.split(",") if kind.strip()] if types else None
+    try:
+        return await activity_page(
+            db, user["id"], max(1, min(limit, 100)), cursor, kinds, HISTORY_INCLUDES_ARCHIVE
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ==================== NOTIFICATIONS ====================
+
+@api_router.get("/notifications")
+async def get_notifications(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), user: dict = Depends(get_current_user_cached)):
+    """In-app feed of coalesced notifications, newest first"""
+    notifications = await db.notifications.find(
+        {"user_id": user["id"]}, {"_id": 0}
+    ).sort("created_at", -1).skip(skip).limit(min(limit, 100)).to_list(None)
+    unread = await db.notifications.count_documents({"user_id": user["id"], "read": False})
+    return {"notifications": notifications, "unread": unread}
+
+@api_router.post("/notifications/read")
+async def mark_notifications_read(user: dict = Depends(get_current_user_cached)):
+    result = await db.notifications.update_many(
+        {"user_id": user["id"], "read": False}, {"$set": {"read": True}}
+    )
+    return {"marked_read": result.modified_count}
+
+@api_router.put("/notifications/settings")
+async def update_notification_settings(data: NotificationSettings, user: dict = Depends(get_current_user)):
+    """Register the device's push token and choose which channels to receive"""
+    fields = {}
+    if data.push_token is not None:
+        fields["push_token"] = data.push_token or None
+    if data.preferences is not None:
+        fields.update({f"notification_preferences.{channel}": enabled for channel, enabled in data.preferences.items()})
+    if fields:
+        await db.users.update_one({"id": user["id"]}, {"$set": fields})
+        caches["users"].invalidate(user["id"])
+    return {"message": "Notification settings updated"}
+
+@api_router.get("/admin/notifications/metrics", dependencies=[Depends(require_admin)])
+async def get_notification_metrics():
+    """Events coalesced into messages, pending recipients and per-channel delivery counts"""
+    return notification_dispatcher.snapshot()
+
 # ==================== REVIEWS ROUTES ====================
 
 @api_router.post("/reviews", response_model=Review)
-async def create_review(data: ReviewCreate, user: dict = Depends(get_current_user)):
+async def create_review(data: ReviewCreate, user: dict = Depends(get_current_user_cached)):
     if data.rating < 1 or data.rating > 5:
         raise HTTPException(status_code=400, detail="Rating must be 1-5")
     
@@ -1652,20 +3230,59 @@ async def create_review(data: ReviewCreate, user: dict = Depends(get_current_use
             {"id": data.target_id},
             {"$set": {"rating": round(avg_rating, 1), "total_reviews": len(reviews)}}
         )
+        caches[data.target_type + "s"].invalidate(data.target_id)
     
     return review
 
 @api_router.get("/reviews/{target_id}")
 async def get_reviews(target_id: str):
-    reviews = await db.reviews.find(
+    reviews = await database.for_route("get_reviews").reviews.find(
         {"target_id": target_id}
     ).sort("created_at", -1).to_list(100)
     return reviews
 
+# ==================== DASHBOARD ====================
+
+@api_router.get("/dashboard")
+async def get_dashboard(user: dict = Depends(get_current_user_cached)):
+    """Home screen counts, computed concurrently with count_documents instead of loading lists"""
+    user_id = user["id"]
+    (
+        products, services, restaurants, orders, pending_sales, active_bookings, active_food_orders
+    ) = await asyncio.gather(
+        database.for_route("get_products").products.count_documents({"is_available": True}),
+        database.for_route("get_services").services.count_documents({"is_available": True}),
+        database.for_route("get_restaurants").restaurants.count_documents({"is_open": True}),
+        db.orders.count_documents({"buyer_id": user_id}),
+        db.orders.count_documents({"seller_id": user_id, "status": "pending"}),
+        db.service_bookings.count_documents({
+            "$or": [{"client_id": user_id}, {"provider_id": user_id}],
+            "status": {"$in": ["pending", "confirmed", "in_progress"]},
+        }),
+        db.food_orders.count_documents({
+            "customer_id": user_id,
+            "status": {"$nin": ["delivered", "cancelled"]},
+        }),
+    )
+    return {
+        "counts": {
+            "products": products,
+            "services": services,
+            "restaurants": restaurants,
+            "orders": orders,
+            "pending_sales": pending_sales,
+            "active_bookings": active_bookings,
+            "active_food_orders": active_food_orders,
+        }
+    }
+
 # ==================== CATEGORIES ====================
 
 @api_router.get("/categories")
-async def get_categories():
+async def get_categories(request: Request):
+    return await categories_payload.respond(request)
+
+async def build_categories():
     return {
         "product_categories": [
             {"id": "electronics", "name": "Electronics", "icon": "laptop"},
@@ -1697,7 +3314,10 @@ async def get_categories():
 # ==================== HEALTH CHECK ====================
 
 @api_router.get("/")
-async def root():
+async def root(request: Request):
+    return await root_payload.respond(request)
+
+async def build_root():
     return {
         "message": "CommuteShare API v1.0",
         "status": "healthy",
@@ -1712,9 +3332,67 @@ async def health():
         "solana_network": SOLANA_NETWORK
     }
 
+@api_router.get("/ready")
+async def ready():
+    """Readiness: startup finished and MongoDB reachable. Liveness stays on /health."""
+    db_ok = database is not None and await database.ping()
+    is_ready = startup_state["ready"] and db_ok
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "status": "ready" if is_ready else "starting",
+            "database": "ok" if db_ok else "unavailable",
+            "database_circuit": database_breaker.state,
+            "startup_ms": startup_state["startup_ms"],
+        }
+    )
+
+# ==================== STATIC PAYLOADS ====================
+
+categories_payload = StaticPayload(build_categories, max_age=3600)
+token_info_payload = StaticPayload(build_token_info, max_age=300)
+rates_payload = StaticPayload(get_exchange_rates, max_age=RATES_CACHE_TTL_SECONDS)
+root_payload = StaticPayload(build_root, max_age=3600)
+
+# ==================== STARTUP ====================
+
+async def prime_caches():
+    """Fill the rate cache and static payloads so the first tab mounts are served from memory."""
+    _rates_cache["rates"] = None
+    await get_exchange_rates()
+    for payload in (categories_payload, token_info_payload, rates_payload, root_payload):
+        await payload.refresh()
+
 # Include the router
 app.include_router(api_router)
 
+app.add_middleware(
+    IdempotencyMiddleware,
+    get_store=lambda: idempotency_store,
+    paths=IDEMPOTENT_PATHS,
+    identify=user_id_from_headers,
+)
+
+app.add_middleware(
+    RateLimitMiddleware,
+    policies=RATE_LIMIT_POLICIES,
+    default_policy=DEFAULT_RATE_LIMIT_POLICY,
+    get_backend=lambda: rate_limit_backend,
+    admission=admission_controller,
+    identify=user_id_from_headers,
+    trust_forwarded_for=TRUST_FORWARDED_FOR,
+)
+
+# Outside idempotency and rate limiting, so their database calls share the request's deadline
+# and the breaker sees their failures too
+app.add_middleware(
+    DeadlineMiddleware,
+    deadlines=ROUTE_DEADLINES,
+    default_deadline_ms=REQUEST_DEADLINE_MS,
+    breaker=database_breaker,
+    exempt_paths=('/api/health', '/api/ready'),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1722,7 +3400,3 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -0,0 +1,321 @@
+"""
+Async Solana JSON-RPC client on a pooled httpx.AsyncClient, and a background
+scheduler that syncs on-chain balances for many wallets per batched call.
+
+The client retries transport errors, 5xx and 429 with exponential backoff
+(honouring Retry-After), paces itself with a token bucket, and coalesces
+identical in-flight requests so concurrent callers share one round trip.
+Pass `transport=` (e.g. httpx.MockTransport) or point the URL at
+scripts/solana_rpc_standin.py to run it without a real cluster.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from pymongo import UpdateOne
+
+from ratelimit import MemoryBucketBackend, RateLimit, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+LAMPORTS_PER_SOL = 1_000_000_000
+# getMultipleAccounts accepts at most 100 keys per call
+MAX_ACCOUNTS_PER_CALL = 100
+
+_BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+_BASE58_INDEX = {char: index for index, char in enumerate(_BASE58_ALPHABET)}
+
+
+def base58_decode(value: str) -> bytes:
+    number = 0
+    for char in value:
+        number = number * 58 + _BASE58_INDEX[char]
+    leading_zeros = len(value) - len(value.lstrip('1'))
+    body = number.to_bytes((number.bit_length() + 7) // 8, 'big') if number else b''
+    return b'\x00' * leading_zeros + body
+
+
+def base58_encode(data: bytes) -> str:
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = _BASE58_ALPHABET[remainder] + encoded
+    return '1' * (len(data) - len(data.lstrip(b'\0'))) + encoded
+
+
+def is_valid_pubkey(address: Optional[str]) -> bool:
+    """A base58 string decoding to 32 bytes (the placeholder "CS..." wallets are not)."""
+    if not address or not 32 <= len(address) <= 44:
+        return False
+    try:
+        return len(base58_decode(address)) == 32
+    except KeyError:
+        return False
+
+
+class SolanaRpcError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class SolanaRpcClient:
+    def __init__(self, url: str, max_connections: int = 20, timeout: float = 10.0,
+                 max_retries: int = 4, backoff_base: float = 0.25, max_backoff: float = 8.0,
+                 max_retry_after: float = 30.0, requests_per_second: Optional[float] = None,
+                 max_batch_size: int = 50, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.max_batch_size = max_batch_size
+        self._http = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._ids = itertools.count(1)
+        self._pacer = MemoryBucketBackend(max_keys=1)
+        self._pace = RateLimit(max(1, int(requests_per_second)), 1) if requests_per_second else None
+        self._paused_until = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {'http_requests': 0, 'rpc_calls': 0, 'retries': 0, 'coalesced': 0, 'rate_limited': 0}
+
+    async def close(self):
+        await self._http.aclose()
+
+    # ---- transport ----
+
+    async def _wait_turn(self):
+        """Respect a server-imposed pause (429) and our own request budget."""
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            if self._pace is None:
+                return
+            wait = await self._pacer.take('rpc', self._pace)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _post(self, payload: Any) -> Any:
+        attempt = 0
+        while True:
+            await self._wait_turn()
+            try:
+                self.stats['http_requests'] += 1
+                response = await self._http.post(self.url, json=payload)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Solana RPC transport error, retrying: {e}")
+            else:
+                if response.status_code == 429:
+                    self.stats['rate_limited'] += 1
+                    retry_after = parse_retry_after(response.headers.get('retry-after'), self._backoff(attempt),
+                                                    self.max_retry_after)
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    if attempt >= self.max_retries:
+                        response.raise_for_status()
+                    attempt += 1
+                    self.stats['retries'] += 1
+                    continue
+                if response.status_code < 500 or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+            attempt += 1
+            self.stats['retries'] += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    # ---- JSON-RPC ----
+
+    async def call(self, method: str, params: Optional[list] = None) -> Any:
+        """Single call; identical concurrent calls share one request."""
+        key = json.dumps([method, params], sort_keys=True)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            self.stats['rpc_calls'] += 1
+            body = await self._post({'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params or []})
+            if 'error' in body:
+                raise SolanaRpcError(body['error'].get('code', 0), body['error'].get('message', ''))
+            future.set_result(body['result'])
+            return body['result']
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def batch(self, calls: Sequence[Tuple[str, list]]) -> List[Any]:
+        """
+        Send calls as JSON-RPC batches of up to max_batch_size. Returns results in
+        order; a failed call's slot holds its SolanaRpcError instead of raising.
+        """
+        results: List[Any] = [None] * len(calls)
+        chunks = [range(start, min(start + self.max_batch_size, len(calls)))
+                  for start in range(0, len(calls), self.max_batch_size)]
+
+        async def send(indexes):
+            ids = {next(self._ids): index for index in indexes}
+            self.stats['rpc_calls'] += len(ids)
+            body = await self._post([
+                {'jsonrpc': '2.0', 'id': request_id, 'method': calls[index][0], 'params': calls[index][1]}
+                for request_id, index in ids.items()
+            ])
+            if isinstance(body, dict):
+                # The whole batch was rejected (e.g. a node with batching disabled)
+                error = body.get('error', {})
+                raise SolanaRpcError(error.get('code', 0), error.get('message', 'Batch rejected'))
+            for item in body:
+                index = ids[item['id']]
+                if 'error' in item:
+                    results[index] = SolanaRpcError(item['error'].get('code', 0), item['error'].get('message', ''))
+                else:
+                    results[index] = item['result']
+
+        await asyncio.gather(*(send(chunk) for chunk in chunks))
+        return results
+
+    # ---- typed helpers ----
+
+    async def get_multiple_accounts(self, pubkeys: Sequence[str]) -> Dict[str, int]:
+        """Lamports per pubkey (0 for accounts that don't exist), 100 keys per call."""
+        chunks = [list(pubkeys[i:i + MAX_ACCOUNTS_PER_CALL]) for i in range(0, len(pubkeys), MAX_ACCOUNTS_PER_CALL)]
+        results = await self.batch([
+            ('getMultipleAccounts', [chunk, {'encoding': 'base64', 'dataSlice': {'offset': 0, 'length': 0}}])
+            for chunk in chunks
+        ])
+        lamports = {}
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                raise result
+            for pubkey, account in zip(chunk, result['value']):
+                lamports[pubkey] = account['lamports'] if account else 0
+        return lamports
+
+    async def get_token_balances(self, owners: Sequence[str], mint: str) -> Dict[str, Optional[float]]:
+        """
+        Summed UI amount of `mint` per owner via batched getTokenAccountsByOwner.
+        Owners whose call failed map to None so callers can keep the old value.
+        """
+        results = await self.batch([
+            ('getTokenAccountsByOwner', [owner, {'mint': mint}, {'encoding': 'jsonParsed'}])
+            for owner in owners
+        ])
+        balances = {}
+        for owner, result in zip(owners, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Token balance lookup failed for {owner}: {result}")
+                balances[owner] = None
+                continue
+            balances[owner] = sum(
+                float(account['account']['data']['parsed']['info']['tokenAmount']['uiAmountString'])
+                for account in result['value']
+            )
+        return balances
+
+    async def get_wallet_balances(self, owners: Sequence[str], mints: Dict[str, str]) -> Dict[str, Dict]:
+        """{owner: {"SOL": ..., "<symbol>": ...}} for every owner, in a handful of batched requests."""
+        symbols = [symbol for symbol, mint in mints.items() if mint]
+        lamports, *token_balances = await asyncio.gather(
+            self.get_multiple_accounts(owners),
+            *(self.get_token_balances(owners, mints[symbol]) for symbol in symbols),
+        )
+        balances = {}
+        for owner in owners:
+            entry = {'SOL': lamports.get(owner, 0) / LAMPORTS_PER_SOL}
+            for symbol, per_owner in zip(symbols, token_balances):
+                entry[symbol] = per_owner.get(owner)
+            balances[owner] = entry
+        return balances
+
+
+class BalanceSyncScheduler:
+    """
+    Periodically refreshes `onchain_balances` on users with a valid Solana wallet,
+    stalest first, `batch_size` wallets per round. These are the wallets' chain
+    balances and sit next to the platform ledger balances; they never overwrite them.
+    """
+
+    def __init__(self, users, rpc: SolanaRpcClient, mints: Dict[str, str],
+                 interval_seconds: float = 60.0, batch_size: int = 100):
+        self.users = users
+        self.rpc = rpc
+        self.mints = mints
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"On-chain balance sync failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def sync_round(self) -> int:
+        users = await self.users.find(
+            {'solana_wallet': {'$ne': None}},
+            {'_id': 0, 'id': 1, 'solana_wallet': 1},
+        ).sort('onchain_balances.synced_at', 1).limit(self.batch_size).to_list(self.batch_size)
+        return await self.sync_users(users)
+
+    async def sync_users(self, users: List[Dict]) -> int:
+        wallets = {user['solana_wallet']: user['id'] for user in users if is_valid_pubkey(user.get('solana_wallet'))}
+        skipped = [user['id'] for user in users if user.get('solana_wallet') not in wallets]
+        now = datetime.utcnow()
+        operations = []
+        if wallets:
+            balances = await self.rpc.get_wallet_balances(list(wallets), self.mints)
+            for wallet, user_id in wallets.items():
+                fields = {f'onchain_balances.{symbol}': amount
+                          for symbol, amount in balances[wallet].items() if amount is not None}
+                fields['onchain_balances.synced_at'] = now
+                operations.append(UpdateOne({'id': user_id}, {'$set': fields}))
+        if skipped:
+            # Placeholder wallets: stamp them so the stalest-first scan moves past them
+            operations.extend(
+                UpdateOne({'id': user_id}, {'$set': {'onchain_balances.synced_at': now}}) for user_id in skipped
+            )
+        if operations:
+            await self.users.bulk_write(operations, ordered=False)
+        return len(wallets)
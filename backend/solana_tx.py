@@ -0,0 +1,180 @@
+"""
+Minimal Solana legacy-transaction builder: System and SPL Token transfers,
+compute-budget instructions, Ed25519 signing (via `cryptography`) and exact
+wire-size accounting so callers can pack instructions up to the packet limit.
+"""
+import base64
+import json
+import struct
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from solana_rpc import base58_decode, base58_encode
+
+# Maximum serialized transaction size (IPv6 MTU minus headers)
+PACKET_DATA_SIZE = 1232
+SIGNATURE_SIZE = 64
+
+SYSTEM_PROGRAM_ID = '11111111111111111111111111111111'
+TOKEN_PROGRAM_ID = 'TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA'
+COMPUTE_BUDGET_PROGRAM_ID = 'ComputeBudget111111111111111111111111111111'
+
+# Compute units budgeted per instruction kind, used for SetComputeUnitLimit
+SOL_TRANSFER_UNITS = 450
+TOKEN_TRANSFER_UNITS = 6500
+COMPUTE_BUDGET_UNITS = 300
+
+
+class AccountMeta(NamedTuple):
+    pubkey: str
+    is_signer: bool
+    is_writable: bool
+
+
+class Instruction(NamedTuple):
+    program_id: str
+    accounts: Tuple[AccountMeta, ...]
+    data: bytes
+
+
+def compact_u16(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def sol_transfer(source: str, destination: str, lamports: int) -> Instruction:
+    return Instruction(
+        SYSTEM_PROGRAM_ID,
+        (AccountMeta(source, True, True), AccountMeta(destination, False, True)),
+        struct.pack('<IQ', 2, lamports),
+    )
+
+
+def token_transfer_checked(source_account: str, mint: str, destination_account: str, owner: str,
+                           amount: int, decimals: int) -> Instruction:
+    return Instruction(
+        TOKEN_PROGRAM_ID,
+        (
+            AccountMeta(source_account, False, True),
+            AccountMeta(mint, False, False),
+            AccountMeta(destination_account, False, True),
+            AccountMeta(owner, True, False),
+        ),
+        struct.pack('<BQB', 12, amount, decimals),
+    )
+
+
+def set_compute_unit_limit(units: int) -> Instruction:
+    return Instruction(COMPUTE_BUDGET_PROGRAM_ID, (), struct.pack('<BI', 2, units))
+
+
+def set_compute_unit_price(micro_lamports: int) -> Instruction:
+    return Instruction(COMPUTE_BUDGET_PROGRAM_ID, (), struct.pack('<BQ', 3, micro_lamports))
+
+
+def compile_message(fee_payer: str, instructions: Sequence[Instruction], recent_blockhash: str) -> Tuple[bytes, int]:
+    """Serialize a legacy message. Returns (message bytes, number of required signatures)."""
+    flags = {fee_payer: [True, True]}
+    order = [fee_payer]
+    for instruction in instructions:
+        for meta in instruction.accounts:
+            if meta.pubkey not in flags:
+                flags[meta.pubkey] = [False, False]
+                order.append(meta.pubkey)
+            flags[meta.pubkey][0] |= meta.is_signer
+            flags[meta.pubkey][1] |= meta.is_writable
+        if instruction.program_id not in flags:
+            flags[instruction.program_id] = [False, False]
+            order.append(instruction.program_id)
+
+    def rank(key):
+        is_signer, is_writable = flags[key]
+        return (0 if key == fee_payer else 1, not is_signer, not is_writable)
+
+    keys = sorted(order, key=rank)  # stable: keeps first-seen order within each class
+    signers = [k for k in keys if flags[k][0]]
+    readonly_signed = sum(1 for k in signers if not flags[k][1])
+    readonly_unsigned = sum(1 for k in keys if not flags[k][0] and not flags[k][1])
+    index = {key: i for i, key in enumerate(keys)}
+
+    out = bytearray([len(signers), readonly_signed, readonly_unsigned])
+    out += compact_u16(len(keys))
+    for key in keys:
+        out += base58_decode(key)
+    out += base58_decode(recent_blockhash)
+    out += compact_u16(len(instructions))
+    for instruction in instructions:
+        out.append(index[instruction.program_id])
+        out += compact_u16(len(instruction.accounts))
+        out += bytes(index[meta.pubkey] for meta in instruction.accounts)
+        out += compact_u16(len(instruction.data))
+        out += instruction.data
+    return bytes(out), len(signers)
+
+
+def transaction_size(fee_payer: str, instructions: Sequence[Instruction], recent_blockhash: str) -> int:
+    message, signer_count = compile_message(fee_payer, instructions, recent_blockhash)
+    return len(compact_u16(signer_count)) + SIGNATURE_SIZE * signer_count + len(message)
+
+
+class Keypair:
+    def __init__(self, seed: bytes):
+        self._key = Ed25519PrivateKey.from_private_bytes(seed)
+        self.public_key = base58_encode(self._key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw))
+
+    @classmethod
+    def from_secret(cls, secret: str) -> 'Keypair':
+        """Accepts solana-keygen's JSON byte array or a base58 64-byte secret key."""
+        secret = secret.strip()
+        raw = bytes(json.loads(secret)) if secret.startswith('[') else base58_decode(secret)
+        return cls(raw[:32])
+
+    def sign(self, message: bytes) -> bytes:
+        return self._key.sign(message)
+
+
+def sign_transaction(payer: Keypair, instructions: Sequence[Instruction], recent_blockhash: str) -> Tuple[str, str]:
+    """Single-signer transaction. Returns (signature in base58, wire bytes in base64)."""
+    message, signer_count = compile_message(payer.public_key, instructions, recent_blockhash)
+    if signer_count != 1:
+        raise ValueError('Only the fee payer may sign these transactions')
+    signature = payer.sign(message)
+    wire = compact_u16(1) + signature + message
+    if len(wire) > PACKET_DATA_SIZE:
+        raise ValueError(f'Transaction is {len(wire)} bytes; the limit is {PACKET_DATA_SIZE}')
+    return base58_encode(signature), base64.b64encode(wire).decode()
+
+
+def pack_instructions(fee_payer: str, groups: Sequence[Tuple[object, Instruction, int]], recent_blockhash: str,
+                      prefix: Optional[List[Instruction]] = None) -> List[List[Tuple[object, Instruction, int]]]:
+    """
+    Greedily pack (item, instruction, compute units) into as few transactions as
+    fit PACKET_DATA_SIZE, leaving room for the compute-budget prefix. Shared
+    accounts (payer, mint, source token account, programs) are counted once per
+    transaction, which is where batching saves space.
+    """
+    prefix = prefix or []
+    packed: List[List[Tuple[object, Instruction, int]]] = []
+    current: List[Tuple[object, Instruction, int]] = []
+    for entry in groups:
+        candidate = current + [entry]
+        size = transaction_size(fee_payer, prefix + [e[1] for e in candidate], recent_blockhash)
+        if size <= PACKET_DATA_SIZE:
+            current = candidate
+            continue
+        if not current:
+            raise ValueError('A single transfer does not fit in a transaction')
+        packed.append(current)
+        current = [entry]
+    if current:
+        packed.append(current)
+    return packed
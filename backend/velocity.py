@@ -0,0 +1,297 @@
+"""
+Sliding-window velocity checks for money-moving operations (swap, withdraw,
+checkout), keyed by user, device and IP.
+
+Each (rule, key) owns a ring of time buckets holding a count and an amount,
+plus running totals, so recording and checking are O(1) amortised: advancing
+the clock clears only the buckets that fell out of the window. Rules compare the totals *including* the current attempt against
+their limits and choose an outcome: flag (allow, record for review), hold
+(park the operation for review) or block (reject). check() records every
+attempt it doesn't block straight away, so a burst of concurrent attempts
+sees each other's counts; an attempt that fails afterwards (insufficient
+funds, sold out, rejected hold) is taken back out with rollback().
+
+State is per worker, like the in-memory rate limiter; VelocityStore can
+snapshot it to MongoDB so restarts don't reset every window.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pymongo import ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+ALLOW = 'allow'
+FLAG = 'flag'
+HOLD = 'hold'
+BLOCK = 'block'
+SEVERITY = {ALLOW: 0, FLAG: 1, HOLD: 2, BLOCK: 3}
+
+DIMENSIONS = ('user', 'device', 'ip')
+
+
+class VelocityRule:
+    """
+    Limits `max_count` operations and/or `max_amount` (in the engine's reference
+    currency) per `window_seconds` for one dimension, over the named operations.
+    """
+
+    def __init__(self, name: str, operations: Sequence[str], dimension: str, window_seconds: int,
+                 outcome: str, max_count: Optional[int] = None, max_amount: Optional[float] = None):
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {dimension}")
+        if outcome not in (FLAG, HOLD, BLOCK):
+            raise ValueError(f"Unknown outcome: {outcome}")
+        if max_count is None and max_amount is None:
+            raise ValueError(f"Rule {name} needs max_count or max_amount")
+        self.name = name
+        self.operations = tuple(operations)
+        self.dimension = dimension
+        self.window_seconds = window_seconds
+        self.outcome = outcome
+        self.max_count = max_count
+        self.max_amount = max_amount
+
+
+class VelocityDecision:
+    def __init__(self, outcome: str, rules: List[str], retry_after: float = 0.0, operation: Optional[str] = None,
+                 amount: float = 0.0, keys: Optional[Dict[str, Optional[str]]] = None):
+        self.outcome = outcome
+        self.rules = rules
+        self.retry_after = retry_after
+        # What check() added to the windows, for rollback()
+        self.operation = operation
+        self.amount = amount
+        self.keys = keys or {}
+        self.recorded_at: Optional[float] = None
+
+
+class SlidingWindow:
+    """`buckets` slots of window_seconds / buckets each, with running totals."""
+
+    __slots__ = ('width', 'size', 'last_index', 'counts', 'amounts', 'total_count', 'total_amount')
+
+    def __init__(self, window_seconds: float, buckets: int):
+        self.width = window_seconds / buckets
+        self.size = buckets
+        self.last_index = 0
+        self.counts = [0] * buckets
+        self.amounts = [0.0] * buckets
+        self.total_count = 0
+        self.total_amount = 0.0
+
+    def advance(self, now: float):
+        index = int(now // self.width)
+        elapsed = index - self.last_index
+        if elapsed <= 0:
+            return
+        if elapsed >= self.size:
+            self.counts = [0] * self.size
+            self.amounts = [0.0] * self.size
+            self.total_count = 0
+            self.total_amount = 0.0
+        else:
+            for expired in range(self.last_index + 1, index + 1):
+                slot = expired % self.size
+                self.total_count -= self.counts[slot]
+                self.total_amount -= self.amounts[slot]
+                self.counts[slot] = 0
+                self.amounts[slot] = 0.0
+        self.last_index = index
+
+    def add(self, now: float, amount: float):
+        self.advance(now)
+        slot = self.last_index % self.size
+        self.counts[slot] += 1
+        self.amounts[slot] += amount
+        self.total_count += 1
+        self.total_amount += amount
+
+    def remove(self, at: float, amount: float):
+        """Take back an add() made at `at`, unless its bucket has already left the window."""
+        index = int(at // self.width)
+        if index <= self.last_index - self.size or index > self.last_index:
+            return
+        slot = index % self.size
+        if self.counts[slot] <= 0:
+            return
+        self.counts[slot] -= 1
+        self.amounts[slot] -= amount
+        self.total_count -= 1
+        self.total_amount -= amount
+
+    def expires_at(self) -> float:
+        """When the newest bucket leaves the window, i.e. when this window is empty again."""
+        return (self.last_index + self.size + 1) * self.width
+
+    def dump(self) -> Dict:
+        return {'width': self.width, 'last_index': self.last_index, 'counts': self.counts, 'amounts': self.amounts}
+
+    def load(self, state: Dict):
+        self.last_index = state['last_index']
+        self.counts = list(state['counts'])
+        self.amounts = list(state['amounts'])
+        self.total_count = sum(self.counts)
+        self.total_amount = sum(self.amounts)
+
+
+class VelocityEngine:
+    def __init__(self, rules: List[VelocityRule], buckets_per_window: int = 30, max_keys: int = 200000):
+        self.rules = rules
+        self.buckets_per_window = buckets_per_window
+        self.max_keys = max_keys
+        self._rules_by_operation: Dict[str, List[VelocityRule]] = {}
+        for rule in rules:
+            for operation in rule.operations:
+                self._rules_by_operation.setdefault(operation, []).append(rule)
+        self._rules_by_dimension: Dict[str, List[VelocityRule]] = {
+            dimension: [rule for rule in rules if rule.dimension == dimension] for dimension in DIMENSIONS
+        }
+        # "dimension:key" -> {rule name: SlidingWindow}, bounded LRU
+        self._windows: "OrderedDict[str, Dict[str, SlidingWindow]]" = OrderedDict()
+        # Keys recorded into since the last snapshot
+        self._dirty = set()
+        self.stats = {ALLOW: 0, FLAG: 0, HOLD: 0, BLOCK: 0}
+
+    def _windows_for(self, dimension: str, key: str) -> Dict[str, SlidingWindow]:
+        name = f"{dimension}:{key}"
+        windows = self._windows.get(name)
+        if windows is None:
+            windows = self._windows[name] = {
+                rule.name: SlidingWindow(rule.window_seconds, self.buckets_per_window)
+                for rule in self._rules_by_dimension[dimension]
+            }
+            while len(self._windows) > self.max_keys:
+                evicted, _ = self._windows.popitem(last=False)
+                self._dirty.discard(evicted)
+        else:
+            self._windows.move_to_end(name)
+        return windows
+
+    def check(self, operation: str, amount: float = 0.0, user: Optional[str] = None,
+              device: Optional[str] = None, ip: Optional[str] = None, now: Optional[float] = None) -> VelocityDecision:
+        """Evaluate the rules for this attempt and, unless blocked, count it; rollback() it if it then fails."""
+        now = time.time() if now is None else now
+        keys = {'user': user, 'device': device, 'ip': ip}
+        outcome = ALLOW
+        triggered = []
+        retry_after = 0.0
+        for rule in self._rules_by_operation.get(operation, ()):
+            key = keys[rule.dimension]
+            if not key:
+                continue
+            window = self._windows_for(rule.dimension, key)[rule.name]
+            window.advance(now)
+            over_count = rule.max_count is not None and window.total_count + 1 > rule.max_count
+            over_amount = rule.max_amount is not None and window.total_amount + amount > rule.max_amount
+            if over_count or over_amount:
+                triggered.append(rule.name)
+                if SEVERITY[rule.outcome] > SEVERITY[outcome]:
+                    outcome = rule.outcome
+                if rule.outcome == BLOCK:
+                    retry_after = max(retry_after, window.width)
+        self.stats[outcome] += 1
+        decision = VelocityDecision(outcome, triggered, retry_after, operation, amount, keys)
+        if outcome != BLOCK:
+            # Counted now, not after the operation's writes, so concurrent attempts can't all pass
+            self._apply(decision, now, SlidingWindow.add)
+            decision.recorded_at = now
+        return decision
+
+    def rollback(self, decision: VelocityDecision):
+        """Take a counted attempt back out of its windows, e.g. when the operation failed."""
+        if decision.recorded_at is None:
+            return
+        self._apply(decision, decision.recorded_at, SlidingWindow.remove)
+        decision.recorded_at = None
+
+    def _apply(self, decision: VelocityDecision, at: float, change):
+        for rule in self._rules_by_operation.get(decision.operation, ()):
+            key = decision.keys.get(rule.dimension)
+            if key:
+                change(self._windows_for(rule.dimension, key)[rule.name], at, decision.amount)
+        self._dirty.update(f"{dimension}:{key}" for dimension, key in decision.keys.items() if key)
+
+    # ---- persistence ----
+
+    def snapshot(self, now: Optional[float] = None) -> List[Tuple[str, Dict, float]]:
+        """(key, {rule: state}, expires_at) for keys recorded into since the last snapshot."""
+        now = time.time() if now is None else now
+        dirty, self._dirty = self._dirty, set()
+        entries = []
+        for name in dirty:
+            windows = self._windows.get(name)
+            if not windows:
+                continue
+            expires_at = max(window.expires_at() for window in windows.values())
+            if expires_at > now:
+                entries.append((name, {rule: window.dump() for rule, window in windows.items()}, expires_at))
+        return entries
+
+    def restore(self, name: str, state: Dict[str, Dict]):
+        dimension, _, key = name.partition(':')
+        if dimension not in DIMENSIONS:
+            return
+        windows = self._windows_for(dimension, key)
+        for rule_name, window in windows.items():
+            saved = state.get(rule_name)
+            # Rules may have changed since the snapshot; only matching window shapes are restored
+            if saved and len(saved['counts']) == window.size and saved.get('width', window.width) == window.width:
+                window.load(saved)
+
+
+class VelocityStore:
+    """Periodically snapshots engine state to `collection` (TTL on expires_at) and restores it at startup."""
+
+    def __init__(self, collection, engine: VelocityEngine, interval_seconds: float = 30.0):
+        self.collection = collection
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self) -> int:
+        restored = 0
+        async for doc in self.collection.find({'expires_at': {'$gt': datetime.utcnow()}}):
+            self.engine.restore(doc['_id'], doc['windows'])
+            restored += 1
+        return restored
+
+    async def save(self):
+        operations = [
+            ReplaceOne({'_id': name}, {'windows': windows, 'expires_at': datetime.utcfromtimestamp(expires_at)},
+                       upsert=True)
+            for name, windows, expires_at in self.engine.snapshot()
+        ]
+        for start in range(0, len(operations), 1000):
+            await self.collection.bulk_write(operations[start:start + 1000], ordered=False)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.save()
+        except Exception as e:
+            logger.warning(f"Velocity state save on shutdown failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.save()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Velocity state save failed: {e}")
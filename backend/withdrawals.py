@@ -0,0 +1,663 @@
+"""
+Crypto withdrawal queue: funds are reserved atomically when a withdrawal is
+requested, and a background scheduler packs queued withdrawals into as few
+Solana transactions as the packet size allows, submits them in batched
+JSON-RPC calls, tracks confirmation and refunds what didn't land.
+
+Lifecycle of a crypto_withdrawals document:
+    queued -> claimed -> signed -> submitted -> completed
+                             \\-> queued (blockhash expired unseen, retried up to max_attempts)
+                             \\-> failed (executed with an error, rejected, or out of attempts)
+    held -> queued | failed   (parked by a velocity rule until an operator decides)
+Every worker runs a queue, so a round first claims its rows (queued -> claimed
+under a round id) and only signs what it claimed; a claim left by a crashed
+worker goes back to queued after claim_lease_seconds. A signed transaction is
+persisted before it is sent, so a crash mid-send re-sends the same signature
+rather than paying twice. Failed withdrawals are refunded with one $inc per
+user, exactly once: rows are claimed (refunded: "pending") before any balance
+moves, inside a transaction where the deployment supports it. Without one, a
+crash mid-refund leaves rows "pending" for an operator rather than refunding
+them twice.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import OperationFailure
+
+from solana_rpc import LAMPORTS_PER_SOL, SolanaRpcClient, SolanaRpcError
+from solana_tx import (
+    COMPUTE_BUDGET_UNITS, SOL_TRANSFER_UNITS, TOKEN_TRANSFER_UNITS, Keypair,
+    pack_instructions, set_compute_unit_limit, set_compute_unit_price, sign_transaction,
+    sol_transfer, token_transfer_checked,
+)
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+CLAIMED = 'claimed'
+SIGNED = 'signed'
+SUBMITTED = 'submitted'
+COMPLETED = 'completed'
+FAILED = 'failed'
+HELD = 'held'
+IN_FLIGHT = (SIGNED, SUBMITTED)
+# Confirmation statuses that satisfy each commitment level
+CONFIRMATION_LEVELS = {
+    'processed': ('processed', 'confirmed', 'finalized'),
+    'confirmed': ('confirmed', 'finalized'),
+    'finalized': ('finalized',),
+}
+
+BALANCE_FIELDS = {
+    'SOL': 'sol_balance',
+    'USDT': 'usdt_balance',
+    'COST': 'cost_balance',
+}
+# Smallest withdrawal per currency; a SOL transfer must leave a new account rent-exempt
+MIN_WITHDRAWAL = {
+    'SOL': 0.001,
+    'USDT': 0.01,
+    'COST': 0.01,
+}
+# getSignatureStatuses accepts at most 256 signatures per call
+MAX_SIGNATURES_PER_CALL = 256
+REFUND_BATCH_SIZE = 500
+# Mongo error code for transactions on a standalone server
+ILLEGAL_OPERATION = 20
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+async def enqueue_withdrawal(db, user_id: str, currency: str, amount: float, destination: str,
+                             session=None, held: bool = False) -> Dict:
+    """
+    Reserve `amount` with a guarded $inc (no read-modify-write race) and queue the
+    withdrawal with its pending ledger entry; `held` parks it for review instead.
+    Raises InsufficientFunds.
+    """
+    field = BALANCE_FIELDS[currency]
+    user = await db.users.find_one_and_update(
+        {'id': user_id, field: {'$gte': amount}},
+        {'$inc': {field: -amount}},
+        projection={'_id': 0, field: 1},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if user is None:
+        raise InsufficientFunds(currency)
+    now = datetime.utcnow()
+    reference = f"WTH-{uuid.uuid4().hex[:8].upper()}"
+    transaction = {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'amount': amount,
+        'currency': currency,
+        'transaction_type': 'withdrawal',
+        'description': f"Withdrawal of {amount} {currency} to {destination}",
+        'status': 'pending',
+        'reference': reference,
+        'discount_applied': 0.0,
+        'original_amount': 0.0,
+        'created_at': now,
+        'updated_at': now,
+    }
+    withdrawal = {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'currency': currency,
+        'amount': amount,
+        'destination': destination,
+        'status': HELD if held else QUEUED,
+        'attempts': 0,
+        'reference': reference,
+        'transaction_id': transaction['id'],
+        'refunded': False,
+        'created_at': now,
+        'updated_at': now,
+    }
+    await db.transactions.insert_one(transaction, session=session)
+    await db.crypto_withdrawals.insert_one(withdrawal, session=session)
+    withdrawal.pop('_id', None)
+    return {**withdrawal, 'new_balance': user[field]}
+
+
+async def release_held(db, withdrawal_id: str) -> bool:
+    """Queue a held withdrawal for payout. False if it isn't held."""
+    now = datetime.utcnow()
+    result = await db.crypto_withdrawals.update_one(
+        {'id': withdrawal_id, 'status': HELD},
+        {'$set': {'status': QUEUED, 'released_at': now, 'updated_at': now}},
+    )
+    return result.modified_count == 1
+
+
+async def reject_held(db, withdrawal_id: str, reason: str) -> bool:
+    """Fail a held withdrawal; the queue's refund pass returns the reserved funds."""
+    now = datetime.utcnow()
+    result = await db.crypto_withdrawals.update_one(
+        {'id': withdrawal_id, 'status': HELD},
+        {'$set': {'status': FAILED, 'last_error': reason, 'failed_at': now, 'updated_at': now}},
+    )
+    return result.modified_count == 1
+
+
+class WithdrawalMetrics:
+    """Counters plus a window of queue-to-confirmation latencies and completion times."""
+
+    def __init__(self, window: int = 2000):
+        self.counts = {'rounds': 0, 'transactions_sent': 0, 'withdrawals_sent': 0, 'completed': 0,
+                       'failed': 0, 'requeued': 0, 'refunded': 0, 'send_errors': 0}
+        self._latencies = deque(maxlen=window)
+        self._completions = deque(maxlen=window)
+
+    def completed(self, created_at: datetime, now: datetime):
+        self.counts['completed'] += 1
+        self._latencies.append((now - created_at).total_seconds())
+        self._completions.append(time.monotonic())
+
+    def snapshot(self, throughput_window_seconds: float = 60.0) -> Dict:
+        latencies = sorted(self._latencies)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))], 3) if latencies else None
+
+        cutoff = time.monotonic() - throughput_window_seconds
+        recent = sum(1 for stamp in self._completions if stamp >= cutoff)
+        sent = self.counts['transactions_sent']
+        return {
+            **self.counts,
+            'withdrawals_per_transaction': round(self.counts['withdrawals_sent'] / sent, 2) if sent else None,
+            'latency_seconds': {'p50': pct(50), 'p95': pct(95), 'p99': pct(99)},
+            'completed_per_minute': round(recent * 60 / throughput_window_seconds, 2),
+        }
+
+
+class WithdrawalQueue:
+    def __init__(self, db, client, rpc: SolanaRpcClient, hot_wallet: Keypair, mints: Dict[str, str],
+                 interval_seconds: float = 5.0, max_per_round: int = 500, max_attempts: int = 3,
+                 priority_fee_percentile: float = 75, max_priority_fee: int = 1_000_000,
+                 commitment: str = 'finalized', claim_lease_seconds: float = 300.0):
+        self.db = db
+        self.client = client
+        self.rpc = rpc
+        self.hot_wallet = hot_wallet
+        self.mints = mints
+        self.interval_seconds = interval_seconds
+        self.max_per_round = max_per_round
+        self.max_attempts = max_attempts
+        self.priority_fee_percentile = priority_fee_percentile
+        self.max_priority_fee = max_priority_fee
+        self.commitment = commitment
+        self.claim_lease_seconds = claim_lease_seconds
+        self.withdrawals = db.crypto_withdrawals
+        self.metrics = WithdrawalMetrics()
+        self.use_transactions = True
+        self._decimals: Dict[str, int] = {}
+        self._source_accounts: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Withdrawal round failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self):
+        await self.refund_failed()
+        await self.track_confirmations()
+        await self.resend_signed()
+        await self.submit_queued()
+        await self.refund_failed()
+        self.metrics.counts['rounds'] += 1
+
+    async def stats(self) -> Dict:
+        depth = await self.withdrawals.aggregate([
+            {'$match': {'status': {'$in': [HELD, QUEUED, CLAIMED, SIGNED, SUBMITTED]}}},
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}}},
+        ]).to_list(None)
+        refunds_pending = await self.withdrawals.count_documents({'refunded': 'pending'})
+        return {**self.metrics.snapshot(), 'queue': {entry['_id']: entry['count'] for entry in depth},
+                'refunds_pending': refunds_pending}
+
+    # ---- packing and submission ----
+
+    async def submit_queued(self):
+        queued = await self._claim_queued()
+        if not queued:
+            return
+        round_id = queued[0]['round_id']
+        try:
+            await self._sign_and_send(queued, round_id)
+        finally:
+            # Rows this round didn't sign (lookups failed, or it raised) go back in the queue
+            await self.withdrawals.update_many(
+                {'round_id': round_id, 'status': CLAIMED},
+                {'$set': {'status': QUEUED, 'updated_at': datetime.utcnow()}, '$unset': {'round_id': '', 'claimed_at': ''}},
+            )
+
+    async def _claim_queued(self) -> List[Dict]:
+        """Claim up to max_per_round queued rows for this round; only these may be signed."""
+        now = datetime.utcnow()
+        stale = await self.withdrawals.update_many(
+            {'status': CLAIMED, 'claimed_at': {'$lt': now - timedelta(seconds=self.claim_lease_seconds)}},
+            {'$set': {'status': QUEUED, 'updated_at': now}, '$unset': {'round_id': '', 'claimed_at': ''}},
+        )
+        if stale.modified_count:
+            logger.warning(f"Requeued {stale.modified_count} withdrawals claimed by a round that never finished")
+        candidates = await self.withdrawals.find({'status': QUEUED}, {'_id': 0, 'id': 1}).sort('created_at', 1) \
+            .limit(self.max_per_round).to_list(self.max_per_round)
+        if not candidates:
+            return []
+        round_id = str(uuid.uuid4())
+        await self.withdrawals.update_many(
+            {'id': {'$in': [w['id'] for w in candidates]}, 'status': QUEUED},
+            {'$set': {'status': CLAIMED, 'round_id': round_id, 'claimed_at': now, 'updated_at': now}},
+        )
+        return await self.withdrawals.find({'round_id': round_id, 'status': CLAIMED}, {'_id': 0}) \
+            .sort('created_at', 1).to_list(None)
+
+    async def _sign_and_send(self, queued: List[Dict], round_id: str):
+        entries, rejected = await self._instructions_for(queued)
+        if rejected:
+            await self._fail(rejected)
+        if not entries:
+            return
+
+        blockhash_result, fee_result = await self.rpc.batch([
+            ('getLatestBlockhash', [{'commitment': 'confirmed'}]),
+            ('getRecentPrioritizationFees', [[self.hot_wallet.public_key]]),
+        ])
+        if isinstance(blockhash_result, SolanaRpcError):
+            raise blockhash_result
+        blockhash = blockhash_result['value']['blockhash']
+        last_valid_height = blockhash_result['value']['lastValidBlockHeight']
+        priority_fee = self._priority_fee(fee_result)
+
+        payer = self.hot_wallet.public_key
+        # Placeholder values; compute-budget instructions have a fixed size
+        prefix = [set_compute_unit_limit(0), set_compute_unit_price(0)]
+        batches = pack_instructions(payer, entries, blockhash, prefix=prefix)
+        signed = []
+        operations = []
+        for batch in batches:
+            units = sum(entry[2] for entry in batch) + 2 * COMPUTE_BUDGET_UNITS
+            instructions = [set_compute_unit_limit(units), set_compute_unit_price(priority_fee)]
+            instructions += [entry[1] for entry in batch]
+            signature, wire = sign_transaction(self.hot_wallet, instructions, blockhash)
+            ids = [entry[0]['id'] for entry in batch]
+            signed.append((signature, wire, ids))
+            now = datetime.utcnow()
+            operations.extend(UpdateOne({'id': withdrawal_id, 'status': CLAIMED, 'round_id': round_id}, {'$set': {
+                'status': SIGNED,
+                'signature': signature,
+                'wire_transaction': wire,
+                'last_valid_block_height': last_valid_height,
+                # Position of its transfer instruction, to pin an InstructionError on it
+                'instruction_index': len(prefix) + position,
+                'batch_size': len(ids),
+                'signed_at': now,
+                'updated_at': now,
+            }, '$inc': {'attempts': 1}}) for position, withdrawal_id in enumerate(ids))
+        # Persist before sending: a crash after this point re-sends, never re-signs
+        result = await self.withdrawals.bulk_write(operations, ordered=False)
+        if result.modified_count != len(operations):
+            # The claim lapsed and another round took some rows: send only transactions whose
+            # every row is still ours, and put the rest of a partial transaction back in the queue
+            persisted = await self.withdrawals.find(
+                {'round_id': round_id, 'status': SIGNED}, {'_id': 0, 'id': 1, 'signature': 1}
+            ).to_list(None)
+            ours = {(w['signature'], w['id']) for w in persisted}
+            complete = [entry for entry in signed if all((entry[0], i) in ours for i in entry[2])]
+            partial = [entry[0] for entry in signed if entry not in complete]
+            if partial:
+                logger.warning(f"Dropping {len(partial)} withdrawal transactions whose claim lapsed")
+                await self.withdrawals.update_many(
+                    {'signature': {'$in': partial}, 'round_id': round_id, 'status': SIGNED},
+                    {'$set': {'status': QUEUED, 'updated_at': datetime.utcnow()},
+                     '$unset': {'signature': '', 'wire_transaction': '', 'last_valid_block_height': '',
+                                'instruction_index': '', 'round_id': '', 'claimed_at': ''},
+                     '$inc': {'attempts': -1}},
+                )
+            signed = complete
+        await self._send(signed)
+
+    async def resend_signed(self):
+        """Transactions signed but not acknowledged (crash or transport error mid-send)."""
+        pending = await self.withdrawals.find(
+            {'status': SIGNED}, {'_id': 0, 'id': 1, 'signature': 1, 'wire_transaction': 1}
+        ).to_list(None)
+        by_signature: Dict[str, Tuple[str, List[str]]] = {}
+        for withdrawal in pending:
+            entry = by_signature.setdefault(withdrawal['signature'], (withdrawal['wire_transaction'], []))
+            entry[1].append(withdrawal['id'])
+        if by_signature:
+            await self._send([(signature, wire, ids) for signature, (wire, ids) in by_signature.items()])
+
+    async def _send(self, signed: List[Tuple[str, str, List[str]]]):
+        results = await self.rpc.batch([
+            ('sendTransaction', [wire, {'encoding': 'base64', 'preflightCommitment': 'confirmed'}])
+            for _, wire, _ in signed
+        ])
+        now = datetime.utcnow()
+        operations = []
+        for (signature, _, ids), result in zip(signed, results):
+            if isinstance(result, SolanaRpcError):
+                # An error here is ambiguous (a retried POST may already have landed it), so the
+                # transaction stays signed; only blockhash expiry puts it back in the queue
+                self.metrics.counts['send_errors'] += 1
+                logger.warning(f"Withdrawal transaction {signature} not accepted: {result}")
+                await self.withdrawals.update_many(
+                    {'signature': signature, 'status': SIGNED}, {'$set': {'last_error': result.message}}
+                )
+                continue
+            self.metrics.counts['transactions_sent'] += 1
+            self.metrics.counts['withdrawals_sent'] += len(ids)
+            operations.append(UpdateMany(
+                {'signature': signature, 'status': SIGNED},
+                {'$set': {'status': SUBMITTED, 'submitted_at': now, 'updated_at': now}},
+            ))
+        if operations:
+            await self.withdrawals.bulk_write(operations, ordered=False)
+
+    def _priority_fee(self, result) -> int:
+        """Micro-lamports per compute unit at the configured percentile of recent fees."""
+        if isinstance(result, SolanaRpcError) or not result:
+            return 0
+        fees = sorted(entry['prioritizationFee'] for entry in result)
+        fee = fees[min(len(fees) - 1, int(self.priority_fee_percentile / 100 * len(fees)))]
+        return min(fee, self.max_priority_fee)
+
+    async def _instructions_for(self, queued: List[Dict]):
+        """(withdrawal, instruction, compute units) per payable withdrawal, plus rejected ones."""
+        payer = self.hot_wallet.public_key
+        token_rows = [w for w in queued if w['currency'] != 'SOL']
+        mints = {w['currency']: self.mints.get(w['currency']) for w in token_rows}
+        await self._load_mint_info([mint for mint in mints.values() if mint])
+
+        destinations: Dict[Tuple[str, str], Optional[str]] = {}
+        lookups = sorted({(w['destination'], mints[w['currency']]) for w in token_rows if mints[w['currency']]})
+        if lookups:
+            results = await self.rpc.batch([
+                ('getTokenAccountsByOwner', [owner, {'mint': mint}, {'encoding': 'jsonParsed'}])
+                for owner, mint in lookups
+            ])
+            for lookup, result in zip(lookups, results):
+                if isinstance(result, SolanaRpcError):
+                    destinations[lookup] = None
+                    continue
+                destinations[lookup] = result['value'][0]['pubkey'] if result['value'] else ''
+
+        # A payout to a watched deposit address would be credited back as a deposit; the API
+        # rejects those, and this catches addresses that started being watched since
+        watched = {doc['address'] for doc in await self.db.deposit_addresses.find(
+            {'address': {'$in': list({w['destination'] for w in queued})}}, {'_id': 0, 'address': 1}
+        ).to_list(None)}
+
+        entries = []
+        rejected = []
+        for withdrawal in queued:
+            currency = withdrawal['currency']
+            if withdrawal['destination'] in watched:
+                rejected.append((withdrawal, 'Destination is a CommuteShare deposit address'))
+                continue
+            if currency == 'SOL':
+                lamports = int(round(withdrawal['amount'] * LAMPORTS_PER_SOL))
+                entries.append((withdrawal, sol_transfer(payer, withdrawal['destination'], lamports),
+                                SOL_TRANSFER_UNITS))
+                continue
+            mint = mints[currency]
+            if not mint:
+                rejected.append((withdrawal, f"{currency} is not withdrawable on-chain"))
+                continue
+            if mint not in self._decimals:
+                continue  # mint lookup failed; stays queued for the next round
+            if mint not in self._source_accounts:
+                rejected.append((withdrawal, f"Hot wallet holds no {currency}"))
+                continue
+            destination = destinations.get((withdrawal['destination'], mint))
+            if destination is None:
+                continue  # lookup failed; stays queued for the next round
+            if destination == '':
+                rejected.append((withdrawal, f"Destination has no {currency} token account"))
+                continue
+            decimals = self._decimals[mint]
+            amount = int(round(withdrawal['amount'] * 10 ** decimals))
+            entries.append((withdrawal, token_transfer_checked(
+                self._source_accounts[mint], mint, destination, payer, amount, decimals
+            ), TOKEN_TRANSFER_UNITS))
+        return entries, rejected
+
+    async def _load_mint_info(self, mints: List[str]):
+        missing = [mint for mint in set(mints) if mint not in self._decimals]
+        if not missing:
+            return
+        results = await self.rpc.batch(
+            [('getTokenSupply', [mint]) for mint in missing]
+            + [('getTokenAccountsByOwner', [self.hot_wallet.public_key, {'mint': mint}, {'encoding': 'jsonParsed'}])
+               for mint in missing]
+        )
+        for mint, supply, accounts in zip(missing, results[:len(missing)], results[len(missing):]):
+            if isinstance(supply, SolanaRpcError) or isinstance(accounts, SolanaRpcError):
+                logger.warning(f"Mint info unavailable for {mint}: {supply if isinstance(supply, Exception) else accounts}")
+                continue
+            self._decimals[mint] = supply['value']['decimals']
+            if accounts['value']:
+                self._source_accounts[mint] = accounts['value'][0]['pubkey']
+
+    # ---- confirmation ----
+
+    async def track_confirmations(self):
+        in_flight = await self.withdrawals.find(
+            {'status': {'$in': list(IN_FLIGHT)}},
+            {'_id': 0, 'signature': 1, 'last_valid_block_height': 1, 'created_at': 1, 'transaction_id': 1},
+        ).to_list(None)
+        if not in_flight:
+            return
+        by_signature: Dict[str, List[Dict]] = {}
+        for withdrawal in in_flight:
+            by_signature.setdefault(withdrawal['signature'], []).append(withdrawal)
+        block_height, statuses = await self._signature_statuses(list(by_signature), search_history=False)
+
+        # Signatures unseen past their blockhash's last valid height can never land. The recent
+        # status cache is checked first; look those up in full history before rebuilding them.
+        expired = [signature for signature, status in statuses.items()
+                   if status is None and block_height > by_signature[signature][0]['last_valid_block_height']]
+        if expired:
+            _, history = await self._signature_statuses(expired, search_history=True)
+            # Only a history lookup that answered "not found" proves it never landed; when the
+            # lookup itself failed, leave the signature in flight until the next round
+            for signature in expired:
+                if signature not in history:
+                    statuses.pop(signature)
+            expired = [signature for signature in expired if signature in history]
+            statuses.update(history)
+
+        now = datetime.utcnow()
+        in_flight_query = {'status': {'$in': list(IN_FLIGHT)}}
+        completed = []
+        for signature, status in statuses.items():
+            withdrawals = by_signature[signature]
+            if status is None:
+                if signature in expired:
+                    await self._retry_or_fail({'signature': signature, **in_flight_query},
+                                              'Transaction expired before confirmation')
+                continue
+            if status.get('confirmationStatus') not in CONFIRMATION_LEVELS[self.commitment]:
+                continue  # an outcome below our commitment can still be rolled back
+            if status.get('err') is not None:
+                await self._handle_error(signature, status['err'], in_flight_query)
+                continue
+            completed.append(signature)
+            for withdrawal in withdrawals:
+                self.metrics.completed(withdrawal['created_at'], now)
+
+        if completed:
+            await self.withdrawals.update_many(
+                {'signature': {'$in': completed}, **in_flight_query},
+                {'$set': {'status': COMPLETED, 'confirmed_at': now, 'updated_at': now}, '$unset': {'wire_transaction': ''}},
+            )
+            await self.db.transactions.update_many(
+                {'id': {'$in': [w['transaction_id'] for signature in completed for w in by_signature[signature]]}},
+                {'$set': {'status': 'completed', 'updated_at': now}},
+            )
+
+    async def _signature_statuses(self, signatures: List[str], search_history: bool) -> Tuple[int, Dict]:
+        """Current block height and {signature: status or None}; signatures whose lookup failed are omitted."""
+        chunks = [signatures[i:i + MAX_SIGNATURES_PER_CALL] for i in range(0, len(signatures), MAX_SIGNATURES_PER_CALL)]
+        results = await self.rpc.batch(
+            [('getBlockHeight', [{'commitment': 'confirmed'}])]
+            + [('getSignatureStatuses', [chunk, {'searchTransactionHistory': search_history}]) for chunk in chunks]
+        )
+        block_height = results[0]
+        if isinstance(block_height, SolanaRpcError):
+            raise block_height
+        statuses = {}
+        for chunk, result in zip(chunks, results[1:]):
+            if isinstance(result, SolanaRpcError):
+                logger.warning(f"Signature status lookup failed: {result}")
+                continue
+            statuses.update(zip(chunk, result['value']))
+        return block_height, statuses
+
+    async def _handle_error(self, signature: str, err, in_flight_query: Dict):
+        """
+        A failed transaction moves no funds. When one transfer caused it (InstructionError),
+        fail just that withdrawal and requeue its batch-mates; otherwise fail the batch.
+        """
+        reason = f"Transaction failed: {err}"
+        instruction_error = err.get('InstructionError') if isinstance(err, dict) else None
+        if instruction_error:
+            now = datetime.utcnow()
+            culprit = await self.withdrawals.update_many(
+                {'signature': signature, 'instruction_index': instruction_error[0], **in_flight_query},
+                {'$set': {'status': FAILED, 'last_error': reason, 'failed_at': now, 'updated_at': now},
+                 '$unset': {'wire_transaction': ''}},
+            )
+            if culprit.modified_count:
+                self.metrics.counts['failed'] += culprit.modified_count
+                await self._retry_or_fail({'signature': signature, **in_flight_query},
+                                          f"Batch-mate failed: {err}")
+                return
+        await self._fail_where({'signature': signature, **in_flight_query}, reason)
+
+    async def _retry_or_fail(self, query: Dict, reason: str):
+        """Put withdrawals back in the queue, or fail them once they've used their attempts."""
+        requeued = await self.withdrawals.update_many(
+            {**query, 'attempts': {'$lt': self.max_attempts}},
+            {'$set': {'status': QUEUED, 'last_error': reason, 'updated_at': datetime.utcnow()},
+             '$unset': {'signature': '', 'wire_transaction': '', 'last_valid_block_height': '',
+                        'instruction_index': ''}},
+        )
+        self.metrics.counts['requeued'] += requeued.modified_count
+        await self._fail_where(query, reason)
+
+    async def _fail(self, rejected: List[Tuple[Dict, str]]):
+        for withdrawal, reason in rejected:
+            await self._fail_where({'id': withdrawal['id'], 'status': withdrawal['status']}, reason)
+
+    async def _fail_where(self, query: Dict, reason: str):
+        now = datetime.utcnow()
+        result = await self.withdrawals.update_many(query, {
+            '$set': {'status': FAILED, 'last_error': reason, 'failed_at': now, 'updated_at': now},
+            '$unset': {'wire_transaction': ''},
+        })
+        self.metrics.counts['failed'] += result.modified_count
+
+    # ---- refunds ----
+
+    async def refund_failed(self):
+        while True:
+            failed = await self.withdrawals.find({'status': FAILED, 'refunded': False}, {'_id': 0, 'id': 1}) \
+                .limit(REFUND_BATCH_SIZE).to_list(REFUND_BATCH_SIZE)
+            if not failed:
+                return
+            self.metrics.counts['refunded'] += await self._refund([withdrawal['id'] for withdrawal in failed])
+
+    async def _refund(self, withdrawal_ids: List[str]) -> int:
+        """Refund the given failed withdrawals that no other pass has claimed; returns how many."""
+        refund_round = str(uuid.uuid4())
+        now = datetime.utcnow()
+
+        async def apply(session=None) -> int:
+            # Claim first: once a row is "pending" no other pass can refund it, even if this one
+            # stops before marking it refunded
+            await self.withdrawals.update_many(
+                {'id': {'$in': withdrawal_ids}, 'status': FAILED, 'refunded': False},
+                {'$set': {'refunded': 'pending', 'refund_round': refund_round, 'updated_at': now}}, session=session
+            )
+            failed = await self.withdrawals.find(
+                {'refund_round': refund_round}, {'_id': 0}, session=session
+            ).to_list(None)
+            if not failed:
+                return 0
+            increments: Dict[str, Dict[str, float]] = {}
+            for withdrawal in failed:
+                field = BALANCE_FIELDS[withdrawal['currency']]
+                user_inc = increments.setdefault(withdrawal['user_id'], {})
+                user_inc[field] = user_inc.get(field, 0.0) + withdrawal['amount']
+            refunds = [{
+                'id': str(uuid.uuid4()),
+                'user_id': withdrawal['user_id'],
+                'amount': withdrawal['amount'],
+                'currency': withdrawal['currency'],
+                'transaction_type': 'refund',
+                'description': f"Refund of failed withdrawal: {withdrawal.get('last_error', 'unknown error')}",
+                'status': 'completed',
+                'reference': withdrawal['reference'],
+                'discount_applied': 0.0,
+                'original_amount': 0.0,
+                'created_at': now,
+                'updated_at': now,
+            } for withdrawal in failed]
+            await self.db.users.bulk_write(
+                [UpdateOne({'id': user_id}, {'$inc': inc}) for user_id, inc in increments.items()],
+                ordered=False, session=session
+            )
+            await self.db.transactions.update_many(
+                {'id': {'$in': [withdrawal['transaction_id'] for withdrawal in failed]}},
+                {'$set': {'status': 'failed', 'updated_at': now}}, session=session
+            )
+            await self.db.transactions.insert_many(refunds, ordered=False, session=session)
+            await self.withdrawals.update_many(
+                {'refund_round': refund_round, 'refunded': 'pending'},
+                {'$set': {'refunded': True, 'refunded_at': now, 'updated_at': now}}, session=session
+            )
+            return len(failed)
+
+        if self.use_transactions:
+            try:
+                async with await self.client.start_session() as session:
+                    async with session.start_transaction():
+                        return await apply(session)
+            except OperationFailure as e:
+                if e.code != ILLEGAL_OPERATION:
+                    raise
+                # Standalone mongod: no transactions, fall back to ordered writes
+                logger.warning("Transactions unavailable; refunding withdrawals without them")
+                self.use_transactions = False
+        return await apply()
@@ -96,15 +96,12 @@ export default function HomeScreen() {
 
   const loadStats = async () => {
     try {
-      const [products, orders, services] = await Promise.all([
-        api.get('/products?limit=1'),
-        api.get('/orders'),
-        api.get('/services?limit=1'),
-      ]);
+      const response = await api.get('/dashboard');
+      const { counts } = response.data;
       setStats({
-        products: products.data.length || 0,
-        orders: orders.data.length || 0,
-        services: services.data.length || 0,
+        products: counts.products || 0,
+        orders: counts.orders || 0,
+        services: counts.services || 0,
       });
     } catch (error) {
       console.log('Error loading stats:', error);
@@ -104,14 +104,10 @@ export default function WalletScreen() {
 
   const loadWalletData = async () => {
     try {
-      const [balanceRes, discountRes, transactionsRes] = await Promise.all([
-        api.get('/wallet/balance'),
-        api.get('/wallet/discount-info'),
-        api.get('/wallet/transactions'),
-      ]);
-      setWalletData(balanceRes.data);
-      setDiscountInfo(discountRes.data);
-      setTransactions(transactionsRes.data);
+      const response = await api.get('/wallet/overview');
+      setWalletData(response.data.balance);
+      setDiscountInfo(response.data.discount_info);
+      setTransactions(response.data.transactions);
     } catch (error) {
       console.log('Error loading wallet data:', error);
     } finally {
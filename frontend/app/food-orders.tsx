@@ -15,6 +15,7 @@ import { Card } from '../src/components/common/Card';
 import { EmptyState } from '../src/components/common/EmptyState';
 import { LoadingScreen } from '../src/components/common/LoadingScreen';
 import api from '../src/api/client';
+import { useStatusEvents } from '../src/api/events';
 
 interface FoodOrder {
   id: string;
@@ -50,6 +51,14 @@ export default function FoodOrdersScreen() {
     loadOrders();
   }, []);
 
+  useStatusEvents('food_order', (event) => {
+    if (event.type === 'food_order.created') {
+      loadOrders();
+    } else {
+      setOrders((prev) => prev.map((item) => (item.id === event.id ? { ...item, status: event.status } : item)));
+    }
+  });
+
   const getStatusColor = (status: string) => {
     switch (status) {
       case 'pending': return COLORS.warning;
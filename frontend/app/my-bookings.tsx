@@ -17,6 +17,7 @@ import { EmptyState } from '../src/components/common/EmptyState';
 import { LoadingScreen } from '../src/components/common/LoadingScreen';
 import { useAuthStore } from '../src/store/authStore';
 import api from '../src/api/client';
+import { useStatusEvents } from '../src/api/events';
 
 interface Booking {
   id: string;
@@ -58,6 +59,14 @@ export default function MyBookingsScreen() {
     loadBookings();
   }, []);
 
+  useStatusEvents('booking', (event) => {
+    if (event.type === 'booking.created') {
+      loadBookings();
+    } else {
+      setBookings((prev) => prev.map((item) => (item.id === event.id ? { ...item, status: event.status } : item)));
+    }
+  });
+
   const getStatusColor = (status: string) => {
     switch (status) {
       case 'pending': return COLORS.warning;
@@ -72,7 +81,7 @@ export default function MyBookingsScreen() {
   const updateStatus = async (bookingId: string, status: string) => {
     try {
       await api.put(`/bookings/${bookingId}/status?status=${status}`);
-      loadBookings();
+      setBookings((prev) => prev.map((item) => (item.id === bookingId ? { ...item, status } : item)));
       Alert.alert('Success', `Booking ${status}`);
     } catch (error: any) {
       Alert.alert('Error', error.response?.data?.detail || 'Failed to update');
@@ -16,6 +16,7 @@ import { Card } from '../src/components/common/Card';
 import { EmptyState } from '../src/components/common/EmptyState';
 import { LoadingScreen } from '../src/components/common/LoadingScreen';
 import api from '../src/api/client';
+import { useStatusEvents } from '../src/api/events';
 
 interface Sale {
   id: string;
@@ -49,6 +50,14 @@ export default function MySalesScreen() {
     loadSales();
   }, []);
 
+  useStatusEvents('order', (event) => {
+    if (event.type === 'order.created') {
+      loadSales();
+    } else {
+      setSales((prev) => prev.map((item) => (item.id === event.id ? { ...item, status: event.status } : item)));
+    }
+  });
+
   const getStatusColor = (status: string) => {
     switch (status) {
       case 'pending': return COLORS.warning;
@@ -63,7 +72,7 @@ export default function MySalesScreen() {
   const updateStatus = async (orderId: string, status: string) => {
     try {
       await api.put(`/orders/${orderId}/status?status=${status}`);
-      loadSales();
+      setSales((prev) => prev.map((item) => (item.id === orderId ? { ...item, status } : item)));
       Alert.alert('Success', `Order ${status}`);
     } catch (error: any) {
       Alert.alert('Error', error.response?.data?.detail || 'Failed to update');
@@ -16,6 +16,7 @@ import { Card } from '../src/components/common/Card';
 import { EmptyState } from '../src/components/common/EmptyState';
 import { LoadingScreen } from '../src/components/common/LoadingScreen';
 import api from '../src/api/client';
+import { useStatusEvents } from '../src/api/events';
 
 interface Order {
   id: string;
@@ -52,6 +53,14 @@ export default function OrdersScreen() {
     loadOrders();
   }, []);
 
+  useStatusEvents('order', (event) => {
+    if (event.type === 'order.created') {
+      loadOrders();
+    } else {
+      setOrders((prev) => prev.map((item) => (item.id === event.id ? { ...item, status: event.status } : item)));
+    }
+  });
+
   const getStatusColor = (status: string) => {
     switch (status) {
       case 'pending': return COLORS.warning;
@@ -93,7 +102,7 @@ export default function OrdersScreen() {
           onPress: async () => {
             try {
               await api.put(`/orders/${orderId}/status?status=delivered`);
-              loadOrders();
+              setOrders((prev) => prev.map((item) => (item.id === orderId ? { ...item, status: 'delivered' } : item)));
               Alert.alert('Success', 'Order confirmed as delivered');
             } catch (error: any) {
               Alert.alert('Error', error.response?.data?.detail || 'Failed to update');
@@ -4,7 +4,7 @@ import AsyncStorage from '@react-native-async-storage/async-storage';
 import * as SecureStore from 'expo-secure-store';
 import Constants from 'expo-constants';
 
-const BASE_URL = Constants.expoConfig?.extra?.EXPO_PUBLIC_BACKEND_URL || 
+export const BASE_URL = Constants.expoConfig?.extra?.EXPO_PUBLIC_BACKEND_URL || 
                  process.env.EXPO_PUBLIC_BACKEND_URL || 
                  'http://localhost:8001';
 
@@ -16,7 +16,7 @@ const api = axios.create({
 });
 
 // Platform-specific token retrieval
-const getToken = async (): Promise<string | null> => {
+export const getToken = async (): Promise<string | null> => {
   try {
     if (Platform.OS === 'web') {
       return await AsyncStorage.getItem('auth_token');
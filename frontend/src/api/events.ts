@@ -0,0 +1,65 @@
+import { useEffect, useRef } from 'react';
+import { BASE_URL, getToken } from './client';
+
+export type StatusEventKind = 'order' | 'booking' | 'food_order';
+
+export interface StatusEvent {
+  type: string; // e.g. order.created, order.status
+  kind: StatusEventKind;
+  id: string;
+  status: string;
+  at: string;
+}
+
+const MAX_RECONNECT_DELAY = 30000;
+
+// Subscribe to server-pushed status changes instead of reloading whole lists
+export const useStatusEvents = (
+  kind: StatusEventKind,
+  onEvent: (event: StatusEvent) => void
+) => {
+  const handlerRef = useRef(onEvent);
+  handlerRef.current = onEvent;
+
+  useEffect(() => {
+    let socket: WebSocket | null = null;
+    let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+    let reconnectDelay = 1000;
+    let closed = false;
+
+    const connect = async () => {
+      const token = await getToken();
+      if (!token || closed) return;
+
+      const wsUrl = `${BASE_URL.replace(/^http/, 'ws')}/api/ws/events?token=${encodeURIComponent(token)}`;
+      socket = new WebSocket(wsUrl);
+
+      socket.onopen = () => {
+        reconnectDelay = 1000;
+      };
+      socket.onmessage = (message) => {
+        try {
+          const event = JSON.parse(message.data);
+          if (event.kind === kind) {
+            handlerRef.current(event);
+          }
+        } catch (error) {
+          console.log('Error parsing status event:', error);
+        }
+      };
+      socket.onclose = () => {
+        if (closed) return;
+        reconnectTimer = setTimeout(connect, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY);
+      };
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      if (reconnectTimer) clearTimeout(reconnectTimer);
+      socket?.close();
+    };
+  }, [kind]);
+};
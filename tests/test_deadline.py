@@ -0,0 +1,163 @@
+"""
+Circuit breaker state transitions, and which database errors the deadline
+middleware counts against it.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from pymongo.errors import AutoReconnect, DuplicateKeyError, ExecutionTimeout
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import deadline  # noqa: E402
+from deadline import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DeadlineMiddleware  # noqa: E402
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(deadline, 'time', fake)
+    return fake
+
+
+def breaker(**overrides):
+    options = {'failure_ratio': 0.5, 'min_requests': 4, 'window_seconds': 10.0, 'cooldown_seconds': 5.0}
+    return CircuitBreaker(**{**options, **overrides})
+
+
+# ==================== BREAKER ====================
+
+def test_breaker_opens_once_enough_requests_fail(clock):
+    circuit = breaker()
+    for ok in (True, False, True):
+        circuit.record(ok)
+    assert circuit.state == CLOSED  # below min_requests
+
+    circuit.record(False)
+
+    assert circuit.state == OPEN
+    assert not circuit.allow()
+
+
+def test_breaker_stays_closed_below_the_failure_ratio(clock):
+    circuit = breaker()
+    for ok in (True, True, True, False, True, False, True):
+        circuit.record(ok)
+
+    assert circuit.state == CLOSED
+    assert circuit.allow()
+
+
+def test_breaker_forgets_outcomes_outside_the_window(clock):
+    circuit = breaker()
+    for _ in range(3):
+        circuit.record(False)
+    clock.now += 11
+
+    circuit.record(False)
+
+    assert circuit.state == CLOSED
+    assert circuit.stats()['window_requests'] == 1
+
+
+def test_open_breaker_lets_one_probe_through_after_the_cooldown(clock):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False)
+    clock.now += 4.9
+    assert not circuit.allow()
+
+    clock.now += 0.1
+
+    assert circuit.allow()
+    assert circuit.state == HALF_OPEN
+    assert not circuit.allow()  # only one probe at a time
+
+
+def test_successful_probe_closes_the_breaker(clock):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False)
+    clock.now += 5
+    assert circuit.allow()
+
+    circuit.record(True)
+
+    assert circuit.state == CLOSED
+    assert circuit.stats()['window_requests'] == 0
+    assert circuit.allow()
+
+
+def test_failed_probe_reopens_the_breaker(clock):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False)
+    clock.now += 5
+    assert circuit.allow()
+
+    circuit.record(False)
+
+    assert circuit.state == OPEN
+    assert circuit.opened_at == clock.now
+    assert not circuit.allow()
+    clock.now += 5
+    assert circuit.allow()
+
+
+# ==================== MIDDLEWARE ====================
+
+def _request(circuit, error):
+    async def endpoint(request):
+        if error is not None:
+            raise error
+        return JSONResponse({'ok': True})
+
+    # As in server.py: inside Starlette's error handling, outside the routes
+    app = Starlette(routes=[Route('/', endpoint)], middleware=[
+        Middleware(DeadlineMiddleware, deadlines=[], default_deadline_ms=1000, breaker=circuit),
+    ])
+
+    async def send():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get('/')
+
+    return asyncio.run(send())
+
+
+def test_connection_errors_and_timeouts_count_against_the_breaker(clock):
+    circuit = breaker(min_requests=2)
+
+    unavailable = _request(circuit, AutoReconnect('connection reset'))
+    timed_out = _request(circuit, ExecutionTimeout('operation exceeded time limit', 50))
+
+    assert unavailable.status_code == 503
+    assert unavailable.headers['retry-after'] == '5'
+    assert timed_out.status_code == 504
+    assert circuit.state == OPEN
+    assert _request(circuit, None).status_code == 503  # failing fast
+
+
+def test_other_database_errors_do_not_trip_the_breaker(clock):
+    circuit = breaker(min_requests=2)
+
+    responses = [_request(circuit, DuplicateKeyError('E11000 duplicate key')) for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [500, 500, 500]
+    assert circuit.state == CLOSED
+    assert circuit.stats()['window_failures'] == 0
@@ -0,0 +1,148 @@
+"""
+Deposit decoding from jsonParsed transactions (SOL balance deltas, SPL token
+deltas aggregated per owner and mint, failed transactions ignored), token
+account discovery and how far an address cursor may advance.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from deposits import advance_cursor, decode_deposits, token_accounts_of  # noqa: E402
+
+ALICE = 'A1iceWa11et11111111111111111111111111111111'
+BOB = 'BobWa11et111111111111111111111111111111111'
+STRANGER = 'Stranger11111111111111111111111111111111111'
+FAUCET = 'Faucet1111111111111111111111111111111111111'
+USDT_MINT = 'Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB'
+OTHER_MINT = 'Other1Mint111111111111111111111111111111111'
+ALICE_USDT = 'A1iceUsdtAccount111111111111111111111111111'
+ALICE_USDT_2 = 'A1iceUsdtAccount211111111111111111111111111'
+
+WALLETS = {ALICE: 'alice', BOB: 'bob'}
+MINTS = {'USDT': USDT_MINT, 'COST': None}
+
+
+def token_balance(index, owner, mint, amount):
+    return {'accountIndex': index, 'owner': owner, 'mint': mint,
+            'uiTokenAmount': {'uiAmountString': str(amount), 'decimals': 6}}
+
+
+def transaction(keys, pre=None, post=None, pre_tokens=None, post_tokens=None, err=None, parsed_keys=True):
+    return {
+        'slot': 1,
+        'meta': {
+            'err': err,
+            'preBalances': pre or [0] * len(keys),
+            'postBalances': post or [0] * len(keys),
+            'preTokenBalances': pre_tokens or [],
+            'postTokenBalances': post_tokens or [],
+        },
+        'transaction': {'message': {
+            'accountKeys': [{'pubkey': key, 'signer': False, 'writable': True} for key in keys] if parsed_keys else keys,
+        }},
+    }
+
+
+# ==================== DECODING ====================
+
+def test_sol_delta_to_a_watched_wallet_is_a_deposit():
+    tx = transaction([FAUCET, ALICE, STRANGER], pre=[10_000_000_000, 1_000_000_000, 0],
+                     post=[7_499_995_000, 3_500_000_000, 0])
+
+    assert decode_deposits(tx, WALLETS, MINTS) == [('alice', 'SOL', 2.5)]
+
+
+def test_outgoing_sol_and_unwatched_wallets_are_ignored():
+    tx = transaction([ALICE, STRANGER], pre=[3_000_000_000, 0], post=[1_999_995_000, 1_000_000_000])
+
+    assert decode_deposits(tx, WALLETS, MINTS) == []
+
+
+def test_plain_string_account_keys_are_decoded():
+    tx = transaction([FAUCET, BOB], pre=[10, 0], post=[5, 5], parsed_keys=False)
+
+    assert decode_deposits(tx, WALLETS, MINTS) == [('bob', 'SOL', 5 / 1_000_000_000)]
+
+
+def test_spl_deltas_are_summed_per_owner_and_mint():
+    # Alice receives into two token accounts; one of them also moves an unwatched mint
+    tx = transaction(
+        [FAUCET, ALICE_USDT, ALICE_USDT_2, ALICE],
+        pre_tokens=[token_balance(1, ALICE, USDT_MINT, 10), token_balance(2, ALICE, USDT_MINT, 0),
+                    token_balance(2, ALICE, OTHER_MINT, 0)],
+        post_tokens=[token_balance(1, ALICE, USDT_MINT, 12.5), token_balance(2, ALICE, USDT_MINT, 4),
+                     token_balance(2, ALICE, OTHER_MINT, 99)],
+    )
+
+    deposits = decode_deposits(tx, WALLETS, MINTS)
+
+    assert len(deposits) == 1
+    user_id, currency, amount = deposits[0]
+    assert (user_id, currency) == ('alice', 'USDT')
+    assert amount == pytest.approx(6.5)
+
+
+def test_new_token_account_counts_from_zero():
+    tx = transaction([FAUCET, ALICE_USDT, ALICE], post_tokens=[token_balance(1, ALICE, USDT_MINT, 3)])
+
+    assert decode_deposits(tx, WALLETS, MINTS) == [('alice', 'USDT', 3.0)]
+
+
+def test_token_transfer_between_a_users_own_accounts_is_not_a_deposit():
+    tx = transaction(
+        [ALICE_USDT, ALICE_USDT_2, ALICE],
+        pre_tokens=[token_balance(0, ALICE, USDT_MINT, 10), token_balance(1, ALICE, USDT_MINT, 0)],
+        post_tokens=[token_balance(0, ALICE, USDT_MINT, 4), token_balance(1, ALICE, USDT_MINT, 6)],
+    )
+
+    assert decode_deposits(tx, WALLETS, MINTS) == []
+
+
+def test_failed_transaction_is_ignored():
+    tx = transaction(
+        [FAUCET, ALICE, ALICE_USDT], pre=[10, 0, 0], post=[5, 5, 0],
+        post_tokens=[token_balance(2, ALICE, USDT_MINT, 3)],
+        err={'InstructionError': [0, {'Custom': 1}]},
+    )
+
+    assert decode_deposits(tx, WALLETS, MINTS) == []
+
+
+# ==================== TOKEN ACCOUNTS ====================
+
+def test_token_accounts_of_watched_owners_and_mints():
+    tx = transaction(
+        [FAUCET, ALICE_USDT, ALICE_USDT_2, ALICE],
+        post_tokens=[token_balance(1, ALICE, USDT_MINT, 1), token_balance(2, ALICE, OTHER_MINT, 1),
+                     token_balance(0, STRANGER, USDT_MINT, 1)],
+    )
+
+    assert token_accounts_of(tx, WALLETS, MINTS) == [(ALICE_USDT, ALICE)]
+
+
+def test_token_accounts_of_failed_or_tokenless_transaction():
+    assert token_accounts_of(transaction([FAUCET, ALICE], pre=[10, 0], post=[5, 5]), WALLETS, MINTS) == []
+    assert token_accounts_of({'transaction': {'message': {'accountKeys': []}}, 'meta': None}, WALLETS, MINTS) == []
+
+
+# ==================== CURSOR ====================
+
+SIGNATURES = [('sig-5', 105), ('sig-4', 104), ('sig-3', 103), ('sig-2', 102), ('sig-1', 101)]
+
+
+def test_cursor_moves_to_the_newest_signature_when_everything_was_read():
+    assert advance_cursor(SIGNATURES, set()) == ('sig-5', 105)
+
+
+def test_cursor_stops_below_the_oldest_unread_signature():
+    # sig-2 couldn't be fetched, so nothing newer than sig-1 may be skipped next round
+    assert advance_cursor(SIGNATURES, {'sig-4', 'sig-2'}) == ('sig-1', 101)
+    assert advance_cursor(SIGNATURES, {'sig-5'}) == ('sig-4', 104)
+
+
+def test_cursor_stays_put_when_the_oldest_signature_was_not_read():
+    assert advance_cursor(SIGNATURES, {'sig-1'}) is None
+    assert advance_cursor([], set()) is None
@@ -0,0 +1,110 @@
+"""
+Concurrent orders against a small stock: 1000 parallel POST /api/orders for a
+product with 10 units must sell exactly 10, leave the product sold out and
+debit only the buyers whose orders went through. Parallel orders from one
+buyer must not overdraw the wallet.
+
+Needs a MongoDB (MONGO_URL); runs against a throwaway database that is dropped
+afterwards.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+MONGO_URL = os.environ.get('MONGO_URL')
+pytestmark = pytest.mark.skipif(not MONGO_URL, reason="MONGO_URL is not set")
+
+ORDERS = 1000
+STOCK = 10
+# The checkout policy allows 30 orders a minute per user
+ORDERS_PER_BUYER = 10
+BALANCE = 1000.0
+PRICE = 25.0
+
+
+@pytest.fixture(scope='module')
+def server():
+    os.environ['DB_NAME'] = f"commuteshare_test_{uuid.uuid4().hex[:8]}"
+    os.environ['VELOCITY_ENABLED'] = 'false'
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+    import server as server_module
+    return server_module
+
+
+async def _place_orders(server, buyer_ids, count, balance, stock):
+    import httpx
+
+    async with server.lifespan(server.app):
+        db = server.db
+        try:
+            seller_id = str(uuid.uuid4())
+            await db.users.insert_many([
+                {"id": user_id, "email": f"{user_id}@example.com", "full_name": "Test User",
+                 "wallet_balance": balance, "cost_balance": 0.0}
+                for user_id in [seller_id] + buyer_ids
+            ])
+            product_id = str(uuid.uuid4())
+            await db.products.insert_one({
+                "id": product_id, "seller_id": seller_id, "seller_name": "Test User",
+                "title": "Limited item", "images": [], "price": PRICE,
+                "quantity": stock, "is_available": True,
+            })
+
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                async def order(buyer_id):
+                    response = await client.post(
+                        "/api/orders",
+                        json={"product_id": product_id, "quantity": 1},
+                        headers={"Authorization": f"Bearer {server.create_token(buyer_id)}"},
+                    )
+                    return buyer_id, response.status_code
+
+                results = await asyncio.gather(*(
+                    order(buyer_ids[i % len(buyer_ids)]) for i in range(count)
+                ))
+
+            product = await db.products.find_one({"id": product_id})
+            orders = await db.orders.find({"product_id": product_id}).to_list(length=None)
+            buyers = await db.users.find({"id": {"$in": buyer_ids}}).to_list(length=None)
+            return results, product, orders, buyers
+        finally:
+            await server.client.drop_database(server.database.settings.db_name)
+
+
+def test_parallel_orders_never_oversell(server):
+    buyer_ids = [str(uuid.uuid4()) for _ in range(ORDERS // ORDERS_PER_BUYER)]
+    results, product, orders, buyers = asyncio.run(_place_orders(server, buyer_ids, ORDERS, BALANCE, STOCK))
+
+    succeeded = [status for _, status in results if status == 200]
+    assert len(succeeded) == STOCK
+    assert all(status in (200, 400, 404) for _, status in results)
+
+    assert len(orders) == STOCK
+    assert product["quantity"] == 0
+    assert product["is_available"] is False
+
+    # Only buyers with an order were debited, and by exactly what they paid
+    paid = {}
+    for placed in orders:
+        paid[placed["buyer_id"]] = paid.get(placed["buyer_id"], 0.0) + placed["final_amount"]
+    for buyer in buyers:
+        assert buyer["wallet_balance"] == pytest.approx(BALANCE - paid.get(buyer["id"], 0.0))
+
+
+def test_parallel_orders_never_overdraw(server):
+    # Enough stock for every order, money for two of them (5% off 25.0 is 23.75)
+    results, product, orders, buyers = asyncio.run(
+        _place_orders(server, [str(uuid.uuid4())], ORDERS_PER_BUYER * 2, PRICE * 2.5, ORDERS_PER_BUYER * 2)
+    )
+
+    assert len(orders) == 2
+    assert len([status for _, status in results if status == 200]) == len(orders)
+    assert buyers[0]["wallet_balance"] >= 0
+    assert buyers[0]["wallet_balance"] == pytest.approx(PRICE * 2.5 - sum(o["final_amount"] for o in orders))
+    # Stock taken for a rejected order went back
+    assert product["quantity"] == ORDERS_PER_BUYER * 2 - len(orders)
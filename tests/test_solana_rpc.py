@@ -0,0 +1,256 @@
+"""
+SolanaRpcClient against httpx.MockTransport: JSON-RPC batching, coalescing of
+identical in-flight calls, retries and the 429 pause, and the balances
+BalanceSyncScheduler writes back.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from solana_rpc import (  # noqa: E402
+    LAMPORTS_PER_SOL, BalanceSyncScheduler, SolanaRpcClient, SolanaRpcError, base58_encode,
+)
+
+USDT_MINT = 'Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB'
+
+
+def pubkey() -> str:
+    return base58_encode(os.urandom(32))
+
+
+class Node:
+    """Records every HTTP request and answers each JSON-RPC call with `answer(method, params)`."""
+
+    def __init__(self, answer=None, delay: float = 0.0):
+        self.answer = answer or (lambda method, params: params)
+        self.delay = delay
+        self.requests = []
+        self.responses = []  # canned httpx.Responses served before any JSON-RPC answer
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((time.monotonic(), json.loads(request.content)))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.responses:
+            return self.responses.pop(0)
+        payload = json.loads(request.content)
+        if isinstance(payload, list):
+            return httpx.Response(200, json=[self._respond(call) for call in payload])
+        return httpx.Response(200, json=self._respond(payload))
+
+    def _respond(self, call):
+        try:
+            return {'jsonrpc': '2.0', 'id': call['id'], 'result': self.answer(call['method'], call['params'])}
+        except Exception as e:
+            return {'jsonrpc': '2.0', 'id': call['id'], 'error': {'code': -32602, 'message': str(e)}}
+
+
+def client(node: Node, **options) -> SolanaRpcClient:
+    return SolanaRpcClient('http://node/', transport=httpx.MockTransport(node.handle),
+                           **{'backoff_base': 0.001, **options})
+
+
+async def _using(rpc: SolanaRpcClient, coro):
+    try:
+        return await coro
+    finally:
+        await rpc.close()
+
+
+# ==================== BATCHING ====================
+
+def test_batch_splits_into_max_batch_size_requests_and_keeps_order():
+    node = Node()
+    rpc = client(node, max_batch_size=50)
+
+    results = asyncio.run(_using(rpc, rpc.batch([('echo', [i]) for i in range(120)])))
+
+    assert results == [[i] for i in range(120)]
+    assert sorted(len(payload) for _, payload in node.requests) == [20, 50, 50]
+    assert rpc.stats['rpc_calls'] == 120
+
+
+def test_batch_puts_a_failed_call_in_its_slot():
+    def answer(method, params):
+        if params == [1]:
+            raise ValueError('bad params')
+        return params[0]
+
+    rpc = client(Node(answer))
+
+    results = asyncio.run(_using(rpc, rpc.batch([('echo', [i]) for i in range(3)])))
+
+    assert results[0] == 0 and results[2] == 2
+    assert isinstance(results[1], SolanaRpcError)
+    assert results[1].code == -32602
+
+
+def test_batch_rejected_as_a_whole_raises():
+    node = Node()
+    node.responses.append(httpx.Response(200, json={'jsonrpc': '2.0', 'id': None,
+                                                    'error': {'code': -32600, 'message': 'batch disabled'}}))
+    rpc = client(node)
+
+    with pytest.raises(SolanaRpcError):
+        asyncio.run(_using(rpc, rpc.batch([('echo', [1])])))
+
+
+def test_get_multiple_accounts_asks_for_at_most_100_keys_per_call():
+    keys = [pubkey() for _ in range(250)]
+    node = Node(lambda method, params: {'value': [{'lamports': 7} for _ in params[0]]})
+    rpc = client(node)
+
+    lamports = asyncio.run(_using(rpc, rpc.get_multiple_accounts(keys)))
+
+    assert lamports == {key: 7 for key in keys}
+    assert len(node.requests) == 1
+    assert [len(call['params'][0]) for call in node.requests[0][1]] == [100, 100, 50]
+
+
+# ==================== COALESCING ====================
+
+def test_identical_concurrent_calls_share_one_request():
+    node = Node(delay=0.05)
+    rpc = client(node)
+
+    async def run():
+        return await asyncio.gather(
+            *(rpc.call('getSlot', []) for _ in range(10)),
+            rpc.call('getBalance', ['other']),
+        )
+
+    results = asyncio.run(_using(rpc, run()))
+
+    assert results == [[]] * 10 + [['other']]
+    assert len(node.requests) == 2
+    assert rpc.stats['coalesced'] == 9
+
+
+def test_coalesced_callers_all_see_the_error():
+    def answer(method, params):
+        raise ValueError('no such account')
+
+    rpc = client(Node(answer, delay=0.05))
+
+    async def run():
+        return await asyncio.gather(*(rpc.call('getBalance', ['x']) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(_using(rpc, run()))
+
+    assert all(isinstance(result, SolanaRpcError) for result in results)
+    assert rpc.stats['coalesced'] == 2
+
+
+# ==================== RETRIES ====================
+
+def test_server_errors_are_retried():
+    node = Node()
+    node.responses += [httpx.Response(503), httpx.Response(502)]
+    rpc = client(node)
+
+    assert asyncio.run(_using(rpc, rpc.call('echo', [1]))) == [1]
+    assert rpc.stats['retries'] == 2
+
+
+def test_server_errors_raise_once_retries_run_out():
+    node = Node()
+    node.responses += [httpx.Response(503)] * 3
+    rpc = client(node, max_retries=2)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_using(rpc, rpc.call('echo', [1])))
+    assert len(node.requests) == 3
+
+
+def test_429_pauses_every_caller_for_retry_after():
+    node = Node()
+    node.responses.append(httpx.Response(429, headers={'Retry-After': '0.2'}))
+    rpc = client(node)
+
+    async def run():
+        first = asyncio.create_task(rpc.call('echo', [1]))
+        await asyncio.sleep(0.05)  # the 429 has come back and the pause is on
+        second = await rpc.call('echo', [2])
+        return [await first, second]
+
+    started = time.monotonic()
+    assert asyncio.run(_using(rpc, run())) == [[1], [2]]
+
+    assert rpc.stats['rate_limited'] == 1
+    # Both the retry and the later caller waited out the pause
+    assert len(node.requests) == 3
+    assert min(at for at, _ in node.requests[1:]) - started >= 0.2
+
+
+@pytest.mark.parametrize('retry_after', [
+    '3600',
+    format_datetime(datetime.now(timezone.utc) + timedelta(hours=1), usegmt=True),
+    'soon',
+])
+def test_429_retry_after_is_parsed_defensively_and_capped(retry_after):
+    node = Node()
+    node.responses.append(httpx.Response(429, headers={'Retry-After': retry_after}))
+    rpc = client(node, max_retry_after=0.05)
+
+    started = time.monotonic()
+    assert asyncio.run(_using(rpc, rpc.call('echo', [1]))) == [1]
+    assert time.monotonic() - started < 1
+
+
+# ==================== BALANCE SYNC ====================
+
+class RecordingUsers:
+    def __init__(self):
+        self.operations = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+
+def test_balance_sync_writes_chain_balances_next_to_the_ledger():
+    alice, bob = pubkey(), pubkey()
+
+    def answer(method, params):
+        if method == 'getMultipleAccounts':
+            return {'value': [{'lamports': 2 * LAMPORTS_PER_SOL} if key == alice else None for key in params[0]]}
+        if method == 'getTokenAccountsByOwner':
+            if params[0] == bob:
+                raise ValueError('lookup failed')
+            return {'value': [
+                {'account': {'data': {'parsed': {'info': {'tokenAmount': {'uiAmountString': amount}}}}}}
+                for amount in ('1.5', '2.25')
+            ]}
+        raise ValueError(method)
+
+    node = Node(answer)
+    rpc = client(node)
+    users = RecordingUsers()
+    scheduler = BalanceSyncScheduler(users, rpc, {'USDT': USDT_MINT, 'COST': None})
+
+    synced = asyncio.run(_using(rpc, scheduler.sync_users([
+        {'id': 'alice', 'solana_wallet': alice},
+        {'id': 'bob', 'solana_wallet': bob},
+        {'id': 'placeholder', 'solana_wallet': 'CS1234567890'},
+    ])))
+
+    assert synced == 2
+    # One round trip for the SOL balances and one per mint
+    assert len(node.requests) == 2
+    updates = {op._filter['id']: op._doc['$set'] for op in users.operations}
+    assert updates['alice']['onchain_balances.SOL'] == 2.0
+    assert updates['alice']['onchain_balances.USDT'] == pytest.approx(3.75)
+    # A failed token lookup keeps the old value rather than writing zero
+    assert updates['bob']['onchain_balances.SOL'] == 0.0
+    assert 'onchain_balances.USDT' not in updates['bob']
+    assert set(updates['placeholder']) == {'onchain_balances.synced_at'}
+    assert 'wallet_balance' not in {key for fields in updates.values() for key in fields}
@@ -0,0 +1,325 @@
+"""
+Transaction building (packing, signing, wire format) and the withdrawal
+queue's failure paths: an InstructionError fails only its culprit, expiry
+requeues only once a history lookup has answered, and failed withdrawals are
+refunded exactly once.
+
+The queue tests run against a scripted JSON-RPC stand-in (httpx.MockTransport)
+and need a MongoDB (MONGO_URL); they use a throwaway database that is dropped
+afterwards.
+"""
+import asyncio
+import base64
+import json
+import os
+import struct
+import sys
+import uuid
+from pathlib import Path
+
+import httpx
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(BACKEND / 'scripts'))
+
+import solana_rpc_standin as standin  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey  # noqa: E402
+from solana_rpc import SolanaRpcClient, base58_decode, base58_encode  # noqa: E402
+from solana_tx import (  # noqa: E402
+    PACKET_DATA_SIZE, SOL_TRANSFER_UNITS, TOKEN_TRANSFER_UNITS, AccountMeta, Instruction, Keypair,
+    pack_instructions, set_compute_unit_limit, set_compute_unit_price, sign_transaction, sol_transfer,
+    token_transfer_checked, transaction_size,
+)
+
+MONGO_URL = os.environ.get('MONGO_URL')
+needs_mongo = pytest.mark.skipif(not MONGO_URL, reason="MONGO_URL is not set")
+
+PREFIX = [set_compute_unit_limit(0), set_compute_unit_price(0)]
+STARTING_BALANCE = 100.0
+BLOCK_HEIGHT = 1000
+
+
+def pubkey() -> str:
+    return base58_encode(os.urandom(32))
+
+
+def blockhash() -> str:
+    return base58_encode(os.urandom(32))
+
+
+# ==================== PACKING ====================
+
+def test_pack_instructions_fills_each_transaction_to_the_packet_limit():
+    payer = pubkey()
+    recent = blockhash()
+    entries = [(i, sol_transfer(payer, pubkey(), 1000 + i), SOL_TRANSFER_UNITS) for i in range(100)]
+
+    batches = pack_instructions(payer, entries, recent, prefix=PREFIX)
+
+    assert [entry for batch in batches for entry in batch] == entries
+    for batch, following in zip(batches, batches[1:]):
+        assert transaction_size(payer, PREFIX + [e[1] for e in batch], recent) <= PACKET_DATA_SIZE
+        # Greedy: the next transfer would not have fit
+        assert transaction_size(payer, PREFIX + [e[1] for e in batch + following[:1]], recent) > PACKET_DATA_SIZE
+    assert transaction_size(payer, PREFIX + [e[1] for e in batches[-1]], recent) <= PACKET_DATA_SIZE
+
+
+def test_pack_instructions_counts_shared_accounts_once():
+    payer = Keypair(os.urandom(32))
+    mint, source = pubkey(), pubkey()
+    recent = blockhash()
+    transfers = [token_transfer_checked(source, mint, pubkey(), payer.public_key, 1, 6) for _ in range(40)]
+
+    # Past the first transfer, each one adds only its destination key and its own instruction
+    first = transaction_size(payer.public_key, PREFIX + transfers[:1], recent)
+    second = transaction_size(payer.public_key, PREFIX + transfers[:2], recent)
+    instruction_size = 1 + 1 + len(transfers[1].accounts) + 1 + len(transfers[1].data)
+    assert second - first == 32 + instruction_size
+
+    batches = pack_instructions(payer.public_key, [(i, t, TOKEN_TRANSFER_UNITS) for i, t in enumerate(transfers)],
+                                recent, prefix=PREFIX)
+    assert len(batches) > 1
+    for batch in batches:
+        units = sum(entry[2] for entry in batch)
+        sign_transaction(payer, [set_compute_unit_limit(units), set_compute_unit_price(0)] + [e[1] for e in batch],
+                         recent)
+
+
+def test_pack_instructions_rejects_a_transfer_that_cannot_fit():
+    payer = pubkey()
+    oversized = Instruction(pubkey(), (AccountMeta(payer, True, True),), bytes(PACKET_DATA_SIZE))
+
+    with pytest.raises(ValueError):
+        pack_instructions(payer, [('big', oversized, 0)], blockhash(), prefix=PREFIX)
+
+
+# ==================== SIGNING ====================
+
+def test_sign_transaction_wire_format():
+    payer = Keypair(os.urandom(32))
+    destination = pubkey()
+    recent = blockhash()
+    instructions = [set_compute_unit_limit(1000), sol_transfer(payer.public_key, destination, 5000)]
+
+    signature, wire_b64 = sign_transaction(payer, instructions, recent)
+    wire = base64.b64decode(wire_b64)
+
+    assert wire[0] == 1  # compact-u16 signature count
+    assert base58_decode(signature) == wire[1:65]
+    message = wire[65:]
+    Ed25519PublicKey.from_public_bytes(base58_decode(payer.public_key)).verify(wire[1:65], message)
+    # Header: one signer, no read-only signers, two read-only programs
+    assert list(message[:3]) == [1, 0, 2]
+    assert message[3] == 4
+    keys = [base58_encode(message[4 + 32 * i:36 + 32 * i]) for i in range(4)]
+    assert keys[:2] == [payer.public_key, destination]
+    assert base58_encode(message[4 + 32 * 4:4 + 32 * 5]) == recent
+    assert struct.pack('<IQ', 2, 5000) in message
+
+    # The stand-in node parses the same wire format back out
+    standin.STATE['blockhashes'][recent] = standin.block_height() + standin.BLOCKHASH_VALIDITY
+    assert standin.send_transaction(wire_b64) == signature
+
+
+def test_sign_transaction_rejects_other_signers_and_oversized_transactions():
+    payer = Keypair(os.urandom(32))
+    recent = blockhash()
+
+    with pytest.raises(ValueError):
+        sign_transaction(payer, [sol_transfer(pubkey(), pubkey(), 1)], recent)
+
+    transfers = [sol_transfer(payer.public_key, pubkey(), 1) for _ in range(40)]
+    with pytest.raises(ValueError):
+        sign_transaction(payer, transfers, recent)
+
+
+def test_base58_round_trip_keeps_leading_zeros():
+    raw = b'\0\0' + os.urandom(30)
+
+    encoded = base58_encode(raw)
+
+    assert encoded.startswith('11')
+    assert base58_decode(encoded) == raw
+
+
+# ==================== WITHDRAWAL QUEUE ====================
+
+class ScriptedRpc:
+    """JSON-RPC stand-in: one handler per method; a handler raising fails just that call."""
+
+    def __init__(self):
+        self.block_height = BLOCK_HEIGHT
+        self.sent = []
+        self.statuses = {}
+        self.history_fails = False
+        self.handlers = {
+            'getLatestBlockhash': lambda params: {
+                'context': {'slot': 1}, 'value': {'blockhash': blockhash(), 'lastValidBlockHeight': BLOCK_HEIGHT + 150},
+            },
+            'getRecentPrioritizationFees': lambda params: [],
+            'sendTransaction': self.send,
+            'getBlockHeight': lambda params: self.block_height,
+            'getSignatureStatuses': self.signature_statuses,
+        }
+
+    def send(self, params):
+        wire = base64.b64decode(params[0])
+        signature = base58_encode(wire[1:65])
+        self.sent.append(signature)
+        return signature
+
+    def signature_statuses(self, params):
+        signatures, options = params
+        if options.get('searchTransactionHistory') and self.history_fails:
+            raise RuntimeError('history lookup unavailable')
+        return {'context': {'slot': 1}, 'value': [self.statuses.get(signature) for signature in signatures]}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        responses = []
+        for call in json.loads(request.content):
+            try:
+                responses.append({'jsonrpc': '2.0', 'id': call['id'],
+                                  'result': self.handlers[call['method']](call['params'])})
+            except Exception as e:
+                responses.append({'jsonrpc': '2.0', 'id': call['id'], 'error': {'code': -32000, 'message': str(e)}})
+        return httpx.Response(200, json=responses)
+
+
+async def _with_queue(test):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from withdrawals import WithdrawalQueue
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"commuteshare_test_{uuid.uuid4().hex[:8]}"]
+    script = ScriptedRpc()
+    rpc = SolanaRpcClient('http://standin/', transport=httpx.MockTransport(script.handle), max_retries=0)
+    queue = WithdrawalQueue(db, client, rpc, Keypair(os.urandom(32)), {}, interval_seconds=0)
+    try:
+        await test(db, client, rpc, queue, script)
+    finally:
+        await rpc.close()
+        await client.drop_database(db.name)
+
+
+async def _enqueue(db, count: int, amount: float = 1.0):
+    from withdrawals import enqueue_withdrawal
+
+    user_id = str(uuid.uuid4())
+    await db.users.insert_one({'id': user_id, 'sol_balance': STARTING_BALANCE})
+    withdrawals = []
+    for _ in range(count):
+        withdrawals.append(await enqueue_withdrawal(db, user_id, 'SOL', amount, pubkey()))
+    return user_id, withdrawals
+
+
+def _finalized(err=None):
+    return {'slot': 1, 'confirmations': None, 'err': err, 'confirmationStatus': 'finalized'}
+
+
+@needs_mongo
+def test_instruction_error_fails_only_the_culprit_and_requeues_its_batch_mates():
+    from withdrawals import FAILED, QUEUED
+
+    async def test(db, client, rpc, queue, script):
+        user_id, withdrawals = await _enqueue(db, 3)
+        await queue.submit_queued()
+        assert len(script.sent) == 1
+        signature = script.sent[0]
+        by_id = {w['id']: w for w in await db.crypto_withdrawals.find({}, {'_id': 0}).to_list(None)}
+        culprit = next(w for w in by_id.values() if w['instruction_index'] == 3)
+
+        script.statuses[signature] = _finalized({'InstructionError': [3, {'Custom': 1}]})
+        await queue.track_confirmations()
+        await queue.refund_failed()
+
+        after = {w['id']: w for w in await db.crypto_withdrawals.find({}, {'_id': 0}).to_list(None)}
+        assert after[culprit['id']]['status'] == FAILED
+        assert after[culprit['id']]['refunded'] is True
+        for withdrawal_id, withdrawal in after.items():
+            if withdrawal_id != culprit['id']:
+                assert withdrawal['status'] == QUEUED
+                assert 'signature' not in withdrawal
+        user = await db.users.find_one({'id': user_id})
+        assert user['sol_balance'] == pytest.approx(STARTING_BALANCE - 2)
+
+    asyncio.run(_with_queue(test))
+
+
+@needs_mongo
+def test_transaction_error_without_a_culprit_fails_the_whole_batch():
+    from withdrawals import FAILED
+
+    async def test(db, client, rpc, queue, script):
+        await _enqueue(db, 3)
+        await queue.submit_queued()
+
+        script.statuses[script.sent[0]] = _finalized('InsufficientFundsForFee')
+        await queue.track_confirmations()
+
+        assert await db.crypto_withdrawals.count_documents({'status': FAILED}) == 3
+
+    asyncio.run(_with_queue(test))
+
+
+@needs_mongo
+def test_expired_transaction_is_requeued_only_after_the_history_lookup_answers():
+    from withdrawals import QUEUED, SUBMITTED
+
+    async def test(db, client, rpc, queue, script):
+        await _enqueue(db, 2)
+        await queue.submit_queued()
+        script.block_height = BLOCK_HEIGHT + 151  # past lastValidBlockHeight, never seen
+
+        script.history_fails = True
+        await queue.track_confirmations()
+        assert await db.crypto_withdrawals.count_documents({'status': SUBMITTED}) == 2
+
+        script.history_fails = False
+        await queue.track_confirmations()
+        requeued = await db.crypto_withdrawals.find({}, {'_id': 0}).to_list(None)
+        assert [w['status'] for w in requeued] == [QUEUED, QUEUED]
+        assert all('signature' not in w for w in requeued)
+
+    asyncio.run(_with_queue(test))
+
+
+@needs_mongo
+def test_expired_transaction_fails_once_out_of_attempts():
+    from withdrawals import FAILED
+
+    async def test(db, client, rpc, queue, script):
+        queue.max_attempts = 1
+        await _enqueue(db, 1)
+        await queue.submit_queued()
+        script.block_height = BLOCK_HEIGHT + 151
+
+        await queue.track_confirmations()
+
+        assert await db.crypto_withdrawals.count_documents({'status': FAILED}) == 1
+
+    asyncio.run(_with_queue(test))
+
+
+@needs_mongo
+def test_failed_withdrawals_are_refunded_exactly_once():
+    from withdrawals import FAILED, WithdrawalQueue
+
+    async def test(db, client, rpc, queue, script):
+        user_id, withdrawals = await _enqueue(db, 5, amount=10.0)
+        await db.crypto_withdrawals.update_many({}, {'$set': {'status': FAILED, 'last_error': 'test'}})
+        other = WithdrawalQueue(db, client, rpc, Keypair(os.urandom(32)), {}, interval_seconds=0)
+
+        # Two workers that both read the same failed rows: only one may refund them
+        ids = [withdrawal['id'] for withdrawal in withdrawals]
+        assert await queue._refund(ids) == 5
+        assert await other._refund(ids) == 0
+        await asyncio.gather(queue.refund_failed(), other.refund_failed())
+
+        user = await db.users.find_one({'id': user_id})
+        assert user['sol_balance'] == pytest.approx(STARTING_BALANCE)
+        assert await db.transactions.count_documents({'transaction_type': 'refund'}) == 5
+        assert await db.crypto_withdrawals.count_documents({'refunded': True}) == 5
+
+    asyncio.run(_with_queue(test))